@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Memory and latency benchmark for the scheduled-post store
+
+Usage: python -m benchmarks.bench_post_store [--posts 1000000]
+"""
+
+import argparse
+import time
+import tracemalloc
+
+from src.posts import PostStore
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=1_000_000)
+    args = parser.parse_args()
+
+    # Share one content string so the numbers reflect store overhead only
+    content = "x" * 100
+
+    tracemalloc.start()
+    started = time.perf_counter()
+    store = PostStore()
+    for _ in range(args.posts):
+        store.add(content)
+    elapsed = time.perf_counter() - started
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    print(f"posts:            {args.posts:,}")
+    print(f"insert time:      {elapsed:.2f}s ({args.posts / elapsed:,.0f} posts/s)")
+    print(f"store memory:     {current / 1024 / 1024:.1f} MiB ({current / args.posts:.0f} B/post)")
+    print(f"peak memory:      {peak / 1024 / 1024:.1f} MiB")
+
+    started = time.perf_counter()
+    for _ in range(100_000):
+        store.next_pending()
+        _ = store.pending_count
+    print(f"next_pending():   {(time.perf_counter() - started) * 10:.3f} us/call")
+
+    started = time.perf_counter()
+    for _ in range(min(args.posts, 100_000)):
+        store.mark_posted(store.next_pending())
+    print(f"post + advance:   {(time.perf_counter() - started) / min(args.posts, 100_000) * 1e6:.3f} us/call")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+"""
+Reply matcher cost per message as the number of templates grows
+
+Usage: python -m benchmarks.bench_replies [--messages 20000]
+"""
+
+import argparse
+import random
+import time
+
+from src.replies import ReplyMatcher, ReplyTemplate
+
+WORDS = [
+    "price", "shipping", "refund", "discount", "launch", "meeting", "support", "invoice",
+    "delivery", "order", "account", "password", "update", "release", "event", "ticket",
+]
+
+
+def build_matcher(templates: int, rng: random.Random) -> ReplyMatcher:
+    matcher = ReplyMatcher([ReplyTemplate("generic reply")])
+    for n in range(templates):
+        # Distinct two-word triggers so every template owns its own keywords
+        trigger = f"{rng.choice(WORDS)} {n}"
+        matcher.add(ReplyTemplate(f"reply {n}", (trigger, f"kw{n}")))
+    return matcher
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--messages", type=int, default=20_000)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    messages = [" ".join(rng.choice(WORDS + ["hello", "there", "kw7", "is", "the"]) for _ in range(12))
+                for _ in range(args.messages)]
+
+    for templates in (10, 100, 1_000, 10_000):
+        started = time.perf_counter()
+        matcher = build_matcher(templates, rng)
+        matcher.choose("warm up")  # first search builds the failure links
+        build = time.perf_counter() - started
+
+        started = time.perf_counter()
+        for text in messages:
+            matcher.choose(text)
+        elapsed = time.perf_counter() - started
+        print(f"{templates:>6} templates: {elapsed / args.messages * 1e6:6.2f} us/message "
+              f"(index built in {build * 1000:.1f} ms)")
+
+    started = time.perf_counter()
+    matcher.add(ReplyTemplate("one more", ("brand new trigger",)))
+    matcher.choose("warm up")
+    print(f"add one template to 10,000 and rebuild links: {(time.perf_counter() - started) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
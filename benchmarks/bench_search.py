@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+/find latency over a large post library: word index vs. a linear scan
+
+Usage: python -m benchmarks.bench_search [--posts 300000] [--queries 200]
+"""
+
+import argparse
+import random
+import time
+import tracemalloc
+
+from src.posts import PostStore
+from src.search import PostIndex, tokenize
+
+WORDS = [
+    "launch", "discount", "giveaway", "webinar", "release", "update", "community", "roadmap",
+    "feature", "tutorial", "meetup", "podcast", "newsletter", "sale", "partner", "survey",
+    "the", "and", "our", "new", "today", "join", "week", "free", "now", "you",
+]
+
+
+def build(posts: int, rng: random.Random) -> PostStore:
+    store = PostStore()
+    for n in range(posts):
+        # A rare word per thousand posts so selective and broad queries both occur
+        words = rng.choices(WORDS, k=rng.randint(8, 30)) + [f"topic{n % 1000}"]
+        store.add(" ".join(words))
+    return store
+
+
+def scan(store: PostStore, query: str, limit: int) -> list:
+    """What /find would cost without an index: every word of every post"""
+    words = tokenize(query)
+    matches = []
+    for post in store:
+        post_words = tokenize(post.content)
+        if all(any(w.startswith(word) for w in post_words) for word in words):
+            matches.append(post)
+    return matches[:limit]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--posts", type=int, default=300_000)
+    parser.add_argument("--queries", type=int, default=200)
+    args = parser.parse_args()
+
+    rng = random.Random(1)
+    store = build(args.posts, rng)
+    queries = [rng.choice([f"topic{rng.randrange(1000)}", f"topic{rng.randrange(100)} launch",
+                           "giveaway webinar", "disc", f"{rng.choice(WORDS)} {rng.choice(WORDS)}"])
+               for _ in range(args.queries)]
+
+    started = time.perf_counter()
+    store.search("warm up", 0, 10)  # the first search builds the index
+    build_time = time.perf_counter() - started
+
+    tracemalloc.start()
+    index = PostIndex.from_posts((post.id, post.content, post.posted) for post in store)
+    index_memory = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del index
+
+    timings = []
+    for query in queries:
+        started = time.perf_counter()
+        store.search(query, 0, 10)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    indexed = sum(timings) / len(timings)
+
+    started = time.perf_counter()
+    scanned_queries = queries[:max(1, len(queries) // 20)]
+    for query in scanned_queries:
+        scan(store, query, 10)
+    scanned = (time.perf_counter() - started) / len(scanned_queries)
+
+    started = time.perf_counter()
+    for n in range(10_000):
+        store.remove(store.add(f"fresh post {n} launch").id)
+    churn = (time.perf_counter() - started) / 10_000
+
+    print(f"posts:            {args.posts:,}")
+    print(f"index build:      {build_time:.2f}s, {index_memory / 1024 / 1024:.1f} MiB")
+    print(f"indexed /find:    {indexed * 1000:.2f} ms/query (p50 {timings[len(timings) // 2] * 1000:.2f} ms, "
+          f"max {timings[-1] * 1000:.1f} ms)")
+    print(f"linear scan:      {scanned * 1000:.1f} ms/query ({scanned / indexed:,.0f}x slower)")
+    print(f"add + remove:     {churn * 1e6:.1f} us/post with the index live")
+
+
+if __name__ == "__main__":
+    main()
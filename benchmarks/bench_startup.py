@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+"""
+Import-time and cold-start benchmark
+
+Usage: python -m benchmarks.bench_startup [--runs 5] [--sends 200]
+
+Measures, in fresh interpreters, how long ``import src.bot`` takes and which
+modules dominate it; then, against the fake Bot API server, how long the bot
+takes to construct and initialize, the first and warm send latency, and how
+many TCP connections the shared pool opened.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from .fake_bot_api import FakeBotAPI
+
+BOT_TOKEN = "100000:BENCHMARK"
+ADMIN_ID = 42
+
+
+def import_times(runs: int) -> list:
+    """Wall time of ``import src.bot`` in fresh interpreters"""
+    times = []
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import src.bot"], check=True)
+        times.append(time.perf_counter() - started)
+    return times
+
+
+def slowest_imports(limit: int) -> list:
+    """Top-level imports of src.bot ranked by cumulative import time"""
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import src.bot"],
+                            capture_output=True, text=True, check=True)
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        if cumulative.strip().isdigit() and name.startswith("   ") and not name.startswith("    "):
+            rows.append((int(cumulative), name.strip()))
+    return sorted(rows, reverse=True)[:limit]
+
+
+async def cold_start(args) -> dict:
+    api = FakeBotAPI(port=args.port)
+    await api.start()
+    results = {}
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ.update(
+            BOT_TOKEN=BOT_TOKEN,
+            USER_ID=str(ADMIN_ID),
+            BOT_API_URL=api.url,
+            DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+            METRICS_ENABLED="false",
+            SEND_GLOBAL_RATE="1000000",
+            SEND_CHAT_RATE="1000000",
+        )
+        from src.bot import TelegramAutoBot
+        from src.config import Config
+
+        started = time.perf_counter()
+        bot = TelegramAutoBot(BOT_TOKEN, ADMIN_ID, Config())
+        results["construct_ms"] = (time.perf_counter() - started) * 1000
+
+        started = time.perf_counter()
+        await bot.application.initialize()
+        await bot._post_init(bot.application)
+        results["initialize_ms"] = (time.perf_counter() - started) * 1000
+
+        try:
+            started = time.perf_counter()
+            await bot.dispatcher.send_message(ADMIN_ID, "first")
+            results["first_send_ms"] = (time.perf_counter() - started) * 1000
+
+            latencies = []
+            for n in range(args.sends):
+                started = time.perf_counter()
+                await bot.dispatcher.send_message(ADMIN_ID, f"warm {n}")
+                latencies.append(time.perf_counter() - started)
+            results["warm_send_ms"] = statistics.median(latencies) * 1000
+
+            # Concurrent sends show how far the pool grows under load
+            await asyncio.gather(*(bot.dispatcher.send_message(ADMIN_ID + n, "burst") for n in range(args.sends)))
+            results["connections"] = len(api.connections)
+        finally:
+            await bot._post_stop(bot.application)
+            await bot.application.shutdown()
+            await api.stop()
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--sends", type=int, default=200)
+    parser.add_argument("--port", type=int, default=18091)
+    args = parser.parse_args()
+
+    times = import_times(args.runs)
+    print(f"import src.bot:     median {statistics.median(times) * 1000:.0f} ms, "
+          f"min {min(times) * 1000:.0f} ms ({args.runs} fresh interpreters, incl. startup)")
+    for cumulative, name in slowest_imports(8):
+        print(f"    {cumulative / 1000:8.1f} ms  {name}")
+
+    results = asyncio.run(cold_start(args))
+    print(f"construct bot:      {results['construct_ms']:.1f} ms")
+    print(f"initialize:         {results['initialize_ms']:.1f} ms (getMe, database, state, scheduler)")
+    print(f"first send:         {results['first_send_ms']:.2f} ms")
+    print(f"warm send:          {results['warm_send_ms']:.2f} ms (median of {args.sends})")
+    print(f"TCP connections:    {results['connections']} (HTTP_POOL_SIZE {os.environ.get('HTTP_POOL_SIZE', 'default')})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,162 @@
+#!/usr/bin/env python3
+"""
+Per-bot overhead of multi-tenant hosting
+
+Usage: python -m benchmarks.bench_tenants [--tenants 50] [--cpu-seconds 5]
+
+Starts TenantRunner with ``--tenants`` polling bots against the fake Bot API
+server and reports memory and idle CPU per bot, next to a fresh interpreter
+running a single standalone bot, which is what each tenant used to cost as
+its own process. Halfway through, one tenant is removed and another added
+at runtime to show the others keep running.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+from .fake_bot_api import FakeBotAPI
+
+ADMIN_ID = 42
+
+STANDALONE = """
+import asyncio, os, resource, time
+from src.bot import TelegramAutoBot
+from src.config import Config
+
+async def main():
+    bot = TelegramAutoBot(os.environ["BOT_TOKEN"], int(os.environ["USER_ID"]), Config())
+    await bot.application.initialize()
+    await bot._post_init(bot.application)
+    await bot.application.updater.start_polling(poll_interval=0.0, timeout=1)
+    await bot.application.start()
+    cpu = time.process_time()
+    await asyncio.sleep(float(os.environ["CPU_SECONDS"]))
+    print(rss(), (time.process_time() - cpu) / float(os.environ["CPU_SECONDS"]))
+    await bot.application.updater.stop()
+    await bot.application.stop()
+    await bot._post_stop(bot.application)
+    await bot.application.shutdown()
+
+def rss():
+    with open("/proc/self/statm") as f:
+        return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+
+asyncio.run(main())
+"""
+
+
+def rss_mib() -> float:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def tenant(n: int) -> dict:
+    return {"BOT_TOKEN": f"{200000 + n}:TENANT", "USER_ID": ADMIN_ID}
+
+
+def environment(api: FakeBotAPI, data_dir: str) -> dict:
+    return dict(
+        os.environ,
+        BOT_API_URL=api.url,
+        DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        METRICS_ENABLED="false",
+        LOG_LEVEL="WARNING",
+        LOG_FILE="",
+        LOG_FORMAT="console",
+        CLUSTER_MODE="",
+    )
+
+
+async def standalone(api: FakeBotAPI, data_dir: str, args) -> tuple:
+    """RSS and idle CPU share of one bot in its own interpreter"""
+    env = environment(api, data_dir)
+    env.update(BOT_TOKEN="199999:STANDALONE", USER_ID=str(ADMIN_ID), CPU_SECONDS=str(args.cpu_seconds))
+    env.pop("TENANTS_FILE", None)
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, "-c", STANDALONE, env=env, stdout=subprocess.PIPE,
+    )
+    out, _ = await process.communicate()
+    rss, cpu = out.split()[-2:]
+    return float(rss), float(cpu)
+
+
+async def hosted(api: FakeBotAPI, data_dir: str, args) -> dict:
+    tenants_file = os.path.join(data_dir, "tenants.json")
+    with open(tenants_file, "w") as f:
+        json.dump([tenant(n) for n in range(args.tenants)], f)
+    os.environ.update(environment(api, data_dir), TENANTS_FILE=tenants_file, PORT=str(args.port + 1),
+                      WEBHOOK_LISTEN="127.0.0.1")
+    os.environ.pop("WEBHOOK_URL", None)
+
+    from src.config import Config
+    from src.tenants import TenantRunner
+    from src.utils.logger import setup_logger
+    setup_logger(Config())
+
+    results = {"rss_before_mib": rss_mib()}
+    stop = asyncio.Event()
+    runner = TenantRunner(Config())
+    task = asyncio.create_task(runner.run(stop))
+    started = time.perf_counter()
+    while len(runner.tenants) < args.tenants or any(not bot.application.running for bot in runner.tenants.values()):
+        await asyncio.sleep(0.05)
+    results["start_s"] = time.perf_counter() - started
+    results["rss_mib"] = rss_mib()
+
+    cpu = time.process_time()
+    await asyncio.sleep(args.cpu_seconds)
+    results["cpu_share"] = (time.process_time() - cpu) / args.cpu_seconds
+
+    # Runtime changes leave the other tenants alone
+    await runner.remove(200000)
+    await runner.add(tenant(args.tenants))
+    results["hosted_after_change"] = len(runner.tenants)
+    results["all_running"] = all(bot.application.running for bot in runner.tenants.values())
+
+    stop.set()
+    await task
+    return results
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(port=args.port)
+    await api.start()
+    try:
+        with tempfile.TemporaryDirectory() as data_dir:
+            single_rss, single_cpu = await standalone(api, data_dir, args)
+            results = await hosted(api, data_dir, args)
+    finally:
+        await api.stop()
+    results.update(single_rss_mib=single_rss, single_cpu_share=single_cpu)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--tenants", type=int, default=50)
+    parser.add_argument("--cpu-seconds", type=float, default=5.0)
+    parser.add_argument("--port", type=int, default=18101)
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    per_bot = (results["rss_mib"] - results["rss_before_mib"]) / args.tenants
+    print(f"standalone bot:     {results['single_rss_mib']:.1f} MiB RSS, "
+          f"{results['single_cpu_share'] * 100:.2f}% CPU idle (own interpreter)")
+    print(f"{args.tenants} tenants:         {results['rss_before_mib']:.1f} -> {results['rss_mib']:.1f} MiB RSS, "
+          f"started in {results['start_s']:.2f} s")
+    print(f"per tenant:         {per_bot:.2f} MiB RSS, {results['cpu_share'] * 100 / args.tenants:.3f}% CPU idle")
+    print(f"after remove/add:   {results['hosted_after_change']} hosted, all running: {results['all_running']}")
+
+
+if __name__ == "__main__":
+    main()
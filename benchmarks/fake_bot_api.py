@@ -0,0 +1,291 @@
+"""
+Local fake of the Telegram Bot API for offline load tests
+
+Serves /bot<token>/<method> like api.telegram.org. getUpdates long-polls a
+queue fed by ``push``; setWebhook switches to POSTing those updates to the
+webhook instead. Sends are recorded with timestamps and can be answered with
+429 RetryAfter, either at random or when a chat exceeds a per-chat rate.
+Uploaded media gets a fresh file_id; ``uploads`` counts files received.
+getChat resolves any @username to a stable channel id; the bot is an
+administrator everywhere unless ``member_status`` says otherwise, and
+``lookups`` counts the chat and member lookups made.
+"""
+
+import asyncio
+import itertools
+import json
+import random
+import time
+import zlib
+from collections import deque
+from typing import Any, Deque, Dict, List, Optional
+
+import aiohttp
+from aiohttp import web
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+MEDIA_METHODS = {"sendPhoto": "photo", "sendVideo": "video", "sendDocument": "document"}
+
+# Methods that only need an ``ok`` answer
+TRUE_METHODS = {
+    "deleteWebhook", "close", "logOut", "setMyCommands", "deleteMyCommands",
+    "answerCallbackQuery", "sendChatAction", "deleteMessage",
+}
+
+
+class FakeBotAPI:
+    """In-process Bot API server; point BOT_API_URL at ``url``"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8081, bot_id: int = 100000,
+                 retry_after_rate: float = 0.0, retry_after: int = 1,
+                 chat_rate_limit: Optional[float] = None, latency: float = 0.0):
+        self.host = host
+        self.port = port
+        self.bot_id = bot_id
+        self.retry_after_rate = retry_after_rate
+        self.retry_after = retry_after
+        self.chat_rate_limit = chat_rate_limit
+        self.latency = latency
+
+        self.sent: List[tuple] = []  # (monotonic time, method, chat_id)
+        self.retry_afters = 0
+        self.uploads = 0
+        self.uploaded_bytes = 0
+        self.lookups: Dict[str, int] = {}
+        self.member_status: Dict[Any, str] = {}  # chat id -> the bot's status there
+        self.connections = set()  # client (host, port) pairs, i.e. TCP connections opened
+        self.webhook_url = ""
+        self.webhook_secret = ""
+        self._pending: Deque[Dict[str, Any]] = deque()
+        self._files: Dict[str, bytes] = {}
+        self._arrived = asyncio.Event()
+        self._update_ids = itertools.count(1)
+        self._message_ids = itertools.count(1)
+        self._last_send: Dict[Any, float] = {}
+        self._pusher: Optional[asyncio.Task] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._runner: Optional[web.AppRunner] = None
+
+        self.app = web.Application(client_max_size=16 * 1024 * 1024)
+        self.app.router.add_post("/bot{token}/{method}", self._handle)
+        self.app.router.add_get("/bot{token}/{method}", self._handle)
+        self.app.router.add_get("/file/bot{token}/{file_id}", self._handle_file)
+
+    @property
+    def url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    async def start(self):
+        self._session = aiohttp.ClientSession()
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        await web.TCPSite(self._runner, self.host, self.port).start()
+
+    async def stop(self):
+        if self._pusher is not None:
+            self._pusher.cancel()
+            await asyncio.gather(self._pusher, return_exceptions=True)
+        if self._runner is not None:
+            await self._runner.cleanup()
+        if self._session is not None:
+            await self._session.close()
+
+    # --- Incoming updates ---------------------------------------------------
+
+    def push(self, updates: List[Dict[str, Any]]):
+        """Queue updates for the bot; ``update_id`` is assigned here"""
+        for update in updates:
+            update["update_id"] = next(self._update_ids)
+            self._pending.append(update)
+        self._arrived.set()
+
+    async def _get_updates(self, params: Dict[str, Any]) -> List[Dict[str, Any]]:
+        offset = int(params.get("offset") or 0)
+        limit = int(params.get("limit") or 100)
+        timeout = float(params.get("timeout") or 0)
+        # Acknowledged updates are dropped, like the real server does
+        while self._pending and self._pending[0]["update_id"] < offset:
+            self._pending.popleft()
+        if not self._pending and timeout:
+            self._arrived.clear()
+            try:
+                await asyncio.wait_for(self._arrived.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        return list(itertools.islice(self._pending, limit))
+
+    async def _push_loop(self):
+        headers = {SECRET_HEADER: self.webhook_secret} if self.webhook_secret else {}
+        while True:
+            if not self._pending:
+                self._arrived.clear()
+                await self._arrived.wait()
+            batch = [self._pending.popleft() for _ in range(min(100, len(self._pending)))]
+            for update in batch:
+                async with self._session.post(self.webhook_url, json=update, headers=headers) as response:
+                    if response.status != 200:
+                        raise RuntimeError(f"webhook answered HTTP {response.status}")
+
+    def add_file(self, data: bytes) -> str:
+        """Make ``data`` downloadable through getFile; returns its file_id"""
+        file_id = f"file{len(self._files) + 1}"
+        self._files[file_id] = data
+        return file_id
+
+    async def _handle_file(self, request: web.Request) -> web.Response:
+        data = self._files.get(request.match_info["file_id"])
+        if data is None:
+            return web.Response(status=404)
+        return web.Response(body=data)
+
+    # --- Sends ----------------------------------------------------------------
+
+    def _throttled(self, chat_id: Any) -> bool:
+        if random.random() < self.retry_after_rate:
+            return True
+        if self.chat_rate_limit is None:
+            return False
+        now = time.monotonic()
+        last = self._last_send.get(chat_id)
+        if last is not None and now - last < 1 / self.chat_rate_limit:
+            return True
+        self._last_send[chat_id] = now
+        return False
+
+    def _message(self, chat_id: Any, params: Dict[str, Any]) -> Dict[str, Any]:
+        if isinstance(chat_id, str) and not chat_id.lstrip("-").isdigit():
+            chat = {"id": -1000000000000 - hash(chat_id) % 10**9, "type": "channel", "title": chat_id}
+        else:
+            chat_id = int(chat_id)
+            chat = {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup"}
+            chat["first_name" if chat_id > 0 else "title"] = "Bench"
+        return {
+            "message_id": next(self._message_ids),
+            "date": int(time.time()),
+            "chat": chat,
+            "from": self._me(),
+            "text": params.get("text", ""),
+        }
+
+    def _media_message(self, chat_id: Any, media_type: str, media: Any, params: Dict[str, Any]) -> Dict[str, Any]:
+        if isinstance(media, str) and media.startswith("attach://"):
+            media = params.get(media[len("attach://"):])
+        if isinstance(media, web.FileField):
+            data = media.file.read()
+            self.uploads += 1
+            self.uploaded_bytes += len(data)
+            media = self.add_file(data)
+        message = self._message(chat_id, params)
+        attachment = {"file_id": media, "file_unique_id": media}
+        if media_type == "photo":
+            message["photo"] = [{**attachment, "width": 1, "height": 1}]
+        elif media_type == "video":
+            message["video"] = {**attachment, "width": 1, "height": 1, "duration": 1}
+        else:
+            message["document"] = attachment
+        return message
+
+    def _me(self) -> Dict[str, Any]:
+        return {"id": self.bot_id, "is_bot": True, "first_name": "Bench", "username": "bench_bot",
+                "can_join_groups": True, "can_read_all_group_messages": False, "supports_inline_queries": False}
+
+    def _chat(self, chat_id: Any) -> Dict[str, Any]:
+        if isinstance(chat_id, str) and chat_id.startswith("@"):
+            return {"id": -1000000000000 - zlib.crc32(chat_id.lower().encode()), "type": "channel",
+                    "title": chat_id[1:], "username": chat_id[1:]}
+        chat_id = int(chat_id)
+        return {"id": chat_id, "type": "private" if chat_id > 0 else "supergroup", "title": str(chat_id)}
+
+    def _member(self, chat_id: Any, user_id: int) -> Dict[str, Any]:
+        user = self._me() if user_id == self.bot_id else {"id": user_id, "is_bot": False, "first_name": "User"}
+        status = self.member_status.get(self._chat(chat_id)["id"], "administrator") if user_id == self.bot_id \
+            else "member"
+        if status != "administrator":
+            return {"status": status, "user": user, **({"until_date": 0} if status == "kicked" else {})}
+        return {"status": status, "user": user, "can_be_edited": False, "is_anonymous": False,
+                "can_manage_chat": True, "can_delete_messages": True, "can_manage_video_chats": True,
+                "can_restrict_members": True, "can_promote_members": False, "can_change_info": True,
+                "can_invite_users": True, "can_post_messages": True, "can_edit_messages": True}
+
+    # --- HTTP -----------------------------------------------------------------
+
+    async def _params(self, request: web.Request) -> Dict[str, Any]:
+        if request.content_type == "application/json":
+            return await request.json()
+        params = {}
+        for key, value in (await request.post()).items():
+            if isinstance(value, str):
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    pass
+            params[key] = value
+        return params
+
+    async def _handle(self, request: web.Request) -> web.Response:
+        method = request.match_info["method"]
+        self.connections.add(request.transport.get_extra_info("peername") if request.transport else None)
+        params = await self._params(request) if request.can_read_body else dict(request.query)
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+        if method == "getMe":
+            return _ok(self._me())
+        if method in ("getChat", "getChatMember", "getChatAdministrators"):
+            self.lookups[method] = self.lookups.get(method, 0) + 1
+            chat_id = params.get("chat_id")
+            if method == "getChat":
+                return _ok(self._chat(chat_id))
+            if method == "getChatMember":
+                return _ok(self._member(chat_id, int(params.get("user_id"))))
+            return _ok([self._member(chat_id, self.bot_id)])
+        if method == "getUpdates":
+            return _ok(await self._get_updates(params))
+        if method == "setWebhook":
+            self.webhook_url = params.get("url", "")
+            self.webhook_secret = params.get("secret_token", "")
+            if self._pusher is None and self.webhook_url:
+                self._pusher = asyncio.create_task(self._push_loop())
+            return _ok(True)
+        if method == "getWebhookInfo":
+            return _ok({"url": self.webhook_url, "has_custom_certificate": False,
+                        "pending_update_count": len(self._pending)})
+        if method == "getFile":
+            file_id = params.get("file_id", "")
+            if file_id not in self._files:
+                return web.json_response({"ok": False, "error_code": 400,
+                                          "description": "Bad Request: invalid file_id"}, status=400)
+            return _ok({"file_id": file_id, "file_unique_id": file_id,
+                        "file_size": len(self._files[file_id]), "file_path": file_id})
+        if method in TRUE_METHODS:
+            return _ok(True)
+        if method.startswith("send") or method in ("copyMessage", "forwardMessage", "editMessageText"):
+            chat_id = params.get("chat_id")
+            if self._throttled(chat_id):
+                self.retry_afters += 1
+                return web.json_response({
+                    "ok": False, "error_code": 429,
+                    "description": f"Too Many Requests: retry after {self.retry_after}",
+                    "parameters": {"retry_after": self.retry_after},
+                }, status=429)
+            self.sent.append((time.monotonic(), method, chat_id))
+            if method == "sendMediaGroup":
+                return _ok([self._media_message(chat_id, item["type"], item["media"], params)
+                            for item in params.get("media", [])])
+            if method in MEDIA_METHODS:
+                media_type = MEDIA_METHODS[method]
+                return _ok(self._media_message(chat_id, media_type, params.get(media_type), params))
+            return _ok(self._message(chat_id, params))
+        return web.json_response({"ok": False, "error_code": 404, "description": "Not Found"}, status=404)
+
+    def send_rate(self) -> float:
+        """Accepted sends per second between the first and the last send"""
+        if len(self.sent) < 2:
+            return 0.0
+        elapsed = self.sent[-1][0] - self.sent[0][0]
+        return (len(self.sent) - 1) / elapsed if elapsed else 0.0
+
+
+def _ok(result: Any) -> web.Response:
+    return web.json_response({"ok": True, "result": result})
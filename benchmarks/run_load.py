@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+End-to-end load test of TelegramAutoBot against the fake Bot API server
+
+Usage: python -m benchmarks.run_load [--scenario mixed] [--updates 5000] [--mode polling]
+                                     [--posts 200] [--scheduler-jobs 2000] [--json results.json]
+
+Runs three phases in one process: synthetic updates through the real
+Application (handle_message, admin commands), auto_post_job publishing
+through the outbox, and a burst of scheduler jobs. Telegram's send limits
+are lifted unless --telegram-limits is given, so the numbers measure the
+bot rather than the rate limiter. Inbound rate limits and load shedding
+are likewise off unless --intake-limits is given; the raid scenario is
+meant to be run with them.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import resource
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timedelta, timezone
+from typing import Dict, List
+
+from .fake_bot_api import FakeBotAPI
+from .synthetic import scenario
+
+ADMIN_ID = 42
+BOT_TOKEN = "100000:BENCHMARK"
+
+
+def percentile(values: List[float], pct: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def rss_mib() -> float:
+    """Current resident set size; falls back to the peak where /proc is missing"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1024 / 1024
+    except OSError:
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def configure_environment(args, api: FakeBotAPI, data_dir: str):
+    """Point the bot's Config at the fake server before it is created"""
+    os.environ.update(
+        BOT_TOKEN=BOT_TOKEN,
+        USER_ID=str(ADMIN_ID),
+        BOT_API_URL=api.url,
+        DATABASE_URL=f"sqlite:///{os.path.join(data_dir, 'bench.db')}",
+        REPLY_DELAY_MIN="0",
+        REPLY_DELAY_MAX="0",
+        PORT=str(args.port + 1),
+        WEBHOOK_LISTEN="127.0.0.1",
+        METRICS_ENABLED="false",
+        CLUSTER_MODE="",
+        LOG_LEVEL=args.log_level,
+        LOG_FILE="",
+        LOG_FORMAT="console",
+    )
+    os.environ.pop("REDIS_URL", None)
+    if args.mode == "webhook":
+        os.environ["WEBHOOK_URL"] = f"http://127.0.0.1:{args.port + 1}/bench"
+        os.environ["WEBHOOK_SECRET"] = "benchmark"
+    else:
+        os.environ.pop("WEBHOOK_URL", None)
+    if not args.telegram_limits:
+        os.environ.update(SEND_GLOBAL_RATE="1000000", SEND_CHAT_RATE="1000000",
+                          SEND_GROUP_RATE_PER_MINUTE="60000000")
+    if not args.intake_limits:
+        os.environ.update(INTAKE_USER_RATE="0", INTAKE_CHAT_RATE="0", INTAKE_MAX_PENDING="100000000",
+                          INTAKE_HIGH_WATERMARK="100000000", INTAKE_LOW_WATERMARK="0")
+
+
+class UpdateTimer:
+    """Times each update from its first handler group to its last"""
+
+    def __init__(self, expected: int, processor):
+        self.expected = expected
+        self.processor = processor
+        self.started: Dict[int, float] = {}
+        self.latencies: List[float] = []
+        self.admin_latencies: List[float] = []
+        self.done = asyncio.Event()
+
+    async def begin(self, update, context):
+        self.started[update.update_id] = time.perf_counter()
+
+    async def end(self, update, context):
+        started = self.started.pop(update.update_id, None)
+        if started is not None:
+            self.latencies.append(time.perf_counter() - started)
+            if update.effective_user is not None and update.effective_user.id == ADMIN_ID:
+                self.admin_latencies.append(self.latencies[-1])
+        self.check()
+
+    def check(self):
+        # Shed updates never reach a handler
+        if len(self.latencies) + self.processor.dropped >= self.expected:
+            self.done.set()
+
+
+async def wait_idle(bot, timeout: float):
+    """Wait until queued replies and sends have gone out"""
+    deadline = time.monotonic() + timeout
+    while (bot.dispatcher.pending() or len(bot.deferred_replies)) and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+
+
+async def run_updates(bot, api: FakeBotAPI, args, results: dict):
+    from telegram import Update
+    from telegram.ext import TypeHandler
+
+    updates = scenario(args.scenario, args.updates, ADMIN_ID)
+    timer = UpdateTimer(len(updates), bot.update_processor)
+    bot.application.add_handler(TypeHandler(Update, timer.begin), group=-1000)
+    bot.application.add_handler(TypeHandler(Update, timer.end), group=1000)
+
+    sends_before = len(api.sent)
+    started = time.perf_counter()
+    api.push(updates)
+    # Shed updates never reach ``timer.end``, so poll rather than wait on the event
+    while not timer.done.is_set():
+        if time.perf_counter() - started > args.timeout:
+            print(f"timed out with {len(timer.latencies)}/{len(updates)} updates handled")
+            break
+        await asyncio.sleep(0.01)
+        timer.check()
+    elapsed = time.perf_counter() - started
+    await wait_idle(bot, args.timeout)
+    drained = time.perf_counter() - started
+
+    sends = len(api.sent) - sends_before
+    results["updates"] = {
+        "count": len(timer.latencies),
+        "per_second": len(timer.latencies) / elapsed,
+        "p50_ms": percentile(timer.latencies, 50) * 1000,
+        "p99_ms": percentile(timer.latencies, 99) * 1000,
+        "sends": sends,
+        "sends_per_second": sends / drained if drained else 0.0,
+        "retry_after": api.retry_afters,
+        "admin_p99_ms": percentile(timer.admin_latencies, 99) * 1000,
+        "shed": dict(bot.update_processor.shed),
+    }
+
+
+async def run_auto_post(bot, api: FakeBotAPI, args, results: dict):
+    for n in range(args.posts):
+        bot.repository.save_post(bot.scheduled_posts.add(f"Benchmark auto post {n}"))
+    await bot.repository.flush()
+
+    latencies = []
+    started = time.perf_counter()
+    while bot.scheduled_posts.next_pending() is not None:
+        post_started = time.perf_counter()
+        await bot.auto_post_job()
+        latencies.append(time.perf_counter() - post_started)
+    elapsed = time.perf_counter() - started
+    results["auto_post"] = {
+        "count": len(latencies),
+        "per_second": len(latencies) / elapsed if elapsed else 0.0,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+    }
+
+
+async def run_scheduler(bot, args, results: dict):
+    from src.scheduler import DateTrigger
+
+    lags = []
+    fired = asyncio.Event()
+
+    def job(due: datetime):
+        async def callback():
+            lags.append((datetime.now(timezone.utc) - due).total_seconds())
+            if len(lags) >= args.scheduler_jobs:
+                fired.set()
+        return callback
+
+    start = datetime.now(timezone.utc) + timedelta(seconds=0.2)
+    spread = timedelta(seconds=1)
+    for n in range(args.scheduler_jobs):
+        due = start + spread * (n / max(1, args.scheduler_jobs))
+        bot.scheduler.add_job(job(due), DateTrigger(due), name=f"bench-{n}")
+    try:
+        await asyncio.wait_for(fired.wait(), args.timeout)
+    except asyncio.TimeoutError:
+        print(f"timed out with {len(lags)}/{args.scheduler_jobs} jobs fired")
+    results["scheduler"] = {
+        "jobs": len(lags),
+        "p50_lag_ms": percentile(lags, 50) * 1000,
+        "p99_lag_ms": percentile(lags, 99) * 1000,
+    }
+
+
+async def run(args) -> dict:
+    api = FakeBotAPI(port=args.port, retry_after_rate=args.retry_after_rate,
+                     chat_rate_limit=1.0 if args.telegram_limits else None)
+    await api.start()
+    results = {"revision": git_revision(), "scenario": args.scenario, "mode": args.mode}
+
+    with tempfile.TemporaryDirectory() as data_dir:
+        configure_environment(args, api, data_dir)
+        from src.bot import TelegramAutoBot
+        from src.config import Config
+        from src.utils.logger import setup_logger
+        setup_logger(Config())
+
+        results["rss_before_mib"] = rss_mib()
+        bot = TelegramAutoBot(BOT_TOKEN, ADMIN_ID, Config())
+        application = bot.application
+
+        if args.mode == "webhook":
+            server = asyncio.create_task(bot.run_webhook())
+            while not api.webhook_url:
+                await asyncio.sleep(0.01)
+        else:
+            from telegram import Update
+            await application.initialize()
+            await bot._post_init(application)
+            await application.updater.start_polling(poll_interval=0.0, timeout=1,
+                                                    allowed_updates=Update.ALL_TYPES)
+            await application.start()
+
+        try:
+            await run_updates(bot, api, args, results)
+            if args.posts:
+                await run_auto_post(bot, api, args, results)
+            if args.scheduler_jobs:
+                await run_scheduler(bot, args, results)
+            results["rss_mib"] = rss_mib()
+        finally:
+            if args.mode == "webhook":
+                bot.stop()
+                await server
+            else:
+                await application.updater.stop()
+                await application.stop()
+                await bot._post_stop(application)
+                await application.shutdown()
+            await api.stop()
+
+    results["peak_rss_mib"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return results
+
+
+def report(results: dict):
+    updates = results["updates"]
+    print(f"revision:           {results['revision']} ({results['scenario']}, {results['mode']})")
+    print(f"updates:            {updates['count']:,} at {updates['per_second']:,.0f}/s")
+    print(f"handler latency:    p50 {updates['p50_ms']:.2f} ms, p99 {updates['p99_ms']:.2f} ms")
+    print(f"sends:              {updates['sends']:,} at {updates['sends_per_second']:,.0f}/s "
+          f"({updates['retry_after']} RetryAfter)")
+    print(f"admin latency:      p99 {updates['admin_p99_ms']:.2f} ms")
+    if updates["shed"]:
+        print("shed:               " + ", ".join(f"{reason} {count:,}" for reason, count in sorted(updates["shed"].items())))
+    if "auto_post" in results:
+        auto_post = results["auto_post"]
+        print(f"auto_post_job:      {auto_post['count']:,} at {auto_post['per_second']:,.0f}/s "
+              f"(p50 {auto_post['p50_ms']:.2f} ms, p99 {auto_post['p99_ms']:.2f} ms)")
+    if "scheduler" in results:
+        scheduler = results["scheduler"]
+        print(f"scheduler lag:      p50 {scheduler['p50_lag_ms']:.2f} ms, p99 {scheduler['p99_lag_ms']:.2f} ms "
+              f"({scheduler['jobs']:,} jobs)")
+    print(f"rss:                {results['rss_before_mib']:.1f} -> {results['rss_mib']:.1f} MiB "
+          f"(peak {results['peak_rss_mib']:.1f} MiB)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--scenario", choices=["chatter", "admin", "flood", "raid", "mixed"], default="mixed")
+    parser.add_argument("--updates", type=int, default=5000)
+    parser.add_argument("--mode", choices=["polling", "webhook"], default="polling")
+    parser.add_argument("--posts", type=int, default=200, help="posts published with auto_post_job")
+    parser.add_argument("--scheduler-jobs", type=int, default=2000)
+    parser.add_argument("--retry-after-rate", type=float, default=0.0,
+                        help="fraction of sends answered with 429 RetryAfter")
+    parser.add_argument("--telegram-limits", action="store_true",
+                        help="keep Telegram's real send limits and enforce 1 msg/s per chat in the fake API")
+    parser.add_argument("--intake-limits", action="store_true",
+                        help="keep the inbound rate limits and load shedding from Config")
+    parser.add_argument("--port", type=int, default=18081)
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--json", help="also write the results to this file")
+    args = parser.parse_args()
+
+    results = asyncio.run(run(args))
+    report(results)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+"""
+Synthetic Telegram updates for load tests
+
+Every generator is seeded, so a scenario produces the same updates on every
+run and results stay comparable across commits. ``update_id`` is left out;
+the fake API server assigns it when the update is queued.
+"""
+
+import itertools
+import random
+import time
+from typing import Any, Dict, Iterator, List
+
+ADMIN_COMMANDS = ["/status", "/config", "/list_posts", "/help", "/add_post Benchmark post {n}"]
+
+CHATTER = [
+    "anyone around?", "good morning everyone", "what do you think about this",
+    "lol", "check this out", "thanks!", "is the meeting still on", "+1",
+    "that's a great idea", "can someone help me with this",
+]
+
+_message_ids = itertools.count(1)
+
+
+def _user(user_id: int) -> Dict[str, Any]:
+    return {"id": user_id, "is_bot": False, "first_name": f"User{user_id}"}
+
+
+def _chat(chat_id: int) -> Dict[str, Any]:
+    if chat_id > 0:
+        return {"id": chat_id, "type": "private", "first_name": f"User{chat_id}"}
+    return {"id": chat_id, "type": "supergroup", "title": f"Group {chat_id}"}
+
+
+def message(chat_id: int, user_id: int, text: str) -> Dict[str, Any]:
+    """A text message update; commands get their bot_command entity"""
+    data = {
+        "message_id": next(_message_ids),
+        "date": int(time.time()),
+        "chat": _chat(chat_id),
+        "from": _user(user_id),
+        "text": text,
+    }
+    if text.startswith("/"):
+        data["entities"] = [{"type": "bot_command", "offset": 0, "length": len(text.split()[0])}]
+    return {"message": data}
+
+
+def group_chatter(count: int, groups: int = 20, users: int = 500, seed: int = 1) -> Iterator[Dict[str, Any]]:
+    """Ordinary messages spread over several groups"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        yield message(-1001000000000 - rng.randrange(groups), 1000 + rng.randrange(users), rng.choice(CHATTER))
+
+
+def admin_commands(count: int, admin_id: int, seed: int = 2) -> Iterator[Dict[str, Any]]:
+    """Commands from the bot owner in their private chat"""
+    rng = random.Random(seed)
+    for n in range(count):
+        yield message(admin_id, admin_id, rng.choice(ADMIN_COMMANDS).format(n=n))
+
+
+def flood(count: int, users: int = 5000, seed: int = 3) -> Iterator[Dict[str, Any]]:
+    """Many distinct users writing to the bot privately at once"""
+    rng = random.Random(seed)
+    for _ in range(count):
+        user_id = 100000 + rng.randrange(users)
+        yield message(user_id, user_id, rng.choice(CHATTER))
+
+
+def raid(count: int, admin_id: int, users: int = 20000, seed: int = 5) -> Iterator[Dict[str, Any]]:
+    """Thousands of accounts spamming one group, with the owner's commands in between"""
+    rng = random.Random(seed)
+    admin = admin_commands(count, admin_id)
+    for n in range(count):
+        if n % 500 == 0:
+            yield next(admin)
+        else:
+            yield message(-1001999999999, 200000 + rng.randrange(users), rng.choice(CHATTER))
+
+
+def scenario(name: str, count: int, admin_id: int) -> List[Dict[str, Any]]:
+    """Build a named scenario: chatter, admin, flood, raid or mixed"""
+    if name == "chatter":
+        return list(group_chatter(count))
+    if name == "admin":
+        return list(admin_commands(count, admin_id))
+    if name == "flood":
+        return list(flood(count))
+    if name == "raid":
+        return list(raid(count, admin_id))
+    if name == "mixed":
+        # Mostly group traffic with a private flood and occasional admin commands
+        rng = random.Random(4)
+        sources = [group_chatter(count), flood(count), admin_commands(count, admin_id)]
+        weights = [0.7, 0.28, 0.02]
+        return [next(rng.choices(sources, weights)[0]) for _ in range(count)]
+    raise ValueError(f"unknown scenario {name!r}")
@@ -8,19 +8,27 @@ Description: Automated Telegram bot for posting, replies, and profile management
 import os
 import sys
 import asyncio
-# Corrected import: import the actual class name from src.bot
-from src.bot import TelegramAutoBot # CHANGED: TelgBot to TelegramAutoBot
 from src.config import Config
 from src.utils.logger import setup_logger
 
 def main():
     """Main function to start the bot"""
-    # Setup logging
-    logger = setup_logger()
+    # Load configuration, then set up logging from it
+    config = Config()
+    logger = setup_logger(config)
 
     try:
-        # Load configuration
-        config = Config()
+        # Multi-tenant mode: every bot in TENANTS_FILE runs in this process
+        if config.TENANTS_FILE:
+            is_valid, errors = config.validate(multi_tenant=True)
+            if not is_valid:
+                for error in errors:
+                    logger.error("❌ %s", error)
+                sys.exit(1)
+            from src.tenants import TenantRunner
+            logger.info("🏢 Starting tenants from %s...", config.TENANTS_FILE)
+            asyncio.run(TenantRunner(config).run())
+            return
 
         # Validate required environment variables
         if not config.BOT_TOKEN:
@@ -33,13 +41,31 @@ def main():
             logger.error("💡 Get your user ID from @userinfobot and set USER_ID")
             sys.exit(1)
 
-        # Create and start bot
+        if config.CLUSTER_MODE:
+            is_valid, errors = config.validate()
+            if not is_valid:
+                for error in errors:
+                    logger.error("❌ %s", error)
+                sys.exit(1)
+
+        from src.bot import TelegramAutoBot
+
+        # Cluster front ends only route updates, asking Telegram for what the workers' handlers use
+        if config.CLUSTER_MODE == 'local':
+            from src.cluster import run_local_cluster
+            logger.info("🚀 Starting %d workers...", config.WORKER_COUNT)
+            run_local_cluster(config, TelegramAutoBot.routed_updates(config))
+            return
+        if config.CLUSTER_MODE == 'router':
+            from src.cluster import UpdateRouter
+            asyncio.run(UpdateRouter(config, config.CLUSTER_WORKERS, TelegramAutoBot.routed_updates(config)).run())
+            return
+
+        # Start bot
+        bot = TelegramAutoBot(config.BOT_TOKEN, int(config.USER_ID), config)
         logger.info("🚀 Starting Telegram Auto Bot...")
         logger.info(f"📱 Bot Token: {config.BOT_TOKEN[:10]}...{config.BOT_TOKEN[-10:]}")
         logger.info(f"👤 Authorized User ID: {config.USER_ID}")
-
-        # Corrected instantiation: use the correct class name
-        bot = TelegramAutoBot(config.BOT_TOKEN, int(config.USER_ID)) # CHANGED: TelgBot to TelegramAutoBot, and passed arguments
         bot.run()
 
     except KeyboardInterrupt:
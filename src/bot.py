@@ -1,28 +1,117 @@
 import asyncio
 import json
 import random
+import secrets
+import signal
+import tempfile
 import time
+from collections import OrderedDict
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
+from pathlib import Path
+from typing import TYPE_CHECKING, Dict, List, Optional, Set, Tuple
 import logging
 
-from telegram import Update, Bot
-from telegram.ext import Application, CommandHandler, MessageHandler, filters, ContextTypes
-import schedule
-
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
+from telegram import Chat, InlineKeyboardButton, InlineKeyboardMarkup, Update
+from telegram.ext import (
+    Application, ApplicationHandlerStop, BaseHandler, CallbackQueryHandler, ChatMemberHandler, CommandHandler, MessageHandler,
+    TypeHandler, filters, ContextTypes
 )
+from telegram.helpers import escape_markdown
+
+from .bulk import detect_format, parse_posts, write_export
+
+from .cluster import LeaderLease, add_worker_route, create_state_store
+from .config import Config
+from .dedupe import UpdateDedupe, create_away_dedupe
+from .deferred import DeferredQueue
+from .dispatcher import OutboundDispatcher, Priority, parse_chat_id
+from .fanout import DeliveryState, FanOut, TargetDelivery
+from .lookups import LookupCache
+from .media import MediaCache, media_from_message
+from .metrics import Metrics
+from .posts import MAX_CAPTION_LENGTH, MediaItem, PostStore, ScheduledPost
+from .profiling import LoopProfiler, LoopWatchdog, ProfilerBusy, idle_seconds, top_functions
+from .replies import ReplyMatcher, ReplyTemplate, parse_triggers
+from .routing import MEDIA_GROUP, allowed_updates, update_type, update_types_for
+from .scheduler import CronTrigger, DateTrigger, IntervalTrigger, Scheduler, parse_timezone
+from .storage import Repository
+from .updates import Importance, InboundLimiter, PerChatUpdateProcessor
+from .utils.http_client import bot_api_urls, build_request
+from .utils.logger import dropped_records, queued_records
+from .utils.redis_client import close_redis
+from .webhook import WebhookServer, webhook_path
+
+if TYPE_CHECKING:
+    from .tenants import SharedResources
+
 logger = logging.getLogger(__name__)
 
+# Posts per /list_posts and /find page
+POSTS_PAGE_SIZE = 10
+
+# /find result messages whose Prev/Next buttons still work
+FIND_SEARCHES_KEPT = 100
+
+# Telegram keeps undelivered updates for 24 hours, so an older high-water mark
+# cannot match a replay (and update_ids may restart after a quiet week)
+UPDATE_HIGH_WATER_MAX_AGE = 24 * 60 * 60
+
+# Seconds to wait for the rest of an album after its last item arrived
+ALBUM_WAIT_SECONDS = 1.0
+
+# Rows inserted between database flushes and progress updates during an import
+IMPORT_BATCH_SIZE = 500
+IMPORT_PROGRESS_INTERVAL = 2.0
+
+# Largest file the Bot API lets bots download
+MAX_DOWNLOAD_BYTES = 20 * 1024 * 1024
+
+# /profile length when none is given, and functions listed in its summary
+PROFILE_DEFAULT_SECONDS = 10
+PROFILE_TOP_FUNCTIONS = 15
+# Name of the task capturing a /profile, cancelled rather than awaited on shutdown
+PROFILE_TASK_NAME = "profile"
+
 class TelegramAutoBot:
-    def __init__(self, bot_token: str, user_id: int):
+    def __init__(self, bot_token: str, user_id: int, config: Optional[Config] = None,
+                 shared: Optional["SharedResources"] = None):
         self.bot_token = bot_token
         self.user_id = user_id
-        self.bot = Bot(token=bot_token)
-        self.application = Application.builder().token(bot_token).build()
+        self.settings = config or Config()
+        # Set when hosted by a TenantRunner next to other bots
+        self.shared = shared
+        # The owner plus ADMIN_IDS may use admin commands
+        self.admin_ids = {user_id, *self.settings.ADMIN_IDS}
+        self.admin_filter = filters.User(user_id=self.admin_ids)
+        self.metrics = Metrics(process=shared is None)
+        # Sends and getUpdates share one connection pool (across tenants, if hosted)
+        self.request = shared.request if shared is not None else build_request(self.settings)
+        # Bounded intake: floods are rate-limited and shed before they reach handlers
+        self.update_processor = PerChatUpdateProcessor(
+            self.settings.MAX_CONCURRENT_UPDATES,
+            max_pending=self.settings.INTAKE_MAX_PENDING,
+            high_watermark=self.settings.INTAKE_HIGH_WATERMARK,
+            low_watermark=self.settings.INTAKE_LOW_WATERMARK,
+            user_limiter=InboundLimiter(self.settings.INTAKE_USER_RATE, self.settings.INTAKE_USER_BURST),
+            chat_limiter=InboundLimiter(self.settings.INTAKE_CHAT_RATE, self.settings.INTAKE_CHAT_BURST),
+            classify=self._importance,
+            on_shed=lambda reason: self.metrics.updates_shed.labels(reason).inc(),
+            on_start=self._update_started,
+            on_finish=self._update_finished,
+        )
+        builder = (
+            Application.builder()
+            .token(bot_token)
+            .request(self.request)
+            .get_updates_request(self.request)
+            .concurrent_updates(self.update_processor)
+            .post_init(self._post_init)
+            .post_stop(self._post_stop)
+        )
+        for option, url in bot_api_urls(self.settings).items():
+            builder = getattr(builder, option)(url)
+        self.application = builder.build()
+        self._stop_event: Optional[asyncio.Event] = None
 
         # Bot configuration
         self.config = {
@@ -34,8 +123,9 @@ class TelegramAutoBot:
         }
 
         # Storage for posts, replies, and user data
-        self.scheduled_posts = []
-        self.reply_templates = [
+        self.scheduled_posts = PostStore()
+        # Generic replies; templates added with triggers are chosen by keyword
+        self.reply_templates = ReplyMatcher([ReplyTemplate(content) for content in [
             "That's interesting! 🤔",
             "Great point! 👍",
             "I agree with this 💯",
@@ -44,7 +134,7 @@ class TelegramAutoBot:
             "Couldn't agree more! ✨",
             "Love this perspective 🔥",
             "So true! 💯"
-        ]
+        ]])
 
         self.away_messages = [
             "Hey! I'm currently away but will get back to you soon! 🚀",
@@ -52,40 +142,271 @@ class TelegramAutoBot:
             "Away from keyboard right now, but I'll catch up with you later! ⚡"
         ]
 
+        # Event-loop scheduler for auto posts and per-post publish times
+        self.timezone = parse_timezone(self.settings.TIMEZONE)
+        if shared is not None:
+            self.scheduler = shared.scheduler
+        else:
+            self.scheduler = Scheduler(
+                max_jobs=self.settings.MAX_SCHEDULED_POSTS + 1,
+                on_lag=self.metrics.observe_scheduler_lag,
+            )
+        self.auto_post_schedule = None
+        self._pinned_jobs = {}
+
         # Track who we've sent away messages to (reset daily)
-        self.away_message_sent = {}
+        bot_id = bot_token.split(':', 1)[0]
+        self.bot_id = int(bot_id) if bot_id.isdigit() else 0
+        self.away_message_sent = create_away_dedupe(self.settings.REDIS_URL, str(self.bot_id), self.timezone)
+
+        # Database persistence; in-memory state above acts as the read cache
+        self.repository = Repository(
+            self.settings.DATABASE_URL,
+            self.bot_id,
+            pool_size=self.settings.DB_POOL_SIZE,
+            flush_interval=self.settings.DB_FLUSH_INTERVAL,
+            worker=self.settings.WORKER_INDEX,
+        )
+
+        # In a cluster, state changes are announced through the shared store and
+        # only the elected leader runs scheduled posts
+        self.cluster_store = None
+        self.leader = None
+        self._state_version = None
+        self._state_checked_at = 0.0
+        # Reloads run in the background; another one is due if state changed during it
+        self._reload: Optional[asyncio.Task] = None
+        self._reload_again = False
+        if self.settings.CLUSTER_MODE == 'worker':
+            self.cluster_store = create_state_store(self.settings.REDIS_URL)
+            self.leader = LeaderLease(self.cluster_store, str(self.bot_id), ttl=self.settings.LEADER_LEASE_TTL)
+
+        # Every outgoing message goes through the rate-limited dispatcher
+        self.dispatcher = OutboundDispatcher(
+            self.application.bot,
+            self.repository,
+            global_rate=self.settings.SEND_GLOBAL_RATE,
+            chat_rate=self.settings.SEND_CHAT_RATE,
+            group_rate=self.settings.SEND_GROUP_RATE_PER_MINUTE / 60,
+            max_retries=self.settings.SEND_MAX_RETRIES,
+            durable_max_retries=self.settings.SEND_DURABLE_MAX_RETRIES,
+            id_base=self.settings.WORKER_INDEX << 32,
+            metrics=self.metrics,
+            recent_keys=self.settings.SEND_DEDUPE_SIZE,
+        )
+        # Replayed updates are dropped before any handler runs
+        self.update_dedupe = UpdateDedupe(self.settings.UPDATE_DEDUPE_SIZE, self.settings.UPDATE_DEDUPE_WINDOW)
+        self.fanout = FanOut(
+            self.dispatcher,
+            self.repository,
+            concurrency=self.settings.POST_CONCURRENCY,
+            max_retries=self.settings.POST_MAX_RETRIES,
+        )
+        self._publishing = set()
+        # /find results message id -> (query, posted filter), for its page buttons
+        self._searches: "OrderedDict[int, Tuple[str, Optional[bool]]]" = OrderedDict()
+
+        # Chat ids, bot info and permissions are looked up once per TTL, not once per post
+        self.lookups = LookupCache(
+            self.application.bot,
+            ttls={
+                "get_me": self.settings.LOOKUP_TTL_ME,
+                "get_chat": self.settings.LOOKUP_TTL_CHAT,
+                "get_chat_member": self.settings.LOOKUP_TTL_MEMBER,
+            },
+            max_entries=self.settings.LOOKUP_CACHE_SIZE,
+        )
+
+        # Uploads happen once per file; every later send reuses the cached file_id
+        self.media_cache = MediaCache(self.repository, max_entries=self.settings.MEDIA_CACHE_SIZE)
+        self.dispatcher.register_method("send_media_post", self.media_cache.send)
+        self._albums: Dict[str, dict] = {}
+        # Work started outside a handler; the loop only holds weak references to tasks
+        self._tasks: Set[asyncio.Task] = set()
+
+        # Delayed replies wait on loop timers instead of inside the handler
+        self.deferred_replies = DeferredQueue(max_pending=self.settings.MAX_DEFERRED_REPLIES)
+
+        # Callbacks that block the event loop are logged with their stack; /profile shows where time goes
+        if shared is not None:
+            self.profiler = shared.profiler
+            self.watchdog = shared.watchdog
+        else:
+            self.profiler = LoopProfiler(self.settings.PROFILE_MAX_SECONDS)
+            self.watchdog = None
+            if self.settings.LOOP_LAG_THRESHOLD > 0:
+                self.watchdog = LoopWatchdog(
+                    self.settings.LOOP_LAG_THRESHOLD,
+                    self.settings.LOOP_LAG_INTERVAL,
+                    on_lag=self.metrics.loop_lag.observe,
+                )
+
+        # One HTTP server for webhooks, routed cluster updates, /healthz and /metrics
+        if shared is not None:
+            self.http_server = shared.http_server
+        else:
+            self.http_server = WebhookServer(self.settings.WEBHOOK_LISTEN, self.settings.PORT)
+            self.http_server.add_get_route("/metrics", self.metrics.handle_metrics)
+        self.metrics.track_queue("updates", self.application.update_queue.qsize)
+        self.metrics.track_queue("intake", lambda: self.update_processor.pending)
+        self.metrics.track_queue("outbound", self.dispatcher.pending)
+        self.metrics.track_queue("deferred_replies", self.deferred_replies.__len__)
+        self.metrics.track_queue("scheduler_jobs", self.scheduler.__len__)
+        self.metrics.track_queue("log", queued_records)
+        self.metrics.log_dropped.set_function(dropped_records)
 
         self.setup_handlers()
 
+    def reply(self, update: Update, text: str, priority: int = Priority.ADMIN, **kwargs) -> asyncio.Future:
+        """Queue a reply to the message in ``update``; await the result to wait for delivery"""
+        if update.effective_chat.type != Chat.PRIVATE:
+            kwargs.setdefault('reply_to_message_id', update.effective_message.message_id)
+        return self.dispatcher.send_message(update.effective_chat.id, text, priority=priority, **kwargs)
+
+    def _handlers(self) -> List[BaseHandler]:
+        """Handlers that answer updates; these decide which update types the bot subscribes to"""
+        return self._handler_table(self, self.admin_filter)
+
+    @staticmethod
+    def _handler_table(owner, admin_filter: filters.BaseFilter) -> List[BaseHandler]:
+        """
+        The handlers with callbacks looked up on ``owner``.
+
+        ``owner`` is a bot, or the class itself when only the update types
+        matter; the callbacks are then plain functions that are never called.
+        """
+        handlers: List[BaseHandler] = []
+        # Admin commands; the user filter is checked before the handler is chosen
+        admin = filters.UpdateType.MESSAGE & admin_filter
+        for command, callback in [
+            ("start", owner.start_command),
+            ("config", owner.config_command),
+            ("toggle_autopost", owner.toggle_autopost),
+            ("toggle_replyguy", owner.toggle_replyguy),
+            ("toggle_away", owner.toggle_away),
+            ("add_post", owner.add_scheduled_post),
+            ("schedule_post", owner.schedule_post_command),
+            ("list_posts", owner.list_posts),
+            ("find", owner.find_posts),
+            ("edit_post", owner.edit_post),
+            ("delete_post", owner.delete_post),
+            ("export_posts", owner.export_posts),
+            ("add_reply", owner.add_reply_template),
+            ("status", owner.status_command),
+            ("profile", owner.profile_command),
+            ("post", owner.post_command),
+        ]:
+            handlers.append(CommandHandler(command, callback, filters=admin))
+        handlers.append(CommandHandler("help", owner.help_command, filters=filters.UpdateType.MESSAGE))
+        handlers.append(CommandHandler(
+            ["start", "post"], owner.unauthorized_command, filters=filters.UpdateType.MESSAGE & ~admin_filter
+        ))
+        handlers.append(CallbackQueryHandler(owner.list_posts_page, pattern=r"^posts:(next|prev):\d+$"))
+        handlers.append(CallbackQueryHandler(owner.find_posts_page, pattern=r"^find:\d+$"))
+        handlers.append(MessageHandler(
+            admin & filters.ChatType.PRIVATE & (
+                filters.Document.FileExtension("csv")
+                | filters.Document.FileExtension("jsonl")
+                | filters.Document.FileExtension("ndjson")
+            ),
+            owner.import_posts
+        ))
+
+        # Photos, videos and documents (or an album) captioned /add_post become media posts
+        handlers.append(MessageHandler(
+            admin & filters.ChatType.PRIVATE & (filters.PHOTO | filters.VIDEO | filters.Document.ALL)
+            & (filters.CaptionRegex(r'^/add_post(@\w+)?(\s|$)') | MEDIA_GROUP),
+            owner.add_media_post
+        ))
+
+        # Message handler for reply guy and away messages; admins' own messages are skipped
+        handlers.append(MessageHandler(
+            filters.UpdateType.MESSAGE & filters.TEXT & ~filters.COMMAND & ~admin_filter,
+            owner.handle_message
+        ))
+
+        # Changes to the bot's own membership make cached chat and permission lookups stale;
+        # other members' joins and leaves are not subscribed to
+        handlers.append(ChatMemberHandler(owner._member_changed, ChatMemberHandler.MY_CHAT_MEMBER))
+        return handlers
+
     def setup_handlers(self):
         """Set up command and message handlers"""
-        # Admin commands
-        self.application.add_handler(CommandHandler("start", self.start_command))
-        self.application.add_handler(CommandHandler("help", self.help_command))
-        self.application.add_handler(CommandHandler("config", self.config_command))
-        self.application.add_handler(CommandHandler("toggle_autopost", self.toggle_autopost))
-        self.application.add_handler(CommandHandler("toggle_replyguy", self.toggle_replyguy))
-        self.application.add_handler(CommandHandler("toggle_away", self.toggle_away))
-        self.application.add_handler(CommandHandler("add_post", self.add_scheduled_post))
-        self.application.add_handler(CommandHandler("list_posts", self.list_posts))
-        self.application.add_handler(CommandHandler("add_reply", self.add_reply_template))
-        self.application.add_handler(CommandHandler("status", self.status_command))
-        # --- NEW: Add the /post command handler ---
-        self.application.add_handler(CommandHandler("post", self.post_command))
-        # --- END NEW ---
-
-        # Message handler for reply guy and away messages
-        self.application.add_handler(MessageHandler(
-            filters.TEXT & ~filters.COMMAND,
-            self.handle_message
-        ))
+        for handler in self._handlers():
+            self.application.add_handler(handler)
+
+        # Skip updates that were already handled (webhook retries, replays after a crash)
+        self.application.add_handler(TypeHandler(Update, self._skip_duplicate), group=-200)
+
+        # Drop update types no handler takes before any per-update work below group 0
+        self._handled_types = set(self.allowed_updates())
+        self.application.add_handler(TypeHandler(Update, self._drop_unhandled), group=-50)
+
+        # Pick up changes made by other cluster workers before handling anything
+        if self.cluster_store is not None:
+            self.application.add_handler(TypeHandler(Update, self._sync_before_update), group=-1)
+
+        # Time every handler and count every update
+        self.metrics.instrument_application(self.application)
+        self.application.add_handler(TypeHandler(Update, self.metrics.observe_update), group=-100)
+
+    def _high_water_key(self) -> str:
+        # Cluster workers each see a subset of updates, so each keeps its own mark
+        return f"update_high_water:{self.settings.WORKER_INDEX}"
+
+    async def _skip_duplicate(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        if not self.update_dedupe.check_and_mark(update.update_id):
+            self.metrics.duplicates.labels("update").inc()
+            logger.info("Skipping replayed update %s", update.update_id)
+            raise ApplicationHandlerStop
+
+    def _update_started(self, update: object):
+        if isinstance(update, Update):
+            self.update_dedupe.started(update.update_id)
+
+    def _update_finished(self, update: object):
+        # Persist only a mark every earlier update has finished by, so a crash never skips unhandled ones
+        if isinstance(update, Update) and self.update_dedupe.finished(update.update_id):
+            self.repository.save_setting(
+                self._high_water_key(), {"update_id": self.update_dedupe.completed, "at": time.time()}
+            )
+
+    async def _restore_update_floor(self):
+        """Treat updates the previous run finished as replays; only at startup, since the mark trails live work"""
+        high_water = (await self.repository.load_settings()).get(self._high_water_key())
+        if high_water and time.time() - high_water["at"] < UPDATE_HIGH_WATER_MAX_AGE:
+            self.update_dedupe.floor = max(self.update_dedupe.floor, high_water["update_id"])
+
+    async def _member_changed(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        self.lookups.invalidate(update.my_chat_member.chat)
+
+    async def _drop_unhandled(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # Only the type is checked: running every handler's filters here would run them twice per update.
+        # Telegram can still send other types, e.g. to a webhook registered with a wider allowed_updates
+        if update_type(update) not in self._handled_types:
+            raise ApplicationHandlerStop
+
+    def allowed_updates(self) -> List[str]:
+        """Update types to ask Telegram for: only those a handler can use"""
+        return allowed_updates(self.application)
+
+    @classmethod
+    def routed_updates(cls, config: Config) -> List[str]:
+        """
+        allowed_updates for a cluster front end, which only routes updates to workers.
+
+        Only the handler table is built: constructing a whole bot would open
+        its connection pool, database engine and caches for nothing.
+        """
+        admin_filter = filters.User(user_id={int(config.USER_ID), *config.ADMIN_IDS})
+        return update_types_for(cls._handler_table(cls, admin_filter))
+
+    async def unauthorized_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Admin-only commands sent by anyone else"""
+        await self.reply(update, "⛔ Unauthorized access!")
 
     async def start_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Start command handler"""
-        if update.effective_user.id != self.user_id:
-            await update.message.reply_text("⛔ Unauthorized access!")
-            return
-
         welcome_msg = """
 🤖 **TelgBot is Ready!**
 
@@ -95,15 +416,20 @@ Available commands:
 • `/toggle_replyguy` - Enable/disable reply guy mode
 • `/toggle_away` - Enable/disable away messages
 • `/add_post <text>` - Add scheduled post
+• `/schedule_post <time> <text>` - Publish a post at an exact time
 • `/list_posts` - View scheduled posts
+• `/find <words>` - Search posts
+• `/edit_post <id> <text>` - Change a post
+• `/delete_post <id>` - Delete a post
 • `/add_reply <text>` - Add reply template
 • `/status` - Check bot status
+• `/profile <seconds>` - Profile the running bot
 • `/help` - Show this help
 • `/post` - Post the next scheduled post immediately
 
 Let's automate your Telegram presence! 🚀
         """
-        await update.message.reply_text(welcome_msg, parse_mode='Markdown')
+        await self.reply(update, welcome_msg, parse_mode='Markdown')
 
     async def help_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Help command with detailed instructions"""
@@ -114,11 +440,19 @@ Let's automate your Telegram presence! 🚀
 - Automatically posts from your scheduled content
 - Set custom intervals between posts
 - Add posts with `/add_post Your amazing content here!`
+- Add media posts by sending a photo, video, document or album captioned `/add_post Caption`
+- Pin a post to a time with `/schedule_post 2025-01-31T18:00 Launch day!`
+- Bulk import: send a CSV or JSONL file with a `content` column
+- Optional import columns: `scheduled_for`, `posted_at` and `media` (paths relative to MEDIA_DIR)
+- Back up all posts with `/export_posts csv` or `/export_posts jsonl`
+- Find posts with `/find launch promo` (words or their beginnings; add `is:pending` or `is:posted`)
+- Change or remove one with `/edit_post 42 New text` or `/delete_post 42`
 
 **2. Reply Guy Mode** 💬
 - Automatically replies to messages in groups/channels
 - Customizable reply probability
 - Add custom replies with `/add_reply Your reply template`
+- Reply to keywords with `/add_reply price, how much | Check the pinned post 💰`
 
 **3. Away Messages** 🏃‍♂️
 - Auto-responds when you're unavailable
@@ -132,14 +466,12 @@ Let's automate your Telegram presence! 🚀
 4. `/toggle_away` - Set away mode
 
 Use `/config` to see current settings!
+Slow? `/profile 30` records what the bot spends its time on for 30 seconds.
         """
-        await update.message.reply_text(help_text, parse_mode='Markdown')
+        await self.reply(update, help_text, parse_mode='Markdown')
 
     async def config_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show current configuration"""
-        if update.effective_user.id != self.user_id:
-            return
-
         config_text = f"""
 ⚙️ **Current Configuration:**
 
@@ -153,164 +485,617 @@ Use `/config` to see current settings!
 • Scheduled Posts: {len(self.scheduled_posts)}
 • Reply Templates: {len(self.reply_templates)}
         """
-        await update.message.reply_text(config_text, parse_mode='Markdown')
+        await self.reply(update, config_text, parse_mode='Markdown')
 
     async def toggle_autopost(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Toggle auto posting"""
-        if update.effective_user.id != self.user_id:
-            return
-
         self.config['auto_post_enabled'] = not self.config['auto_post_enabled']
+        self.repository.save_setting('auto_post_enabled', self.config['auto_post_enabled'])
+        await self._state_changed()
         status = "enabled" if self.config['auto_post_enabled'] else "disabled"
-        await update.message.reply_text(f"📅 Auto posting {status}!")
+        await self.reply(update, f"📅 Auto posting {status}!")
 
     async def toggle_replyguy(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Toggle reply guy mode"""
-        if update.effective_user.id != self.user_id:
-            return
-
         self.config['reply_guy_enabled'] = not self.config['reply_guy_enabled']
+        self.repository.save_setting('reply_guy_enabled', self.config['reply_guy_enabled'])
+        await self._state_changed()
         status = "enabled" if self.config['reply_guy_enabled'] else "disabled"
-        await update.message.reply_text(f"💬 Reply guy mode {status}!")
+        await self.reply(update, f"💬 Reply guy mode {status}!")
 
     async def toggle_away(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Toggle away messages"""
-        if update.effective_user.id != self.user_id:
-            return
-
         self.config['away_message_enabled'] = not self.config['away_message_enabled']
+        self.repository.save_setting('away_message_enabled', self.config['away_message_enabled'])
+        await self._state_changed()
         status = "enabled" if self.config['away_message_enabled'] else "disabled"
-        await update.message.reply_text(f"🏃‍♂️ Away messages {status}!")
+        await self.reply(update, f"🏃‍♂️ Away messages {status}!")
 
     async def add_scheduled_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Add a scheduled post"""
-        if update.effective_user.id != self.user_id:
+        if not context.args:
+            await self.reply(update, "❌ Please provide post content: `/add_post Your content here`")
             return
 
-        if not context.args:
-            await update.message.reply_text("❌ Please provide post content: `/add_post Your content here`")
+        await self._add_post(update, " ".join(context.args))
+
+    async def _add_post(self, update: Update, content: str, media: tuple = ()):
+        """Store a new rotation post and confirm it"""
+        if len(self.scheduled_posts) >= self.settings.MAX_SCHEDULED_POSTS:
+            await self.reply(update, f"❌ Post limit reached ({self.settings.MAX_SCHEDULED_POSTS})")
+            return
+        if media and len(content) > MAX_CAPTION_LENGTH:
+            await self.reply(update, f"❌ Captions are limited to {MAX_CAPTION_LENGTH} characters")
             return
 
-        post_content = " ".join(context.args)
-        self.scheduled_posts.append({
-            "content": post_content,
-            "created_at": datetime.now().isoformat(),
-            "posted": False
-        })
+        post = self.scheduled_posts.add(content, media=media, post_id=await self._new_post_ids())
+        self.repository.save_post(post)
+        await self._state_changed()
 
-        await update.message.reply_text(f"✅ Added scheduled post: '{post_content[:50]}...'")
+        attached = f" with {len(media)} attachment(s)" if media else ""
+        await self.reply(update, f"✅ Added scheduled post{attached}: '{content[:50]}...'")
 
-    async def list_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """List scheduled posts"""
-        if update.effective_user.id != self.user_id:
+    async def add_media_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """A photo, video or document captioned /add_post; albums are collected first"""
+        message = update.effective_message
+        item = media_from_message(message)
+        caption = message.caption or ""
+        is_command = caption.startswith("/add_post")
+        content = caption.split(None, 1)[1].strip() if is_command and len(caption.split(None, 1)) > 1 else ""
+
+        if message.media_group_id is None:
+            await self._add_post(update, content, (item,))
+            return
+
+        # Album items arrive as separate messages; only one carries the caption
+        album = self._albums.get(message.media_group_id)
+        if album is None:
+            album = self._albums[message.media_group_id] = {"items": [], "content": None, "update": update}
+        album["items"].append((message.message_id, item))
+        if is_command:
+            album["content"] = content
+        if album.get("timer"):
+            album["timer"].cancel()
+        album["timer"] = asyncio.get_running_loop().call_later(
+            ALBUM_WAIT_SECONDS, lambda: self._spawn(self._finish_album(message.media_group_id))
+        )
+
+    async def _finish_album(self, media_group_id: str):
+        album = self._albums.pop(media_group_id, None)
+        if album is None or album["content"] is None:
+            return  # not captioned /add_post
+        media = tuple(item for _, item in sorted(album["items"], key=lambda entry: entry[0]))
+        try:
+            await self._add_post(album["update"], album["content"], media)
+        except Exception as e:
+            logger.error("Adding album %s failed: %s", media_group_id, e, exc_info=True)
+
+    def _spawn(self, coroutine, name: Optional[str] = None) -> asyncio.Task:
+        """Run ``coroutine`` in a task that is kept until it finishes and awaited on shutdown"""
+        task = asyncio.create_task(coroutine, name=name)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _resolve_media(self, media: tuple) -> tuple:
+        """``media`` with local paths made absolute; they must be files inside MEDIA_DIR"""
+        root = Path(self.settings.MEDIA_DIR).resolve()
+        resolved = []
+        for item in media:
+            if item.path is not None:
+                path = (root / item.path).resolve()
+                if not path.is_relative_to(root):
+                    raise ValueError(f"{item.path} is outside MEDIA_DIR")
+                if not path.is_file():
+                    raise ValueError(f"{item.path} not found in MEDIA_DIR")
+                item = MediaItem(item.type, path=str(path))
+            resolved.append(item)
+        return tuple(resolved)
+
+    async def schedule_post_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Add a post that is published at an exact time"""
+        if len(context.args) < 2:
+            await self.reply(update, "❌ Usage: `/schedule_post 2025-01-31T18:00 Your content here`")
+            return
+
+        try:
+            run_at = datetime.fromisoformat(context.args[0])
+        except ValueError:
+            await self.reply(update, "❌ Invalid time. Use ISO format, e.g. `2025-01-31T18:00`")
+            return
+
+        if run_at.tzinfo is None:
+            run_at = run_at.replace(tzinfo=self.timezone)
+        if run_at <= datetime.now(self.timezone):
+            await self.reply(update, "❌ That time is in the past!")
+            return
+
+        if len(self.scheduled_posts) >= self.settings.MAX_SCHEDULED_POSTS:
+            await self.reply(update, f"❌ Post limit reached ({self.settings.MAX_SCHEDULED_POSTS})")
             return
 
+        post_content = " ".join(context.args[1:])
+        post = self.scheduled_posts.add(post_content, scheduled_for=run_at.timestamp(),
+                                        post_id=await self._new_post_ids())
+        self.repository.save_post(post)
+        self._schedule_post_at(post, run_at)
+        await self._state_changed()
+
+        await self.reply(
+            update, f"✅ Post scheduled for {run_at.strftime('%Y-%m-%d %H:%M %Z')}: '{post_content[:50]}...'"
+        )
+
+    async def list_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """List scheduled posts, one page at a time"""
         if not self.scheduled_posts:
-            await update.message.reply_text("📭 No scheduled posts yet. Add some with `/add_post`!")
+            await self.reply(update, "📭 No scheduled posts yet. Add some with `/add_post`!")
+            return
+
+        text, keyboard = self._posts_page(self.scheduled_posts.page_after(0, POSTS_PAGE_SIZE))
+        await self.reply(update, text, parse_mode='Markdown', reply_markup=keyboard)
+
+    async def list_posts_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Next/previous buttons under /list_posts"""
+        query = update.callback_query
+        await query.answer()
+        if query.from_user.id not in self.admin_ids or query.message is None:
+            return
+
+        _, direction, cursor = query.data.split(':')
+        if direction == 'next':
+            page = self.scheduled_posts.page_after(int(cursor), POSTS_PAGE_SIZE)
+        else:
+            page = self.scheduled_posts.page_before(int(cursor), POSTS_PAGE_SIZE)
+        if not page:
+            return
+
+        text, keyboard = self._posts_page(page)
+        self.dispatcher.submit(
+            'edit_message_text',
+            query.message.chat_id,
+            message_id=query.message.message_id,
+            text=text,
+            parse_mode='Markdown',
+            reply_markup=keyboard,
+            priority=Priority.ADMIN,
+        )
+
+    def _posts_page(self, page: List[ScheduledPost]):
+        """Render a page of posts with buttons keyed by the first and last post ids"""
+        store = self.scheduled_posts
+        lines = [f"📋 **Scheduled Posts** ({len(store)} total, {store.pending_count} pending)", ""]
+        lines += [self._post_line(post) for post in page]
+
+        buttons = []
+        if store.page_before(page[0].id, 1):
+            buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"posts:prev:{page[0].id}"))
+        if store.page_after(page[-1].id, 1):
+            buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"posts:next:{page[-1].id}"))
+        return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+    @staticmethod
+    def _post_line(post: ScheduledPost) -> str:
+        status = "✅ Posted" if post.posted else "⏳ Pending"
+        content_preview = post.content[:40] + "..." if len(post.content) > 40 else post.content
+        attached = f"📎{len(post.media)} " if post.media else ""
+        return f"#{post.id} {attached}{escape_markdown(content_preview)} ({status})"
+
+    async def find_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Search posts by words or word beginnings; is:pending or is:posted filters by state"""
+        filters_by_state = {"is:pending": False, "is:posted": True}
+        posted = None
+        words = []
+        for arg in context.args or []:
+            if arg.lower() in filters_by_state:
+                posted = filters_by_state[arg.lower()]
+            else:
+                words.append(arg)
+        query = " ".join(words)
+        if not query:
+            await self.reply(update, "❌ Usage: `/find <words>` (add `is:pending` or `is:posted` to filter)",
+                             parse_mode='Markdown')
+            return
+
+        await self.scheduled_posts.build_index()
+        text, keyboard = self._find_page(query, posted, 0)
+        message = await self.reply(update, text, parse_mode='Markdown', reply_markup=keyboard)
+        if keyboard is not None:
+            self._searches[message.message_id] = (query, posted)
+            while len(self._searches) > FIND_SEARCHES_KEPT:
+                self._searches.popitem(last=False)
+
+    async def find_posts_page(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Next/previous buttons under /find results"""
+        query = update.callback_query
+        if query.from_user.id not in self.admin_ids or query.message is None:
+            await query.answer()
+            return
+        search = self._searches.get(query.message.message_id)
+        if search is None:
+            await query.answer("This search has expired, run /find again")
+            return
+        await query.answer()
+
+        await self.scheduled_posts.build_index()
+        text, keyboard = self._find_page(*search, int(query.data.split(':')[1]))
+        self.dispatcher.submit(
+            'edit_message_text',
+            query.message.chat_id,
+            message_id=query.message.message_id,
+            text=text,
+            parse_mode='Markdown',
+            reply_markup=keyboard,
+            priority=Priority.ADMIN,
+        )
+
+    def _find_page(self, query: str, posted: Optional[bool], offset: int):
+        """Render one page of /find results with buttons keyed by offset"""
+        total, page = self.scheduled_posts.search(query, offset, POSTS_PAGE_SIZE, posted)
+        if not page:
+            return f"🔎 No posts match '{escape_markdown(query)}'", None
+
+        lines = [f"🔎 **Posts matching** '{escape_markdown(query)}' "
+                 f"({offset + 1}-{offset + len(page)} of {total})", ""]
+        lines += [self._post_line(post) for post in page]
+        buttons = []
+        if offset > 0:
+            buttons.append(InlineKeyboardButton("⬅️ Prev", callback_data=f"find:{max(offset - POSTS_PAGE_SIZE, 0)}"))
+        if offset + len(page) < total:
+            buttons.append(InlineKeyboardButton("Next ➡️", callback_data=f"find:{offset + len(page)}"))
+        return "\n".join(lines), InlineKeyboardMarkup([buttons]) if buttons else None
+
+    async def _new_post_ids(self, count: int = 1) -> int:
+        """Reserve ids for new posts; returns the first. Deleted ids are never handed out again"""
+        return await self.repository.allocate_ids("posts", count, floor=self.scheduled_posts.last_id)
+
+    def _post_from_args(self, args: List[str]) -> Optional[ScheduledPost]:
+        """The post whose id is the first command argument"""
+        if not args or not args[0].lstrip('#').isdigit():
+            return None
+        return self.scheduled_posts.get(int(args[0].lstrip('#')))
+
+    async def edit_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Replace the text of a post"""
+        post = self._post_from_args(context.args)
+        if post is None or len(context.args) < 2:
+            await self.reply(update, "❌ Usage: `/edit_post <id> <new text>` with the id from `/find` or `/list_posts`",
+                             parse_mode='Markdown')
+            return
+        content = " ".join(context.args[1:])
+        if post.media and len(content) > MAX_CAPTION_LENGTH:
+            await self.reply(update, f"❌ Captions are limited to {MAX_CAPTION_LENGTH} characters")
+            return
+
+        self.scheduled_posts.edit(post, content)
+        self.repository.save_post(post)
+        await self._state_changed()
+        await self.reply(update, f"✏️ Updated post #{post.id}")
+
+    async def delete_post(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Delete a post"""
+        post = self._post_from_args(context.args)
+        if post is None:
+            await self.reply(update, "❌ Usage: `/delete_post <id>` with the id from `/find` or `/list_posts`",
+                             parse_mode='Markdown')
+            return
+        if post.id in self._publishing:
+            await self.reply(update, f"❌ Post #{post.id} is being published right now")
             return
 
-        posts_text = "📋 **Scheduled Posts:**\n\n"
-        for i, post in enumerate(self.scheduled_posts[:10], 1):
-            status = "✅ Posted" if post['posted'] else "⏳ Pending"
-            content_preview = post['content'][:40] + "..." if len(post['content']) > 40 else post['content']
-            posts_text += f"{i}. {content_preview} ({status})\n"
+        self.scheduled_posts.remove(post.id)
+        self.repository.delete_post(post.id)
+        self.fanout.delete(post.id)
+        job = self._pinned_jobs.pop(post.id, None)
+        if job is not None:
+            self.scheduler.cancel(job)
+        await self._state_changed()
+        await self.reply(update, f"🗑 Deleted post #{post.id}")
+
+    async def import_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Bulk-add posts from a CSV or JSONL document"""
+        document = update.effective_message.document
+        fmt = detect_format(document.file_name)
+        if document.file_size and document.file_size > MAX_DOWNLOAD_BYTES:
+            await self.reply(update, "❌ File is too large; bots can download at most 20 MB. Split it up and retry.")
+            return
 
-        if len(self.scheduled_posts) > 10:
-            posts_text += f"\n... and {len(self.scheduled_posts) - 10} more posts"
+        status = await self.reply(update, f"⏳ Importing posts from {document.file_name}...")
+        chat_id = update.effective_chat.id
 
-        await update.message.reply_text(posts_text, parse_mode='Markdown')
+        def progress(text: str):
+            self.dispatcher.submit('edit_message_text', chat_id, message_id=status.message_id,
+                                   text=text, priority=Priority.ADMIN)
+
+        added = 0
+        post_ids = iter(())
+        errors = []
+        error_count = 0
+        limit_reached = False
+        last_progress = time.monotonic()
+        try:
+            file = await context.bot.get_file(document.file_id)
+            async for line, record in parse_posts(self._download(file.file_path), fmt, self.timezone):
+                if isinstance(record, str):
+                    error_count += 1
+                    if len(errors) < 5:
+                        errors.append(f"line {line}: {record}")
+                    continue
+                if len(self.scheduled_posts) >= self.settings.MAX_SCHEDULED_POSTS:
+                    limit_reached = True
+                    break
+                try:
+                    media = self._resolve_media(record.media)
+                except ValueError as e:
+                    error_count += 1
+                    if len(errors) < 5:
+                        errors.append(f"line {line}: {e}")
+                    continue
+
+                post_id = next(post_ids, None)
+                if post_id is None:
+                    # Ids are reserved a batch at a time; ones left over when the import stops stay unused
+                    first = await self._new_post_ids(IMPORT_BATCH_SIZE)
+                    post_ids = iter(range(first + 1, first + IMPORT_BATCH_SIZE))
+                    post_id = first
+                post = self.scheduled_posts.add(record.content, scheduled_for=record.scheduled_for, media=media,
+                                                post_id=post_id, posted_at=record.posted_at)
+                self.repository.save_post(post)
+                if post.scheduled_for is not None and not post.posted:
+                    self._schedule_post_at(post, datetime.fromtimestamp(post.scheduled_for, self.timezone))
+                added += 1
+
+                if added % IMPORT_BATCH_SIZE == 0:
+                    await self.repository.flush()
+                    if time.monotonic() - last_progress >= IMPORT_PROGRESS_INTERVAL:
+                        last_progress = time.monotonic()
+                        progress(f"⏳ Imported {added} posts so far ({error_count} skipped)...")
+        except Exception as e:
+            logger.error("Import of %s failed after %d posts: %s", document.file_name, added, e)
+            errors.insert(0, f"stopped early: {e}")
+        finally:
+            await self.repository.flush()
+            if added:
+                await self._state_changed()
+
+        summary = [f"✅ Imported {added} posts from {document.file_name}"]
+        if error_count:
+            summary.append(f"⚠️ Skipped {error_count} invalid rows")
+        if limit_reached:
+            summary.append(f"⛔ Stopped at the post limit ({self.settings.MAX_SCHEDULED_POSTS})")
+        summary.extend(f"• {error}" for error in errors)
+        progress("\n".join(summary))
+
+    async def _download(self, file_path: str):
+        """Yield a Telegram file in chunks; local Bot API servers return a path on disk"""
+        if file_path.startswith(('http://', 'https://')):
+            async for chunk in self.request.iter_bytes(file_path):
+                yield chunk
+            return
+        with open(file_path, 'rb') as f:
+            while chunk := await asyncio.to_thread(f.read, 64 * 1024):
+                yield chunk
+
+    async def export_posts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Send every post as a CSV or JSONL file"""
+        fmt = (context.args[0].lower() if context.args else 'csv').lstrip('.')
+        if fmt not in ('csv', 'jsonl'):
+            await self.reply(update, "❌ Usage: `/export_posts csv` or `/export_posts jsonl`")
+            return
+        if not self.scheduled_posts:
+            await self.reply(update, "📭 No scheduled posts to export.")
+            return
+
+        # Rows are written off the event loop from a snapshot of the store
+        posts = list(self.scheduled_posts)
+
+        def write(path: Path) -> int:
+            with open(path, 'wb') as out:
+                return write_export(posts, fmt, out, self.timezone)
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Sent by path so a retried upload re-reads the file from the start
+            path = Path(directory) / f"posts-{datetime.now(self.timezone):%Y%m%d-%H%M}.{fmt}"
+            count = await asyncio.to_thread(write, path)
+            await self.dispatcher.submit(
+                'send_document',
+                update.effective_chat.id,
+                document=path,
+                caption=f"📦 {count} posts",
+                priority=Priority.ADMIN,
+            )
 
     async def add_reply_template(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Add a reply template"""
-        if update.effective_user.id != self.user_id:
+        if not context.args:
+            await self.reply(
+                update,
+                "❌ Please provide reply template: `/add_reply Your reply here`\n"
+                "Reply only to certain words with `/add_reply price, how much | See the pinned post 💰`",
+            )
             return
 
-        if not context.args:
-            await update.message.reply_text("❌ Please provide reply template: `/add_reply Your reply here`")
+        if len(self.reply_templates) >= self.settings.MAX_REPLY_TEMPLATES:
+            await self.reply(update, f"❌ Reply template limit reached ({self.settings.MAX_REPLY_TEMPLATES})")
+            return
+
+        # Optional trigger keywords go before a '|'
+        triggers, _, reply_content = " ".join(context.args).rpartition("|")
+        template = ReplyTemplate(reply_content.strip(), parse_triggers(triggers))
+        if not template.content:
+            await self.reply(update, "❌ The reply text after '|' is empty")
             return
 
-        reply_content = " ".join(context.args)
-        self.reply_templates.append(reply_content)
+        position = self.reply_templates.add(template)
+        self.repository.save_reply_template(position, template)
+        await self._state_changed()
 
-        await update.message.reply_text(f"✅ Added reply template: '{reply_content}'")
+        if template.triggers:
+            await self.reply(update, f"✅ Added reply for {', '.join(template.triggers)}: '{template.content}'")
+        else:
+            await self.reply(update, f"✅ Added reply template: '{template.content}'")
 
     async def status_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Show bot status"""
-        if update.effective_user.id != self.user_id:
-            return
-
-        uptime = datetime.now()  # You'd track actual uptime in a real implementation
-        pending_posts = len([p for p in self.scheduled_posts if not p['posted']])
+        stats = self.metrics.summary()
+        uptime = timedelta(seconds=int(stats['uptime']))
+        pending_posts = self.scheduled_posts.pending_count
+        next_auto_post = self.auto_post_schedule.next_run if self.auto_post_schedule else None
+        if not self.config['auto_post_enabled']:
+            next_auto_post_text = 'Disabled'
+        elif next_auto_post:
+            next_auto_post_text = next_auto_post.astimezone(self.timezone).strftime('%Y-%m-%d %H:%M %Z')
+        else:
+            next_auto_post_text = 'Not scheduled'
 
         status_text = f"""
 🤖 **Bot Status Report**
 
 🟢 Status: Online and Active
-⏰ Last Check: {uptime.strftime('%H:%M:%S')}
+⏰ Uptime: {uptime}
 
 📊 **Activity:**
 • Pending Posts: {pending_posts}
-• Away Messages Sent Today: {len(self.away_message_sent)}
+• Away Messages Sent Today: {await self.away_message_sent.count()}
 • Total Reply Templates: {len(self.reply_templates)}
 
+📈 **Performance:**
+• Updates Handled: {int(stats['updates'])}
+• Avg Handler Time: {stats['avg_handler_ms']:.1f} ms
+• Handler Errors: {int(stats['handler_errors'])}
+• Messages Sent: {int(stats['sent'])} ({int(stats['send_errors'])} failed, {int(stats['retry_after'])} rate limited)
+• Outbound Queue: {int(stats['outbound_queue'])}
+• Shed Under Load: {int(stats['shed'])}{' (shedding now)' if self.update_processor.shedding else ''}
+• Media Cache: {len(self.media_cache)} files ({self.media_cache.hits} reused, {self.media_cache.uploads} uploaded)
+• Lookup Cache: {len(self.lookups)} entries ({self.lookups.hits} hits, {self.lookups.misses} misses)
+• Event Loop Stalls: {self.watchdog.stalls if self.watchdog is not None else 'Not watched'}
+
 🔄 **Next Actions:**
-• Auto Post: {'In ' + str(self.config['post_interval_hours']) + 'h' if self.config['auto_post_enabled'] else 'Disabled'}
+• Auto Post: {next_auto_post_text}
 • Reply Monitoring: {'Active' if self.config['reply_guy_enabled'] else 'Inactive'}
         """
-        await update.message.reply_text(status_text, parse_mode='Markdown')
+        await self.reply(update, status_text, parse_mode='Markdown')
 
-    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
-        """Handle incoming messages for reply guy and away messages"""
-        # Skip if message is from bot owner
-        if update.effective_user.id == self.user_id:
+    async def profile_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Profile the event loop for a while and send the top functions and the profile file"""
+        arg = context.args[0] if context.args else str(PROFILE_DEFAULT_SECONDS)
+        try:
+            seconds = float(arg)
+        except ValueError:
+            seconds = 0
+        if not 0 < seconds <= self.profiler.max_seconds:
+            await self.reply(update, f"❌ Usage: `/profile <seconds>` (up to {self.profiler.max_seconds:g})",
+                             parse_mode='Markdown')
+            return
+        if self.profiler.running:
+            await self.reply(update, "❌ A profile is already being captured")
             return
 
+        await self.reply(update, f"⏱ Profiling for {seconds:g}s...")
+        # Captured off the update path, so this chat's next commands run (and show up) meanwhile
+        self._spawn(self._send_profile(update, seconds), name=PROFILE_TASK_NAME)
+
+    async def _send_profile(self, update: Update, seconds: float):
+        try:
+            stats = await self.profiler.capture(seconds)
+        except ProfilerBusy:
+            await self.reply(update, "❌ A profile is already being captured")
+            return
+        except Exception as e:
+            logger.error("Profiling failed: %s", e, exc_info=True)
+            await self.reply(update, f"❌ Profiling failed: {e}")
+            return
+
+        busy = stats.total_tt - idle_seconds(stats)
+        lines = [f"⏱ Event loop busy {busy:.2f}s of {seconds:g}s ({stats.total_calls:,} calls)",
+                 "", "own s   cum s     calls  function"]
+        for name, calls, own, cumulative in top_functions(stats, PROFILE_TOP_FUNCTIONS):
+            lines.append(f"{own:6.3f} {cumulative:7.3f} {calls:9,}  {name}")
+        await self.reply(update, "\n".join(lines))
+
+        with tempfile.TemporaryDirectory() as directory:
+            # Open with `python -m pstats` or snakeviz
+            path = Path(directory) / f"profile-{datetime.now(self.timezone):%Y%m%d-%H%M%S}.prof"
+            await asyncio.to_thread(stats.dump_stats, path)
+            await self.dispatcher.submit(
+                'send_document',
+                update.effective_chat.id,
+                document=path,
+                caption=f"📈 {seconds:g}s cProfile",
+                priority=Priority.ADMIN,
+            )
+
+    def _importance(self, update: Update) -> Importance:
+        """Admins always get through; messages that can only trigger reply-guy work go first"""
+        user = update.effective_user
+        if user is not None and user.id in self.admin_ids:
+            return Importance.ESSENTIAL
+        if update.message is not None and not self.config['away_message_enabled']:
+            return Importance.OPTIONAL
+        return Importance.NORMAL
+
+    @staticmethod
+    def _reply_key(kind: str, update: Update) -> str:
+        """Idempotency key of an automatic reply: at most one of each kind per message"""
+        return f"{kind}:{update.effective_chat.id}:{update.effective_message.message_id}"
+
+    async def handle_message(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Handle incoming messages for reply guy and away messages"""
         # Away message logic
         if self.config['away_message_enabled']:
             user_id = update.effective_user.id
-            today = datetime.now().date().isoformat()
 
             # Send away message once per user per day
-            if user_id not in self.away_message_sent or self.away_message_sent[user_id] != today:
+            if await self.away_message_sent.check_and_mark(user_id):
                 away_message = random.choice(self.away_messages)
-                await update.message.reply_text(away_message)
-                self.away_message_sent[user_id] = today
+                self.reply(update, away_message, priority=Priority.REPLY, key=self._reply_key("away", update))
+                if not self.away_message_sent.persistent:
+                    self.repository.mark_away_message(user_id, datetime.now(self.timezone).date())
 
         # Reply guy logic
         if self.config['reply_guy_enabled'] and random.random() < self.config['reply_probability']:
-            # Add some delay to seem more natural
-            await asyncio.sleep(random.uniform(1, 5))
+            if self.update_processor.shedding:
+                self.update_processor.count_shed("reply_guy")
+                return
+            reply = self.reply_templates.choose(update.effective_message.text or "")
+            if reply is None:
+                return
+
+            async def send_reply():
+                self.reply(update, reply, priority=Priority.REPLY, key=self._reply_key("reply", update))
 
-            reply = random.choice(self.reply_templates)
-            await update.message.reply_text(reply)
+            # Add some delay to seem more natural, without holding up other updates
+            delay = random.uniform(self.settings.REPLY_DELAY_MIN, self.settings.REPLY_DELAY_MAX)
+            self.deferred_replies.defer(delay, send_reply)
 
     # --- NEW: post_command function ---
     async def post_command(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Immediately posts the next scheduled post."""
-        if update.effective_user.id != self.user_id:
-            await update.message.reply_text("⛔ Unauthorized access!")
-            return
-
-        logger.info(f"Received /post command from user {update.effective_user.id}. Attempting to post.")
-
-        unposted = [p for p in self.scheduled_posts if not p['posted']]
+        logger.info("Received /post command from user %s. Attempting to post.", update.effective_user.id)
 
-        if not unposted:
-            await update.message.reply_text("🤔 No unposted content available to post manually.")
+        if self.scheduled_posts.next_pending() is None:
+            await self.reply(update, "🤔 No unposted content available to post manually.")
             return
 
         try:
             # Call the auto_post_job directly to handle the posting logic
             # This function needs to be awaited since it's an async function
-            await self.auto_post_job()
-            await update.message.reply_text("✅ Posted the next scheduled content!")
+            deliveries = await self.auto_post_job() or []
+            failed = [d for d in deliveries if d.state == DeliveryState.FAILED]
+            if not failed:
+                await self.reply(update, f"✅ Posted the next scheduled content to {len(deliveries)} chat(s)!")
+            else:
+                details = "\n".join(f"• {d.chat_id}: {d.error}" for d in failed)
+                await self.reply(
+                    update,
+                    f"⚠️ Posted to {len(deliveries) - len(failed)} of {len(deliveries)} chat(s). Failed:\n{details}",
+                )
         except Exception as e:
-            logger.error(f"Error while manually posting: {e}")
-            await update.message.reply_text(f"❌ Failed to post content: {e}")
+            logger.error("Error while manually posting: %s", e)
+            await self.reply(update, f"❌ Failed to post content: {e}")
 
     # --- END NEW ---
 
-    async def auto_post_job(self):
+    async def auto_post_job(self) -> Optional[List[TargetDelivery]]:
         """Job function for auto posting"""
         if not self.config['auto_post_enabled'] or not self.scheduled_posts:
             # If auto_post_enabled is False, this job should not run automatically
@@ -325,57 +1110,377 @@ Use `/config` to see current settings!
                  logger.info("Auto post job running (manually triggered), though auto-posting is disabled.")
 
 
-        # Find next unposted content
-        unposted = [p for p in self.scheduled_posts if not p['posted']]
-        if not unposted:
+        # Find the oldest unposted content; posts pinned to a time are published by their own job
+        post = self.scheduled_posts.next_pending()
+        if post is None:
             logger.info("Auto post job skipped: No unposted content available.")
-            return
+            return None
 
-        # Post the oldest unposted content
-        post = unposted[0]
-        try:
-            # Post to your own chat or channel (you'll need to specify chat_id)
-            # For demo purposes, we'll just log it
-            logger.info(f"Attempting to send auto post: {post['content']}")
-            
-            # --- IMPORTANT: Replace YOUR_CHANNEL_ID with the actual chat ID you want to post to ---
-            # await self.bot.send_message(chat_id=YOUR_CHANNEL_ID, text=post['content'])
-            # For now, let's simulate sending if you don't have a specific chat_id
-            await self.bot.send_message(chat_id=self.user_id, text=f"**Auto Post Simulation (to you):**\n\n{post['content']}", parse_mode='Markdown')
-            logger.info(f"Successfully simulated posting: '{post['content'][:50]}...'")
-
-            # Mark as posted
-            post['posted'] = True
-            post['posted_at'] = datetime.now().isoformat()
+        return await self.publish_post(post)
 
+    def post_targets(self) -> List:
+        """TARGET_CHANNEL and TARGET_GROUPS; the owner's chat if none are configured"""
+        targets = [self.settings.TARGET_CHANNEL] if self.settings.TARGET_CHANNEL else []
+        targets += self.settings.TARGET_GROUPS
+        return list(dict.fromkeys(parse_chat_id(t) for t in targets)) or [self.user_id]
+
+    async def _checked_targets(self) -> Tuple[List, List[TargetDelivery]]:
+        """
+        Post targets with @usernames resolved to chat ids, and the targets
+        the bot has no permission to post to, as failed deliveries.
+
+        Targets that cannot be looked up are kept; sending to them reports
+        the actual error.
+        """
+        targets = self.post_targets()
+        if targets == [self.user_id]:
+            return targets, []
+        targets = list(dict.fromkeys(await asyncio.gather(*(self.lookups.resolve(t) for t in targets))))
+        allowed = await asyncio.gather(*(self.lookups.can_post(t) for t in targets))
+        skipped = [TargetDelivery(t, DeliveryState.FAILED, error="bot may not post here")
+                   for t, ok in zip(targets, allowed) if ok is False]
+        for delivery in skipped:
+            logger.warning("Skipping %s: the bot may not post there", delivery.chat_id)
+        return [t for t, ok in zip(targets, allowed) if ok is not False], skipped
+
+    async def publish_post(self, post: ScheduledPost) -> Optional[List[TargetDelivery]]:
+        """
+        Send a post to every target at once and mark it as posted.
+
+        The post counts as posted once every target has either received it or
+        used up its retry budget; sends are durable, so an interrupted post
+        resumes after a restart with the targets still outstanding.
+        """
+        if post.posted or post.id in self._publishing:
+            return None
+
+        logger.debug("Attempting to send auto post %s: %.50r", post.id, post.content)
+        self._publishing.add(post.id)
+        try:
+            targets, skipped = await self._checked_targets()
+            if targets == [self.user_id]:
+                text = f"**Auto Post Simulation (to you):**\n\n{post.content}"
+            else:
+                text = post.content
+            if post.media:
+                deliveries = await self.fanout.publish(
+                    post.id, targets, "send_media_post",
+                    media=[item.to_dict() for item in post.media],
+                    caption=post.content or None, parse_mode='Markdown',
+                )
+            else:
+                deliveries = await self.fanout.publish(post.id, targets, "send_message", text=text, parse_mode='Markdown')
+            deliveries += skipped
+
+            failed = sum(1 for delivery in deliveries if delivery.state == DeliveryState.FAILED)
+            if failed:
+                logger.warning("Post %s reached %d of %d chats", post.id, len(deliveries) - failed, len(deliveries))
+            else:
+                logger.info("Posted scheduled post %s to %d chats", post.id, len(deliveries))
+
+            # A cluster sync may have reloaded the store (or another worker deleted the post) meanwhile
+            current = self.scheduled_posts.get(post.id)
+            if current is not None:
+                self.scheduled_posts.mark_posted(current)
+                self.repository.save_post(current)
+            self.fanout.forget(post.id)
+            await self._state_changed()
+            return deliveries
+        finally:
+            self._publishing.discard(post.id)
+
+    async def _resume_publish(self, post: ScheduledPost):
+        """Finish a post whose publishing was interrupted by a restart"""
+        try:
+            await self.publish_post(post)
         except Exception as e:
-            logger.error(f"Error in auto posting (message: '{post['content'][:50]}...'): {e}")
+            logger.error("Resuming post %s failed: %s", post.id, e, exc_info=True)
 
+    def is_leader(self) -> bool:
+        """Whether this process runs scheduled posts (always true outside a cluster)"""
+        return self.leader is None or self.leader.is_leader
 
-    def run_scheduler(self):
-        """Run the scheduler for auto posting"""
-        # Ensure the scheduler task is created as an asyncio task
-        # This lambda ensures auto_post_job is awaited correctly
-        schedule.every(self.config['post_interval_hours']).hours.do(
-            lambda: asyncio.create_task(self.auto_post_job())
-        )
+    async def scheduled_auto_post(self):
+        """Scheduler entry point for the recurring auto post"""
+        if not self.is_leader():
+            return
+        await self.sync_shared_state(max_age=0)
+        if not self.config['auto_post_enabled']:
+            logger.info("Auto post job skipped: auto-posting is disabled.")
+            return
+        await self.auto_post_job()
+
+    def _schedule_post_at(self, post: ScheduledPost, run_at: datetime):
+        """Register a one-off job that publishes ``post`` at ``run_at``"""
+        post_id = post.id
 
-        while True:
-            schedule.run_pending()
-            time.sleep(60)  # Check every minute
+        async def publish():
+            self._pinned_jobs.pop(post_id, None)
+            if not self.is_leader():
+                return
+            await self.sync_shared_state(max_age=0)
+            # Look the post up at fire time; the store may have been reloaded since
+            pinned = self.scheduled_posts.get(post_id)
+            if pinned is not None:
+                await self.publish_post(pinned)
+
+        previous = self._pinned_jobs.pop(post_id, None)
+        if previous is not None:
+            self.scheduler.cancel(previous)
+        self._pinned_jobs[post_id] = self.scheduler.add_job(publish, DateTrigger(run_at), name="scheduled_post")
+
+    async def sync_shared_state(self, max_age: float = 1.0, wait: bool = True):
+        """
+        Reload state from the database if another cluster worker changed it.
+
+        The reload runs in the background; with ``wait=False`` the caller
+        goes on with the state it has instead of waiting for it.
+        """
+        if self.cluster_store is None:
+            return
+        if time.monotonic() - self._state_checked_at >= max_age:
+            self._state_checked_at = time.monotonic()
+            version = await self.cluster_store.get(self._state_version_key())
+            if version != self._state_version:
+                self._state_version = version
+                self._start_reload()
+        if wait and self._reload is not None and not self._reload.done():
+            await asyncio.shield(self._reload)
+
+    def _start_reload(self):
+        if self._reload is not None and not self._reload.done():
+            # The running reload may have read the database before this change
+            self._reload_again = True
+            return
+        self._reload = self._spawn(self._reload_state())
+
+    async def _reload_state(self):
+        try:
+            self._reload_again = True
+            while self._reload_again:
+                self._reload_again = False
+                await self.repository.flush()
+                await self.load_state()
+        except Exception as e:
+            logger.error("Reloading shared state failed: %s", e)
+            # Retry on the next check
+            self._state_version = None
+
+    async def _state_changed(self):
+        """Announce a local state change to the other cluster workers"""
+        if self.cluster_store is None:
+            return
+        # Commit first so workers that see the new version also see the data
+        await self.repository.flush()
+        self._state_version = str(await self.cluster_store.incr(self._state_version_key()))
+        if self._reload is not None and not self._reload.done():
+            # A reload in progress could replace the store with a copy read before this change
+            self._reload_again = True
+
+    def _state_version_key(self) -> str:
+        return f"telgbot:{self.bot_id}:state_version"
+
+    async def _sync_before_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        # Updates are handled with the state at hand while a reload catches up
+        await self.sync_shared_state(wait=False)
+
+    def _auto_post_trigger(self):
+        """Build the recurring auto post trigger from config"""
+        if self.settings.POST_CRON:
+            return CronTrigger(self.settings.POST_CRON, self.timezone)
+        return IntervalTrigger(timedelta(hours=self.config['post_interval_hours']))
+
+    async def load_state(self):
+        """Load persisted posts, templates, settings and today's away messages"""
+        settings = await self.repository.load_settings()
+        self.config.update({key: value for key, value in settings.items() if not key.startswith("update_high_water:")})
+
+        templates = await self.repository.load_reply_templates()
+        if templates:
+            self.reply_templates = ReplyMatcher(templates)
+        else:
+            for position, template in enumerate(self.reply_templates):
+                self.repository.save_reply_template(position, template)
+
+        if not self.away_message_sent.persistent:
+            today = datetime.now(self.timezone).date()
+            self.away_message_sent.seed(today, await self.repository.load_away_messages(today))
+
+        self.scheduled_posts = PostStore()
+        self.scheduled_posts.load(await self.repository.load_posts())
+        self.media_cache.load(await self.repository.load_media_files())
+
+        # Delivery state of posts that were being published when the bot stopped
+        unposted = [post.id for post in self.scheduled_posts if not post.posted and post.id not in self._publishing]
+        for post_id, deliveries in (await self.repository.load_deliveries(unposted)).items():
+            self.fanout.load(post_id, deliveries)
+
+        # Re-arm pinned posts; ones missed while offline go out right away
+        for job in self._pinned_jobs.values():
+            self.scheduler.cancel(job)
+        self._pinned_jobs.clear()
+        soon = datetime.now(self.timezone) + timedelta(seconds=5)
+        for post in self.scheduled_posts.pinned():
+            run_at = datetime.fromtimestamp(post.scheduled_for, self.timezone)
+            self._schedule_post_at(post, max(run_at, soon))
+
+        logger.info("📦 Loaded %d posts and %d reply templates", len(self.scheduled_posts), len(self.reply_templates))
+
+    async def _post_init(self, application: Application):
+        """Start background services once the Application is initialized"""
+        # Watch the loop from the start, so slow state loading is caught too
+        if self.watchdog is not None and self.shared is None:
+            await self.watchdog.start()
+        await self.repository.open()
+        await self._restore_update_floor()
+        await self.load_state()
+        if self.leader is not None:
+            await self.leader.start()
+        await self.dispatcher.start()
+        # Resume posts that were mid-publish, reusing the sends replayed from the outbox
+        interrupted = self.fanout.adopt(await self.dispatcher.restore())
+        interrupted.update(self.fanout.in_progress())
+        for post_id in sorted(interrupted):
+            post = self.scheduled_posts.get(post_id)
+            if post is not None and not post.posted:
+                self._spawn(self._resume_publish(post))
+        self.auto_post_schedule = self.scheduler.add_job(
+            self.scheduled_auto_post, self._auto_post_trigger(), name="auto_post"
+        )
+        # A TenantRunner starts the scheduler its tenants share
+        if self.shared is None:
+            await self.scheduler.start()
+        if self.shared is None and (
+            self.settings.METRICS_ENABLED or self.settings.use_webhook() or self.settings.CLUSTER_MODE == 'worker'
+        ):
+            await self.http_server.start()
+
+    async def _post_stop(self, application: Application):
+        """Stop background services after the Application has stopped"""
+        if self.shared is None:
+            await self.http_server.stop()
+            await self.scheduler.stop()
+        else:
+            # The scheduler keeps running for the other tenants; drop only our jobs
+            for job in [self.auto_post_schedule, *self._pinned_jobs.values()]:
+                if job is not None:
+                    self.scheduler.cancel(job)
+            self._pinned_jobs.clear()
+        if self.leader is not None:
+            await self.leader.stop()
+        # A capture may have minutes left; don't wait it out
+        for task in self._tasks:
+            if task.get_name() == PROFILE_TASK_NAME:
+                task.cancel()
+        for album in self._albums.values():
+            album["timer"].cancel()
+        self._albums.clear()
+        await self.deferred_replies.stop()
+        await self.dispatcher.stop()
+        # With the dispatcher stopped their sends are cancelled (durable ones resume on the next start)
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        await self.repository.close()
+        if self.shared is None:
+            await close_redis()
+            if self.watchdog is not None:
+                await self.watchdog.stop()
 
     def run(self):
         """Start the bot"""
         logger.info("🚀 Starting Telegram Auto Bot...")
 
-        # Start scheduler in background
-        import threading
-        scheduler_thread = threading.Thread(target=self.run_scheduler, daemon=True)
-        scheduler_thread.start()
-
         # Start bot
         # This will block until the bot is stopped
-        self.application.run_polling(allowed_updates=Update.ALL_TYPES)
+        if self.settings.CLUSTER_MODE == 'worker':
+            asyncio.run(self.run_worker())
+        elif self.settings.use_webhook():
+            asyncio.run(self.run_webhook())
+        else:
+            self.application.run_polling(allowed_updates=self.allowed_updates())
+
+    async def run_webhook(self):
+        """Receive updates through a webhook served on Config.PORT"""
+        webhook_url = self.settings.WEBHOOK_URL
+        # Telegram echoes this token back in a header so forged requests can be rejected
+        secret_token = self.settings.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+
+        self.http_server.add_route(webhook_path(webhook_url), secret_token, self.application)
+
+        async def register_webhook():
+            await self.application.bot.set_webhook(
+                url=webhook_url,
+                secret_token=secret_token,
+                allowed_updates=self.allowed_updates(),
+            )
+            logger.info("🔗 Webhook set to %s", webhook_url)
+
+        # Leave the webhook registered on shutdown so Telegram queues updates across restarts
+        await self._serve(register_webhook)
+
+    async def run_worker(self):
+        """Serve as one cluster worker, receiving updates routed by chat"""
+        logger.info("🧩 Worker %d listening on port %d", self.settings.WORKER_INDEX, self.settings.PORT)
+        add_worker_route(self.http_server, self.settings, self.application)
+        await self._serve()
+
+    async def start_tenant(self):
+        """Start next to other bots in a TenantRunner, on its loop, pool and HTTP server"""
+        await self.application.initialize()
+        try:
+            await self._post_init(self.application)
+            await self.application.start()
+            if self.settings.use_webhook():
+                secret_token = self.settings.WEBHOOK_SECRET or secrets.token_urlsafe(32)
+                self.http_server.add_route(webhook_path(self.settings.WEBHOOK_URL), secret_token, self.application)
+                await self.application.bot.set_webhook(
+                    url=self.settings.WEBHOOK_URL,
+                    secret_token=secret_token,
+                    allowed_updates=self.allowed_updates(),
+                )
+            else:
+                await self.application.updater.start_polling(allowed_updates=self.allowed_updates())
+        except BaseException:
+            await self.stop_tenant()
+            raise
+
+    async def stop_tenant(self):
+        """Stop a bot started with ``start_tenant``; the shared resources keep running"""
+        if self.settings.use_webhook():
+            self.http_server.remove_route(webhook_path(self.settings.WEBHOOK_URL))
+        elif self.application.updater.running:
+            await self.application.updater.stop()
+        if self.application.running:
+            await self.application.stop()
+        await self._post_stop(self.application)
+        await self.application.shutdown()
+
+    def stop(self):
+        """Ask a running webhook or worker server to shut down"""
+        if self._stop_event is not None:
+            self._stop_event.set()
+
+    async def _serve(self, on_started=None):
+        """Run the Application behind ``self.http_server`` until SIGINT/SIGTERM or ``stop()``"""
+        stop_event = self._stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:  # Windows
+                pass
+
+        async with self.application:
+            await self._post_init(self.application)
+            await self.application.start()
+            if on_started is not None:
+                await on_started()
+
+            try:
+                await stop_event.wait()
+            finally:
+                await self.application.stop()
+                await self._post_stop(self.application)
 
 # Usage example (This part is in your main.py now, but included for completeness if testing bot.py directly)
 if __name__ == "__main__":
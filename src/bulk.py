@@ -0,0 +1,211 @@
+"""
+Streaming CSV/JSONL import and export of scheduled posts
+"""
+
+import codecs
+import csv
+import io
+import json
+import time
+from dataclasses import dataclass
+from datetime import datetime, tzinfo
+from typing import AsyncIterator, BinaryIO, Iterable, List, Optional, Tuple, Union
+
+from .posts import MAX_CAPTION_LENGTH, MediaItem, ScheduledPost, parse_media
+
+FORMATS = ("csv", "jsonl")
+
+# Telegram rejects longer text messages
+MAX_POST_LENGTH = 4096
+
+# Column names accepted for the publish time
+TIME_COLUMNS = ("scheduled_for", "publish_at", "time")
+
+
+@dataclass(slots=True)
+class PostRecord:
+    """One validated row of an import"""
+
+    content: str
+    scheduled_for: Optional[float] = None
+    media: Tuple[MediaItem, ...] = ()
+    # Set for posts that already went out, e.g. in a re-imported export
+    posted_at: Optional[float] = None
+
+
+def detect_format(file_name: Optional[str]) -> Optional[str]:
+    """Import/export format from a file name, or None if unsupported"""
+    extension = (file_name or "").rsplit(".", 1)[-1].lower()
+    if extension == "csv":
+        return "csv"
+    if extension in ("jsonl", "ndjson"):
+        return "jsonl"
+    return None
+
+
+async def iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """Decode UTF-8 chunks incrementally and yield lines with their line endings"""
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    buffer = ""
+    async for chunk in chunks:
+        # The last piece may be an incomplete line; keep it for the next chunk
+        *lines, buffer = (buffer + decoder.decode(chunk)).split("\n")
+        for line in lines:
+            yield line + "\n"
+    buffer += decoder.decode(b"", final=True)
+    if buffer:
+        yield buffer
+
+
+async def _csv_rows(lines: AsyncIterator[str]) -> AsyncIterator[Tuple[int, List[str]]]:
+    """Yield (line number, fields); quoted fields may span several lines"""
+    record = ""
+    start = 0
+    number = 0
+    async for line in lines:
+        number += 1
+        if not record:
+            start = number
+        record += line
+        # A record is complete once its quotes are balanced ("" escapes count twice)
+        if record.count('"') % 2 == 0:
+            if record.strip():
+                yield start, next(csv.reader([record]))
+            record = ""
+    if record.strip():
+        yield start, next(csv.reader([record]))
+
+
+def _parse_time(value: Union[str, int, float, None], tz: Optional[tzinfo], now: Optional[float]) -> Optional[float]:
+    if value is None or value == "":
+        return None
+    if isinstance(value, (int, float)):
+        timestamp = float(value)
+    else:
+        value = value.strip()
+        try:
+            timestamp = float(value)
+        except ValueError:
+            run_at = datetime.fromisoformat(value)
+            if run_at.tzinfo is None:
+                run_at = run_at.replace(tzinfo=tz)
+            timestamp = run_at.timestamp()
+    if now is not None and timestamp <= now:
+        raise ValueError("publish time is in the past")
+    return timestamp
+
+
+def _validate(content, scheduled_for, tz: Optional[tzinfo], now: float, media=None, posted_at=None) -> PostRecord:
+    media = parse_media(media)
+    if content is None and media:
+        content = ""
+    if not isinstance(content, str) or not (content.strip() or media):
+        raise ValueError("content is empty")
+    content = content.strip()
+    limit = MAX_CAPTION_LENGTH if media else MAX_POST_LENGTH
+    if len(content) > limit:
+        raise ValueError(f"content is longer than {limit} characters")
+    # Posts that already went out keep their (past) times
+    posted_at = _parse_time(posted_at, tz, None)
+    return PostRecord(content, _parse_time(scheduled_for, tz, None if posted_at else now), media, posted_at)
+
+
+async def parse_posts(chunks: AsyncIterator[bytes], fmt: str,
+                      tz: Optional[tzinfo] = None) -> AsyncIterator[Tuple[int, Union[PostRecord, str]]]:
+    """
+    Parse an import incrementally, yielding (line number, record or error message).
+
+    CSV files may start with a header naming a ``content`` column and an
+    optional ``scheduled_for`` column; without one, the first column is the
+    content and the second the publish time. JSONL lines are objects with the
+    same keys, or plain JSON strings. Times are ISO 8601 (local to ``tz``
+    when naive) or epoch seconds. Posts may also carry ``media``: a list of
+    ``{"type": "photo"|"video"|"document", "path"|"url"|"file_id": ...}``
+    objects (JSON text in a CSV ``media`` column), with the content as their
+    caption. Rows with a ``posted_at`` time are imported as already posted,
+    so a ``write_export`` file can be imported again as it is.
+    """
+    now = time.time()
+    lines = iter_lines(chunks)
+
+    if fmt == "csv":
+        content_index, time_index, media_index, posted_index = 0, 1, None, None
+        first = True
+        async for number, fields in _csv_rows(lines):
+            if first:
+                first = False
+                header = [field.strip().lower() for field in fields]
+                if "content" in header:
+                    content_index = header.index("content")
+                    time_index = next((header.index(c) for c in TIME_COLUMNS if c in header), None)
+                    media_index = header.index("media") if "media" in header else None
+                    posted_index = header.index("posted_at") if "posted_at" in header else None
+                    continue
+            try:
+                content = fields[content_index] if content_index < len(fields) else ""
+                scheduled_for = fields[time_index] if time_index is not None and time_index < len(fields) else None
+                media = fields[media_index] if media_index is not None and media_index < len(fields) else ""
+                posted_at = fields[posted_index] if posted_index is not None and posted_index < len(fields) else None
+                yield number, _validate(content, scheduled_for, tz, now, json.loads(media) if media.strip() else None,
+                                        posted_at)
+            except ValueError as e:
+                yield number, str(e)
+        return
+
+    number = 0
+    async for line in lines:
+        number += 1
+        if not line.strip():
+            continue
+        try:
+            data = json.loads(line)
+            if isinstance(data, str):
+                data = {"content": data}
+            if not isinstance(data, dict):
+                raise ValueError("expected an object or a string")
+            scheduled_for = next((data[c] for c in TIME_COLUMNS if c in data), None)
+            yield number, _validate(data.get("content"), scheduled_for, tz, now, data.get("media"), data.get("posted_at"))
+        except ValueError as e:  # json.JSONDecodeError is a ValueError
+            yield number, str(e)
+
+
+def _iso(timestamp: Optional[float], tz: Optional[tzinfo]) -> str:
+    return datetime.fromtimestamp(timestamp, tz).isoformat() if timestamp is not None else ""
+
+
+def write_export(posts: Iterable[ScheduledPost], fmt: str, out: BinaryIO, tz: Optional[tzinfo] = None) -> int:
+    """
+    Write ``posts`` to ``out`` row by row.
+
+    The output can be imported again: posted posts come back as posted.
+    Pending posts whose publish time has already passed are reported as
+    invalid rows, like any other import, and need a new time.
+    """
+    text = io.TextIOWrapper(out, encoding="utf-8", newline="", write_through=False)
+    count = 0
+    if fmt == "csv":
+        writer = csv.writer(text)
+        writer.writerow(["id", "content", "scheduled_for", "created_at", "posted_at", "media"])
+        for post in posts:
+            media = json.dumps([item.to_dict() for item in post.media], ensure_ascii=False) if post.media else ""
+            writer.writerow([post.id, post.content, _iso(post.scheduled_for, tz),
+                             _iso(post.created_at, tz), _iso(post.posted_at, tz), media])
+            count += 1
+    else:
+        for post in posts:
+            row = {
+                "id": post.id,
+                "content": post.content,
+                "scheduled_for": _iso(post.scheduled_for, tz) or None,
+                "created_at": _iso(post.created_at, tz),
+                "posted_at": _iso(post.posted_at, tz) or None,
+            }
+            if post.media:
+                row["media"] = [item.to_dict() for item in post.media]
+            text.write(json.dumps(row, ensure_ascii=False))
+            text.write("\n")
+            count += 1
+    text.flush()
+    # Hand ``out`` back to the caller open
+    text.detach()
+    return count
@@ -0,0 +1,381 @@
+"""
+Multi-process deployment: update routing, shared state and leader election
+"""
+
+import asyncio
+import bisect
+import hashlib
+import hmac
+import logging
+import multiprocessing
+import os
+import signal
+import time
+import uuid
+from typing import Any, Dict, List, Optional, Sequence
+
+import aiohttp
+from aiohttp import web
+from telegram import Update
+
+from .config import Config
+from .utils.http_client import create_bot
+from .utils.redis_client import get_redis
+from .webhook import SECRET_HEADER, WebhookServer, webhook_path
+
+logger = logging.getLogger(__name__)
+
+# Path workers accept routed updates on
+WORKER_PATH = "/updates"
+
+
+# --- Consistent hashing --------------------------------------------------
+
+def _hash(value: str) -> int:
+    return int.from_bytes(hashlib.blake2b(value.encode(), digest_size=8).digest(), "big")
+
+
+class HashRing:
+    """Consistent hash ring; adding or removing a node only moves that node's keys"""
+
+    def __init__(self, nodes: Sequence[str], replicas: int = 128):
+        self.replicas = replicas
+        self._points: List[int] = []
+        self._owners: Dict[int, str] = {}
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node: str):
+        for i in range(self.replicas):
+            point = _hash(f"{node}#{i}")
+            self._owners[point] = node
+            bisect.insort(self._points, point)
+
+    def remove(self, node: str):
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: n for p, n in self._owners.items() if n != node}
+
+    def node_for(self, key: Any) -> str:
+        if not self._points:
+            raise LookupError("hash ring is empty")
+        index = bisect.bisect(self._points, _hash(str(key))) % len(self._points)
+        return self._owners[self._points[index]]
+
+
+def routing_key(data: Dict[str, Any]) -> Any:
+    """Chat id of a raw update, falling back to the sender or the update id"""
+    for field in ("message", "edited_message", "channel_post", "edited_channel_post",
+                  "my_chat_member", "chat_member", "chat_join_request"):
+        if field in data and "chat" in data[field]:
+            return data[field]["chat"]["id"]
+    callback_query = data.get("callback_query")
+    if callback_query:
+        if "message" in callback_query:
+            return callback_query["message"]["chat"]["id"]
+        return callback_query["from"]["id"]
+    for value in data.values():
+        if isinstance(value, dict) and "from" in value:
+            return value["from"]["id"]
+    return data.get("update_id")
+
+
+# --- Shared state ----------------------------------------------------------
+
+class LocalStateStore:
+    """In-process stand-in for Redis; only coordinates tasks within one process"""
+
+    def __init__(self):
+        self._data: Dict[str, Any] = {}
+        self._expiry: Dict[str, float] = {}
+
+    def _live(self, key: str) -> bool:
+        deadline = self._expiry.get(key)
+        if deadline is not None and deadline <= time.monotonic():
+            self._data.pop(key, None)
+            self._expiry.pop(key, None)
+        return key in self._data
+
+    async def get(self, key: str) -> Optional[str]:
+        return self._data[key] if self._live(key) else None
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        if nx and self._live(key):
+            return False
+        self._data[key] = value
+        if ttl is None:
+            self._expiry.pop(key, None)
+        else:
+            self._expiry[key] = time.monotonic() + ttl
+        return True
+
+    async def incr(self, key: str) -> int:
+        value = int(self._data[key]) + 1 if self._live(key) else 1
+        self._data[key] = str(value)
+        return value
+
+    async def renew(self, key: str, value: str, ttl: float) -> bool:
+        if self._live(key) and self._data[key] == value:
+            self._expiry[key] = time.monotonic() + ttl
+            return True
+        return False
+
+    async def release(self, key: str, value: str) -> bool:
+        if self._live(key) and self._data[key] == value:
+            del self._data[key]
+            self._expiry.pop(key, None)
+            return True
+        return False
+
+
+class RedisStateStore:
+    """State store shared by every process and host using the same Redis"""
+
+    _RENEW = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('pexpire', KEYS[1], ARGV[2]) end return 0"
+    _RELEASE = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) end return 0"
+
+    def __init__(self, redis_url: str):
+        self.redis = get_redis(redis_url)
+        self._renew = self.redis.register_script(self._RENEW)
+        self._release = self.redis.register_script(self._RELEASE)
+
+    async def get(self, key: str) -> Optional[str]:
+        return await self.redis.get(key)
+
+    async def set(self, key: str, value: str, ttl: Optional[float] = None, nx: bool = False) -> bool:
+        px = int(ttl * 1000) if ttl is not None else None
+        return bool(await self.redis.set(key, value, px=px, nx=nx))
+
+    async def incr(self, key: str) -> int:
+        return await self.redis.incr(key)
+
+    async def renew(self, key: str, value: str, ttl: float) -> bool:
+        return bool(await self._renew(keys=[key], args=[value, int(ttl * 1000)]))
+
+    async def release(self, key: str, value: str) -> bool:
+        return bool(await self._release(keys=[key], args=[value]))
+
+
+def create_state_store(redis_url: Optional[str]):
+    """Use Redis when configured, otherwise the in-process store"""
+    if redis_url:
+        return RedisStateStore(redis_url)
+    return LocalStateStore()
+
+
+class LeaderLease:
+    """
+    Lease-based leader election over a state store.
+
+    The holder renews the lease every third of its TTL. If the leader dies,
+    the lease expires and another candidate takes over within one TTL. A
+    leader that fails to renew steps down immediately.
+    """
+
+    def __init__(self, store, name: str, ttl: float = 15.0, owner: Optional[str] = None):
+        self.store = store
+        self.key = f"telgbot:leader:{name}"
+        self.ttl = ttl
+        self.owner = owner or f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.is_leader = False
+        self._task: Optional[asyncio.Task] = None
+
+    async def start(self):
+        await self._tick()
+        self._task = asyncio.create_task(self._run(), name="leader-lease")
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        if self.is_leader:
+            self.is_leader = False
+            try:
+                await self.store.release(self.key, self.owner)
+            except Exception as e:
+                logger.warning("Could not release leader lease: %s", e)
+
+    async def _tick(self):
+        try:
+            if self.is_leader:
+                held = await self.store.renew(self.key, self.owner, self.ttl)
+            else:
+                held = await self.store.set(self.key, self.owner, ttl=self.ttl, nx=True)
+        except Exception as e:
+            logger.error("Leader lease check failed: %s", e)
+            held = False
+
+        if held != self.is_leader:
+            logger.info("👑 %s leadership (%s)", "Acquired" if held else "Lost", self.owner)
+        self.is_leader = held
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.ttl / 3)
+            await self._tick()
+
+
+# --- Update routing ----------------------------------------------------------
+
+class UpdateRouter:
+    """
+    Receives updates once and forwards each to the worker owning its chat.
+
+    Each worker has its own FIFO and a single sender, so a chat's updates
+    reach its worker in order. Updates come from a webhook when WEBHOOK_URL is
+    set and from long polling otherwise; a polled batch is only confirmed to
+    Telegram once every worker has it.
+    """
+
+    def __init__(self, config: Config, workers: Sequence[str], allowed_updates: Optional[List[str]] = None):
+        self.config = config
+        self.workers = list(workers)
+        self.allowed_updates = allowed_updates or Update.ALL_TYPES
+        self.ring = HashRing(self.workers)
+        self._queues: Dict[str, asyncio.Queue] = {}
+        self._senders: List[asyncio.Task] = []
+        self._session: Optional[aiohttp.ClientSession] = None
+
+    def route(self, data: Dict[str, Any]) -> asyncio.Future:
+        """Queue a raw update for its worker; the future is done once the worker has taken (or rejected) it"""
+        worker = self.ring.node_for(routing_key(data))
+        accepted = asyncio.get_running_loop().create_future()
+        self._queues[worker].put_nowait((data, accepted))
+        return accepted
+
+    async def _send_loop(self, worker: str, queue: asyncio.Queue):
+        url = worker.rstrip("/") + WORKER_PATH
+        headers = {SECRET_HEADER: self.config.CLUSTER_SECRET}
+        while True:
+            batch = [await queue.get()]
+            while not queue.empty() and len(batch) < 100:
+                batch.append(queue.get_nowait())
+            delay = 0.5
+            while True:
+                try:
+                    async with self._session.post(url, json=[data for data, _ in batch], headers=headers) as response:
+                        if response.status == 200:
+                            break
+                        # Sending the same batch again cannot fix a 4xx; drop it so later updates get through
+                        if 400 <= response.status < 500:
+                            logger.error("Worker %s rejected %d updates: HTTP %s, dropping them",
+                                         worker, len(batch), response.status)
+                            break
+                        logger.warning("Worker %s failed %d updates: HTTP %s, retrying in %ss",
+                                       worker, len(batch), response.status, delay)
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logger.warning("Worker %s unreachable (%s), retrying in %ss", worker, e, delay)
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30)
+            for _, accepted in batch:
+                if not accepted.done():
+                    accepted.set_result(None)
+
+    async def _receive_webhook(self, request: web.Request) -> web.Response:
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received.encode(), self._webhook_secret.encode()):
+            return web.Response(status=403)
+        try:
+            data = await request.json()
+        except ValueError:
+            return web.Response(status=400)
+        for item in data if isinstance(data, list) else [data]:
+            if isinstance(item, dict):
+                self.route(item)
+        return web.Response(status=200)
+
+    async def _poll(self, bot):
+        offset = None
+        while True:
+            try:
+                updates = await bot.get_updates(offset=offset, timeout=30, allowed_updates=self.allowed_updates)
+            except Exception as e:
+                logger.warning("getUpdates failed: %s", e)
+                await asyncio.sleep(1)
+                continue
+            if not updates:
+                continue
+            # The next call's offset confirms these to Telegram, so only move it once the workers have them
+            await asyncio.gather(*(self.route(update.to_dict()) for update in updates))
+            offset = updates[-1].update_id + 1
+
+    async def run(self):
+        """Route updates until SIGINT/SIGTERM"""
+        self._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=30))
+        for worker in self.workers:
+            queue = self._queues[worker] = asyncio.Queue()
+            self._senders.append(asyncio.create_task(self._send_loop(worker, queue)))
+
+        stop_event = asyncio.Event()
+        loop = asyncio.get_running_loop()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            try:
+                loop.add_signal_handler(sig, stop_event.set)
+            except NotImplementedError:  # Windows
+                pass
+
+        bot = create_bot(self.config)
+        runner = None
+        poller = None
+        async with bot:
+            if self.config.use_webhook():
+                self._webhook_secret = self.config.WEBHOOK_SECRET or uuid.uuid4().hex
+                app = web.Application()
+                app.router.add_post(webhook_path(self.config.WEBHOOK_URL), self._receive_webhook)
+                runner = web.AppRunner(app, access_log=None)
+                await runner.setup()
+                await web.TCPSite(runner, self.config.WEBHOOK_LISTEN, self.config.PORT).start()
+                await bot.set_webhook(self.config.WEBHOOK_URL, secret_token=self._webhook_secret,
+                                      allowed_updates=self.allowed_updates)
+            else:
+                await bot.delete_webhook()
+                poller = asyncio.create_task(self._poll(bot))
+            logger.info("🔀 Routing updates to %d workers", len(self.workers))
+
+            try:
+                await stop_event.wait()
+            finally:
+                if poller is not None:
+                    poller.cancel()
+                if runner is not None:
+                    await runner.cleanup()
+                for sender in self._senders:
+                    sender.cancel()
+                await asyncio.gather(*self._senders, return_exceptions=True)
+                await self._session.close()
+
+
+def add_worker_route(server: WebhookServer, config: Config, application):
+    """Accept updates routed from the cluster front end on ``server``"""
+    server.add_route(WORKER_PATH, config.CLUSTER_SECRET, application)
+
+
+def _worker_process(index: int, port: int):
+    # Spawned children re-read the environment, so configure them through it
+    os.environ.update(CLUSTER_MODE="worker", WORKER_INDEX=str(index), PORT=str(port))
+    from main import main
+    main()
+
+
+def run_local_cluster(config: Config, allowed_updates: Optional[List[str]] = None):
+    """Start WORKER_COUNT worker processes on this host and route updates to them"""
+    context = multiprocessing.get_context("spawn")
+    ports = [config.PORT + 1 + i for i in range(config.WORKER_COUNT)]
+    processes = [
+        context.Process(target=_worker_process, args=(i, port), name=f"telgbot-worker-{i}")
+        for i, port in enumerate(ports)
+    ]
+    for process in processes:
+        process.start()
+
+    try:
+        workers = [f"http://127.0.0.1:{port}" for port in ports]
+        asyncio.run(UpdateRouter(config, workers, allowed_updates).run())
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.join()
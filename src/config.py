@@ -3,51 +3,160 @@ Configuration management for Telegram Auto Bot
 """
 
 import os
-from typing import Optional
-from dotenv import load_dotenv
+import re
+from typing import Any, Dict, Optional
+
+_env_loaded = False
+
+
+def load_env():
+    """Load environment variables from .env once, on first use rather than at import"""
+    global _env_loaded
+    if not _env_loaded:
+        from dotenv import load_dotenv
+        load_dotenv()
+        _env_loaded = True
+
+
+def _env_value(value: Any) -> Optional[str]:
+    """An override as the string its environment variable would hold"""
+    if value is None or isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (list, tuple)):
+        return ','.join(str(item) for item in value)
+    return str(value)
 
-# Load environment variables from .env file
-load_dotenv()
 
 class Config:
     """Configuration class for bot settings"""
     
-    def __init__(self):
+    def __init__(self, overrides: Optional[Dict[str, Any]] = None):
+        load_env()
+        # Settings given directly (e.g. one tenant's entry in TENANTS_FILE) win over the environment
+        self._overrides = {key: _env_value(value) for key, value in (overrides or {}).items()}
+        
         # Telegram Bot Settings
-        self.BOT_TOKEN: str = os.getenv('BOT_TOKEN', '')
-        self.USER_ID: int = int(os.getenv('USER_ID', '0'))
+        self.BOT_TOKEN: str = self._getenv('BOT_TOKEN', '')
+        self.USER_ID: int = int(self._getenv('USER_ID', '0'))
+        # Extra users allowed to run admin commands (the owner always is)
+        self.ADMIN_IDS: list = [int(admin_id) for admin_id in self._parse_list(self._getenv('ADMIN_IDS', ''))]
+        # Base URL of a self-hosted (or fake) Bot API server, e.g. http://localhost:8081
+        self.BOT_API_URL: str = self._getenv('BOT_API_URL', '').rstrip('/')
         
         # Bot Feature Settings
-        self.AUTO_POST_ENABLED: bool = os.getenv('AUTO_POST_ENABLED', 'false').lower() == 'true'
-        self.REPLY_GUY_ENABLED: bool = os.getenv('REPLY_GUY_ENABLED', 'false').lower() == 'true'
-        self.AWAY_MESSAGE_ENABLED: bool = os.getenv('AWAY_MESSAGE_ENABLED', 'false').lower() == 'true'
+        self.AUTO_POST_ENABLED: bool = self._getenv('AUTO_POST_ENABLED', 'false').lower() == 'true'
+        self.REPLY_GUY_ENABLED: bool = self._getenv('REPLY_GUY_ENABLED', 'false').lower() == 'true'
+        self.AWAY_MESSAGE_ENABLED: bool = self._getenv('AWAY_MESSAGE_ENABLED', 'false').lower() == 'true'
         
         # Timing Settings
-        self.POST_INTERVAL_HOURS: int = int(os.getenv('POST_INTERVAL_HOURS', '2'))
-        self.REPLY_PROBABILITY: float = float(os.getenv('REPLY_PROBABILITY', '0.3'))
-        self.REPLY_DELAY_MIN: int = int(os.getenv('REPLY_DELAY_MIN', '1'))
-        self.REPLY_DELAY_MAX: int = int(os.getenv('REPLY_DELAY_MAX', '5'))
+        self.POST_INTERVAL_HOURS: int = int(self._getenv('POST_INTERVAL_HOURS', '2'))
+        self.REPLY_PROBABILITY: float = float(self._getenv('REPLY_PROBABILITY', '0.3'))
+        self.REPLY_DELAY_MIN: int = int(self._getenv('REPLY_DELAY_MIN', '1'))
+        self.REPLY_DELAY_MAX: int = int(self._getenv('REPLY_DELAY_MAX', '5'))
+        self.POST_CRON: Optional[str] = self._getenv('POST_CRON')
+        self.TIMEZONE: str = self._getenv('TIMEZONE', 'UTC')
+        
+        # Concurrency Settings
+        self.MAX_CONCURRENT_UPDATES: int = int(self._getenv('MAX_CONCURRENT_UPDATES', '64'))
+        self.MAX_DEFERRED_REPLIES: int = int(self._getenv('MAX_DEFERRED_REPLIES', '1000'))
+        
+        # Inbound Load Shedding: reply-guy work is shed above the high watermark until the
+        # backlog falls to the low one; at INTAKE_MAX_PENDING every non-admin update is dropped
+        self.INTAKE_MAX_PENDING: int = int(self._getenv('INTAKE_MAX_PENDING', '2000'))
+        self.INTAKE_HIGH_WATERMARK: int = int(self._getenv('INTAKE_HIGH_WATERMARK', '500'))
+        self.INTAKE_LOW_WATERMARK: int = int(self._getenv('INTAKE_LOW_WATERMARK', '100'))
+        # Inbound rate limits per user and per chat (updates per second, burst); 0 disables
+        self.INTAKE_USER_RATE: float = float(self._getenv('INTAKE_USER_RATE', '1'))
+        self.INTAKE_USER_BURST: int = int(self._getenv('INTAKE_USER_BURST', '5'))
+        self.INTAKE_CHAT_RATE: float = float(self._getenv('INTAKE_CHAT_RATE', '20'))
+        self.INTAKE_CHAT_BURST: int = int(self._getenv('INTAKE_CHAT_BURST', '60'))
+        
+        # Outbound Rate Limits (Telegram: ~30 msg/s overall, ~1 msg/s per chat, 20 msg/min per group)
+        self.SEND_GLOBAL_RATE: float = float(self._getenv('SEND_GLOBAL_RATE', '30'))
+        self.SEND_CHAT_RATE: float = float(self._getenv('SEND_CHAT_RATE', '1'))
+        self.SEND_GROUP_RATE_PER_MINUTE: float = float(self._getenv('SEND_GROUP_RATE_PER_MINUTE', '20'))
+        self.SEND_MAX_RETRIES: int = int(self._getenv('SEND_MAX_RETRIES', '5'))
+        # Durable sends (scheduled posts) survive restarts, so they get a bigger budget before being dead-lettered
+        self.SEND_DURABLE_MAX_RETRIES: int = int(self._getenv('SEND_DURABLE_MAX_RETRIES', '20'))
+        
+        # Idempotency: update_ids remembered to skip replays, and recent send keys not sent twice
+        self.UPDATE_DEDUPE_SIZE: int = int(self._getenv('UPDATE_DEDUPE_SIZE', '100000'))
+        self.UPDATE_DEDUPE_WINDOW: float = float(self._getenv('UPDATE_DEDUPE_WINDOW', '3600'))
+        self.SEND_DEDUPE_SIZE: int = int(self._getenv('SEND_DEDUPE_SIZE', '10000'))
+        
+        # Bot API HTTP Pool (one pool shared by getUpdates and every send)
+        self.HTTP_POOL_SIZE: int = int(self._getenv('HTTP_POOL_SIZE', '32'))
+        self.HTTP_KEEPALIVE: float = float(self._getenv('HTTP_KEEPALIVE', '60'))
+        self.HTTP_CONNECT_TIMEOUT: float = float(self._getenv('HTTP_CONNECT_TIMEOUT', '5'))
+        self.HTTP_READ_TIMEOUT: float = float(self._getenv('HTTP_READ_TIMEOUT', '10'))
+        self.HTTP_WRITE_TIMEOUT: float = float(self._getenv('HTTP_WRITE_TIMEOUT', '10'))
+        self.HTTP_POOL_TIMEOUT: float = float(self._getenv('HTTP_POOL_TIMEOUT', '5'))
+        self.HTTP_VERSION: str = self._getenv('HTTP_VERSION', '1.1')
         
         # Channel/Group Settings
-        self.TARGET_CHANNEL: Optional[str] = os.getenv('TARGET_CHANNEL')
-        self.TARGET_GROUPS: list = self._parse_list(os.getenv('TARGET_GROUPS', ''))
+        self.TARGET_CHANNEL: Optional[str] = self._getenv('TARGET_CHANNEL')
+        self.TARGET_GROUPS: list = self._parse_list(self._getenv('TARGET_GROUPS', ''))
+        # Seconds Bot API lookups (bot info, chats, the bot's membership) are cached for
+        self.LOOKUP_TTL_ME: float = float(self._getenv('LOOKUP_TTL_ME', '3600'))
+        self.LOOKUP_TTL_CHAT: float = float(self._getenv('LOOKUP_TTL_CHAT', '600'))
+        self.LOOKUP_TTL_MEMBER: float = float(self._getenv('LOOKUP_TTL_MEMBER', '300'))
+        self.LOOKUP_CACHE_SIZE: int = int(self._getenv('LOOKUP_CACHE_SIZE', '1000'))
+        # Targets a post is sent to at the same time, and transient-error retries per target
+        self.POST_CONCURRENCY: int = int(self._getenv('POST_CONCURRENCY', '20'))
+        self.POST_MAX_RETRIES: int = int(self._getenv('POST_MAX_RETRIES', '10'))
         
         # Database Settings
-        self.DATABASE_URL: str = os.getenv('DATABASE_URL', 'sqlite:///bot_data.db')
-        self.REDIS_URL: Optional[str] = os.getenv('REDIS_URL')
+        self.DATABASE_URL: str = self._getenv('DATABASE_URL', 'sqlite:///bot_data.db')
+        self.DB_POOL_SIZE: int = int(self._getenv('DB_POOL_SIZE', '5'))
+        self.DB_FLUSH_INTERVAL: float = float(self._getenv('DB_FLUSH_INTERVAL', '0.5'))
+        self.REDIS_URL: Optional[str] = self._getenv('REDIS_URL')
         
         # Logging Settings
-        self.LOG_LEVEL: str = os.getenv('LOG_LEVEL', 'INFO')
-        self.LOG_FILE: str = os.getenv('LOG_FILE', 'bot.log')
+        self.LOG_LEVEL: str = self._getenv('LOG_LEVEL', 'INFO')
+        self.LOG_FILE: str = self._getenv('LOG_FILE', 'bot.log')
+        self.LOG_FORMAT: str = self._getenv('LOG_FORMAT', 'json').lower()
+        self.LOG_QUEUE_SIZE: int = int(self._getenv('LOG_QUEUE_SIZE', '10000'))
+        self.LOG_RATE_LIMIT: float = float(self._getenv('LOG_RATE_LIMIT', '10'))
+        self.LOG_RATE_BURST: int = int(self._getenv('LOG_RATE_BURST', '50'))
+        self.LOG_SAMPLE_EVERY: int = int(self._getenv('LOG_SAMPLE_EVERY', '100'))
+        # Records at this level or above are never rate-limited
+        self.LOG_RATE_EXEMPT_LEVEL: str = self._getenv('LOG_RATE_EXEMPT_LEVEL', 'ERROR')
+        self.METRICS_ENABLED: bool = self._getenv('METRICS_ENABLED', 'true').lower() == 'true'
+        # Event-loop watchdog: callbacks blocking the loop longer than this many seconds are
+        # logged with their stack (0 disables); /profile captures at most PROFILE_MAX_SECONDS
+        self.LOOP_LAG_THRESHOLD: float = float(self._getenv('LOOP_LAG_THRESHOLD', '0.25'))
+        self.LOOP_LAG_INTERVAL: float = float(self._getenv('LOOP_LAG_INTERVAL', '0.1'))
+        self.PROFILE_MAX_SECONDS: float = float(self._getenv('PROFILE_MAX_SECONDS', '300'))
         
         # Deployment Settings
-        self.PORT: int = int(os.getenv('PORT', '8000'))
-        self.WEBHOOK_URL: Optional[str] = os.getenv('WEBHOOK_URL')
-        self.ENVIRONMENT: str = os.getenv('ENVIRONMENT', 'development')
+        self.PORT: int = int(self._getenv('PORT', '8000'))
+        self.WEBHOOK_URL: Optional[str] = self._getenv('WEBHOOK_URL')
+        self.WEBHOOK_SECRET: str = self._getenv('WEBHOOK_SECRET', '')
+        self.WEBHOOK_LISTEN: str = self._getenv('WEBHOOK_LISTEN', '0.0.0.0')
+        self.ENVIRONMENT: str = self._getenv('ENVIRONMENT', 'development')
+        
+        # Multi-tenant Settings: host every bot listed in TENANTS_FILE in this process
+        self.TENANTS_FILE: str = self._getenv('TENANTS_FILE', '')
+        self.MAX_TENANTS: int = int(self._getenv('MAX_TENANTS', '100'))
+        
+        # Cluster Settings: '' (single process), 'local' (spawn WORKER_COUNT workers here),
+        # 'router' (forward updates to CLUSTER_WORKERS) or 'worker'
+        self.CLUSTER_MODE: str = self._getenv('CLUSTER_MODE', '').lower()
+        self.WORKER_COUNT: int = int(self._getenv('WORKER_COUNT', str(os.cpu_count() or 1)))
+        self.WORKER_INDEX: int = int(self._getenv('WORKER_INDEX', '0'))
+        self.CLUSTER_WORKERS: list = self._parse_list(self._getenv('CLUSTER_WORKERS', ''))
+        self.CLUSTER_SECRET: str = self._getenv('CLUSTER_SECRET', '')
+        self.LEADER_LEASE_TTL: float = float(self._getenv('LEADER_LEASE_TTL', '15'))
+        
+        # Media posts: local files must live under MEDIA_DIR; uploaded file_ids are cached
+        self.MEDIA_DIR: str = self._getenv('MEDIA_DIR', 'media')
+        self.MEDIA_CACHE_SIZE: int = int(self._getenv('MEDIA_CACHE_SIZE', '10000'))
         
         # Feature Limits
-        self.MAX_SCHEDULED_POSTS: int = int(os.getenv('MAX_SCHEDULED_POSTS', '100'))
-        self.MAX_REPLY_TEMPLATES: int = int(os.getenv('MAX_REPLY_TEMPLATES', '50'))
+        self.MAX_SCHEDULED_POSTS: int = int(self._getenv('MAX_SCHEDULED_POSTS', '50000'))
+        self.MAX_REPLY_TEMPLATES: int = int(self._getenv('MAX_REPLY_TEMPLATES', '5000'))
         
         # Default Templates
         self.DEFAULT_REPLY_TEMPLATES = [
@@ -67,6 +176,11 @@ class Config:
             "Away from keyboard right now, but I'll catch up with you later! ⚡"
         ]
     
+    def _getenv(self, name: str, default: Optional[str] = None) -> Optional[str]:
+        """An override, else the environment variable ``name``"""
+        value = self._overrides.get(name)
+        return os.getenv(name, default) if value is None else value
+    
     def _parse_list(self, value: str) -> list:
         """Parse comma-separated string into list"""
         if not value:
@@ -77,14 +191,23 @@ class Config:
         """Check if running in production environment"""
         return self.ENVIRONMENT.lower() == 'production'
     
-    def validate(self) -> tuple[bool, list]:
-        """Validate configuration and return (is_valid, errors)"""
+    def use_webhook(self) -> bool:
+        """Check if updates should be received via webhook instead of polling"""
+        return bool(self.WEBHOOK_URL)
+    
+    def validate(self, multi_tenant: bool = False) -> tuple[bool, list]:
+        """
+        Validate configuration and return (is_valid, errors).
+
+        With ``multi_tenant``, BOT_TOKEN and USER_ID are not checked: each
+        tenant in TENANTS_FILE brings its own.
+        """
         errors = []
         
-        if not self.BOT_TOKEN:
+        if not multi_tenant and not self.BOT_TOKEN:
             errors.append("BOT_TOKEN is required")
         
-        if not self.USER_ID or self.USER_ID == 0:
+        if not multi_tenant and (not self.USER_ID or self.USER_ID == 0):
             errors.append("USER_ID is required and must be a valid Telegram user ID")
         
         if self.POST_INTERVAL_HOURS < 1:
@@ -96,6 +219,57 @@ class Config:
         if self.REPLY_DELAY_MIN > self.REPLY_DELAY_MAX:
             errors.append("REPLY_DELAY_MIN cannot be greater than REPLY_DELAY_MAX")
         
+        if not (0 <= self.INTAKE_LOW_WATERMARK < self.INTAKE_HIGH_WATERMARK <= self.INTAKE_MAX_PENDING):
+            errors.append("Intake watermarks must satisfy 0 <= LOW < HIGH <= INTAKE_MAX_PENDING")
+        
+        if self.HTTP_POOL_SIZE < 2:
+            errors.append("HTTP_POOL_SIZE must be at least 2 (long polling holds one connection)")
+        
+        if self.HTTP_VERSION not in ('1.1', '2', '2.0'):
+            errors.append("HTTP_VERSION must be 1.1 or 2")
+        
+        if self.POST_CONCURRENCY < 1:
+            errors.append("POST_CONCURRENCY must be at least 1")
+        if self.MEDIA_CACHE_SIZE < 1:
+            errors.append("MEDIA_CACHE_SIZE must be at least 1")
+        if self.LOOKUP_CACHE_SIZE < 1:
+            errors.append("LOOKUP_CACHE_SIZE must be at least 1")
+        
+        if self.LOOP_LAG_THRESHOLD < 0 or self.LOOP_LAG_INTERVAL <= 0:
+            errors.append("LOOP_LAG_THRESHOLD must be at least 0 and LOOP_LAG_INTERVAL above 0")
+        if self.PROFILE_MAX_SECONDS <= 0:
+            errors.append("PROFILE_MAX_SECONDS must be above 0")
+        
+        if self.LOG_LEVEL.upper() not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+            errors.append("LOG_LEVEL must be one of DEBUG, INFO, WARNING, ERROR or CRITICAL")
+        if self.LOG_RATE_EXEMPT_LEVEL.upper() not in ('DEBUG', 'INFO', 'WARNING', 'ERROR', 'CRITICAL'):
+            errors.append("LOG_RATE_EXEMPT_LEVEL must be one of DEBUG, INFO, WARNING, ERROR or CRITICAL")
+        
+        if self.LOG_FORMAT not in ('json', 'console'):
+            errors.append("LOG_FORMAT must be json or console")
+        
+        if self.CLUSTER_MODE not in ('', 'local', 'router', 'worker'):
+            errors.append("CLUSTER_MODE must be one of local, router or worker")
+        
+        if self.CLUSTER_MODE and not self.CLUSTER_SECRET:
+            errors.append("CLUSTER_SECRET is required in cluster mode")
+        
+        if self.CLUSTER_MODE in ('local', 'worker') and not self.REDIS_URL:
+            errors.append("REDIS_URL is required for leader election between workers")
+        
+        if self.CLUSTER_MODE == 'router' and not self.CLUSTER_WORKERS:
+            errors.append("CLUSTER_WORKERS must list worker URLs in router mode")
+        
+        if self.TENANTS_FILE and self.CLUSTER_MODE:
+            errors.append("TENANTS_FILE cannot be combined with CLUSTER_MODE")
+        
+        unknown = sorted(key for key in self._overrides if not key.isupper() or not hasattr(self, key))
+        if unknown:
+            errors.append(f"Unknown settings: {', '.join(unknown)}")
+        
+        if self.WEBHOOK_SECRET and not re.fullmatch(r'[A-Za-z0-9_-]{1,256}', self.WEBHOOK_SECRET):
+            errors.append("WEBHOOK_SECRET must be 1-256 characters of A-Z, a-z, 0-9, _ or -")
+        
         return len(errors) == 0, errors
     
     def to_dict(self) -> dict:
@@ -0,0 +1,165 @@
+"""
+Once-per-user-per-day tracking for away messages, and replayed update detection
+"""
+
+import heapq
+import time
+from collections import OrderedDict
+from datetime import date, datetime, tzinfo
+from typing import Iterable, List, Optional, Set
+
+from .utils.redis_client import get_redis
+
+# Keep each day's Redis set a little past midnight so late checks still see it
+DAY_TTL_SECONDS = 2 * 24 * 60 * 60
+
+
+class DailyDedupe:
+    """
+    In-process dedupe set that rotates at midnight.
+
+    Only the current day's user ids are kept. When the day changes the old set
+    is dropped in one step, so memory is bounded by the number of distinct
+    users seen today rather than growing with uptime.
+    """
+
+    persistent = False
+
+    def __init__(self, tz: Optional[tzinfo] = None):
+        self.tz = tz
+        self.day: date = self._today()
+        self._seen: Set[int] = set()
+
+    def _today(self) -> date:
+        return datetime.now(self.tz).date()
+
+    def _rotate(self) -> date:
+        today = self._today()
+        if today != self.day:
+            self.day = today
+            self._seen = set()
+        return today
+
+    def seed(self, day: date, user_ids: Iterable[int]):
+        """Restore marks for ``day``, e.g. after a restart"""
+        if day == self._rotate():
+            self._seen.update(user_ids)
+
+    async def check_and_mark(self, user_id: int) -> bool:
+        """Mark ``user_id`` for today; return True if it was not marked yet"""
+        self._rotate()
+        if user_id in self._seen:
+            return False
+        self._seen.add(user_id)
+        return True
+
+    async def count(self) -> int:
+        """Number of users marked today"""
+        self._rotate()
+        return len(self._seen)
+
+
+class RedisDailyDedupe:
+    """
+    Redis-backed dedupe shared by every bot instance using the same Redis.
+
+    Each day is one Redis set of user ids (an intset while small) that
+    expires on its own, so nothing has to be pruned.
+    """
+
+    persistent = True
+
+    def __init__(self, redis_url: str, namespace: str, tz: Optional[tzinfo] = None):
+        self.redis = get_redis(redis_url)
+        self.namespace = namespace
+        self.tz = tz
+
+    def _key(self) -> str:
+        return f"telgbot:{self.namespace}:away:{datetime.now(self.tz).date().isoformat()}"
+
+    def seed(self, day: date, user_ids: Iterable[int]):
+        # Redis already survives restarts
+        pass
+
+    async def check_and_mark(self, user_id: int) -> bool:
+        key = self._key()
+        async with self.redis.pipeline(transaction=True) as pipe:
+            pipe.sadd(key, user_id)
+            pipe.expire(key, DAY_TTL_SECONDS)
+            added, _ = await pipe.execute()
+        return bool(added)
+
+    async def count(self) -> int:
+        return await self.redis.scard(self._key())
+
+
+class UpdateDedupe:
+    """
+    Recently processed update_ids, to skip updates Telegram delivers twice.
+
+    A webhook retry or an unconfirmed getUpdates batch after a crash replays
+    updates the bot already handled. Ids are kept in insertion order and
+    dropped once there are ``max_entries`` or they are older than ``window``
+    seconds, so checks and marks are O(1) and memory stays bounded. Ids up to
+    ``floor`` (the completed mark of a previous run) count as seen without
+    being stored.
+
+    ``completed`` is the highest update_id at or below which every update
+    this process received has finished processing. Updates finish out of
+    order (chats run concurrently), so the mark only moves past an update
+    once everything received before it is done; persisted, it is a safe
+    ``floor`` for the next run.
+    """
+
+    def __init__(self, max_entries: int = 100_000, window: float = 3600.0):
+        self.max_entries = max_entries
+        self.window = window
+        self.floor = 0
+        self.completed = 0
+        self._seen: "OrderedDict[int, float]" = OrderedDict()
+        # Received but unfinished ids; the heap may hold finished ones until they reach its top
+        self._in_flight: Set[int] = set()
+        self._in_flight_heap: List[int] = []
+        self._highest_started = 0
+
+    def __len__(self) -> int:
+        return len(self._seen)
+
+    def check_and_mark(self, update_id: int) -> bool:
+        """Mark ``update_id``; return True if it was not seen yet"""
+        if update_id <= self.floor or update_id in self._seen:
+            return False
+        now = time.monotonic()
+        self._seen[update_id] = now
+        while self._seen:
+            oldest, marked_at = next(iter(self._seen.items()))
+            if len(self._seen) <= self.max_entries and now - marked_at <= self.window:
+                break
+            del self._seen[oldest]
+        return True
+
+    def started(self, update_id: int):
+        """An update was received and is about to be processed"""
+        if update_id not in self._in_flight:
+            self._in_flight.add(update_id)
+            heapq.heappush(self._in_flight_heap, update_id)
+        self._highest_started = max(self._highest_started, update_id)
+
+    def finished(self, update_id: int) -> bool:
+        """An update was handled (or dropped); return True if ``completed`` moved forward"""
+        self._in_flight.discard(update_id)
+        heap = self._in_flight_heap
+        while heap and heap[0] not in self._in_flight:
+            heapq.heappop(heap)
+        mark = heap[0] - 1 if heap else self._highest_started
+        if mark <= self.completed:
+            return False
+        self.completed = mark
+        return True
+
+
+def create_away_dedupe(redis_url: Optional[str], namespace: str, tz: Optional[tzinfo] = None):
+    """Pick the Redis implementation when REDIS_URL is configured"""
+    if redis_url:
+        return RedisDailyDedupe(redis_url, namespace, tz)
+    return DailyDedupe(tz)
@@ -0,0 +1,63 @@
+"""
+Timer-driven deferred work that never blocks the update path
+"""
+
+import asyncio
+import logging
+from typing import Awaitable, Callable, Optional, Set
+
+logger = logging.getLogger(__name__)
+
+
+class DeferredQueue:
+    """
+    Run callbacks after a delay without holding up the caller.
+
+    Each item is a loop timer rather than a sleeping task. At most
+    ``max_pending`` items may be waiting; further items are dropped, which
+    bounds memory during floods. At most ``max_concurrency`` callbacks run at
+    the same time.
+    """
+
+    def __init__(self, max_pending: int = 1000, max_concurrency: int = 16):
+        self.max_pending = max_pending
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._timers: Set[asyncio.TimerHandle] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self.dropped = 0
+
+    def __len__(self) -> int:
+        return len(self._timers) + len(self._tasks)
+
+    def defer(self, delay: float, callback: Callable[[], Awaitable[None]]) -> bool:
+        """Schedule ``callback`` in ``delay`` seconds; return False if the queue is full"""
+        if len(self) >= self.max_pending:
+            self.dropped += 1
+            return False
+
+        timer: Optional[asyncio.TimerHandle] = None
+
+        def fire():
+            self._timers.discard(timer)
+            task = asyncio.create_task(self._run(callback))
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+        timer = asyncio.get_running_loop().call_later(delay, fire)
+        self._timers.add(timer)
+        return True
+
+    async def _run(self, callback: Callable[[], Awaitable[None]]):
+        async with self._semaphore:
+            try:
+                await callback()
+            except Exception as e:
+                logger.error("Deferred callback failed: %s", e, exc_info=True)
+
+    async def stop(self):
+        """Drop pending timers and wait for running callbacks"""
+        for timer in self._timers:
+            timer.cancel()
+        self._timers.clear()
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,477 @@
+"""
+Outbound send pipeline with Telegram rate limits, retries and a durable outbox
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from enum import IntEnum
+from typing import Any, Callable, Dict, List, Optional, Tuple, Union
+
+from telegram import Bot
+from telegram.error import BadRequest, NetworkError, RetryAfter, TelegramError
+
+logger = logging.getLogger(__name__)
+
+ChatId = Union[int, str]
+
+# Longest pause between retries of a failing send
+MAX_BACKOFF_SECONDS = 300
+
+
+def parse_chat_id(value: str) -> ChatId:
+    """Numeric chat ids as int; @usernames unchanged"""
+    value = value.strip()
+    return int(value) if value.lstrip("-").isdigit() else value
+
+
+class Priority(IntEnum):
+    """Lower values are sent first"""
+
+    ADMIN = 0
+    POST = 10
+    REPLY = 20
+
+
+class TokenBucket:
+    """Classic token bucket; ``acquire`` sleeps until a token is available"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a token can be taken"""
+        now = time.monotonic()
+        self._refill(now)
+        wait = max(0.0, self.paused_until - now)
+        if self.tokens < 1:
+            wait = max(wait, (1 - self.tokens) / self.rate)
+        return wait
+
+    def try_acquire(self) -> bool:
+        if self.delay() > 0:
+            return False
+        self.tokens -= 1
+        return True
+
+    async def acquire(self):
+        while not self.try_acquire():
+            await asyncio.sleep(self.delay())
+
+    def pause(self, seconds: float):
+        """Hand out no tokens for ``seconds`` (e.g. after a RetryAfter)"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0
+
+    def idle_for(self) -> float:
+        """Seconds until the bucket is full again and can be forgotten"""
+        now = time.monotonic()
+        self._refill(now)
+        return max(self.paused_until - now, (self.capacity - self.tokens) / self.rate)
+
+
+class PriorityTokenBucket(TokenBucket):
+    """Token bucket whose waiters are served in priority order"""
+
+    def __init__(self, rate: float, capacity: float = 1.0):
+        super().__init__(rate, capacity)
+        self._waiters: List[tuple] = []
+        self._counter = itertools.count()
+        self._pump: Optional[asyncio.Task] = None
+
+    async def acquire(self, priority: int = 0):
+        if not self._waiters and self.try_acquire():
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._counter), future))
+        if self._pump is None or self._pump.done():
+            self._pump = asyncio.create_task(self._run_pump())
+        await future
+
+    async def _run_pump(self):
+        while self._waiters:
+            if not self.try_acquire():
+                await asyncio.sleep(self.delay())
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                # Waiter was cancelled; give the token back
+                self.tokens += 1
+                continue
+            future.set_result(None)
+
+
+@dataclass(slots=True)
+class OutboundMessage:
+    id: int
+    chat_id: ChatId
+    method: str
+    kwargs: Dict[str, Any]
+    priority: int
+    durable: bool
+    key: Optional[str]
+    future: asyncio.Future
+    attempts: int = 0
+    # None: the dispatcher default (durable_max_retries for durable sends)
+    max_retries: Optional[int] = None
+    on_retry: Optional[Callable[["OutboundMessage", Exception], None]] = None
+    on_done: Optional[Callable[["OutboundMessage", Any, Optional[Exception]], None]] = None
+
+
+@dataclass
+class ChatLane:
+    """Per-chat queue; one worker drains it so a chat's messages stay in order"""
+
+    bucket: TokenBucket
+    queue: List[tuple] = field(default_factory=list)
+    worker: Optional[asyncio.Task] = None
+    expiry: Optional[asyncio.TimerHandle] = None
+
+
+class OutboundDispatcher:
+    """
+    Every outgoing Bot API call goes through here.
+
+    Sends are queued per chat in priority order and released through a
+    per-chat token bucket (Telegram allows about one message per second per
+    chat and 20 per minute per group) and a global bucket (about 30 per
+    second). RetryAfter pauses the affected chat for the requested time;
+    after a network error the send is set aside and queued again once its
+    exponential backoff is over, so the chat's other sends go on meanwhile.
+    Durable sends are written to the outbox table first and replayed after a
+    restart until they succeed or run out of retries; those that fail for
+    good are moved to the dead-letter table.
+    """
+
+    def __init__(self, bot: Bot, repository=None, global_rate: float = 30.0,
+                 chat_rate: float = 1.0, group_rate: float = 20 / 60, max_retries: int = 5,
+                 id_base: int = 0, metrics=None, recent_keys: int = 10_000, durable_max_retries: int = 20):
+        self.bot = bot
+        self.repository = repository
+        self.metrics = metrics
+        self.chat_rate = chat_rate
+        self.group_rate = group_rate
+        self.max_retries = max_retries
+        self.durable_max_retries = durable_max_retries
+        self.global_bucket = PriorityTokenBucket(global_rate, capacity=global_rate)
+        self._lanes: Dict[ChatId, ChatLane] = {}
+        # Sends backing off after a network error, by message id, until they are queued again
+        self._delayed: Dict[int, Tuple[asyncio.TimerHandle, OutboundMessage]] = {}
+        # Outbox ids must not collide between cluster workers sharing the table
+        self._ids = itertools.count(id_base + 1)
+        self._seq = itertools.count()
+        self._running = False
+        self._methods: Dict[str, Callable[..., Any]] = {}
+        # Idempotency: keyed sends queued or on the wire, and keys recently sent (kept in the repository)
+        self._keys: Dict[str, OutboundMessage] = {}
+        self._sent_keys: "OrderedDict[str, None]" = OrderedDict()
+        self.recent_keys = recent_keys
+        self.duplicates = 0
+        self.sent = 0
+        self.failed = 0
+        self.retried = 0
+
+    def register_method(self, name: str, method: Callable[..., Any]):
+        """
+        Make ``name`` callable through ``submit`` as ``await method(bot, chat_id=..., **kwargs)``.
+
+        For sends whose Bot API arguments are not JSON (e.g. media uploads),
+        so they can still be durable.
+        """
+        self._methods[name] = method
+
+    def pending(self) -> int:
+        """Number of queued sends across all chats, including those backing off"""
+        return sum(len(lane.queue) for lane in self._lanes.values()) + len(self._delayed)
+
+    async def start(self):
+        self._running = True
+        for chat_id, lane in self._lanes.items():
+            if lane.queue and lane.worker is None:
+                lane.worker = asyncio.create_task(self._drain(chat_id, lane))
+
+    async def stop(self, grace: float = 5.0):
+        """
+        Stop sending; durable messages stay in the outbox for the next start.
+
+        Sends already on the wire get ``grace`` seconds to finish, so their
+        outcome is recorded instead of being replayed after a restart.
+        """
+        self._running = False
+        workers = [lane.worker for lane in self._lanes.values() if lane.worker]
+        if workers and grace > 0:
+            await asyncio.wait(workers, timeout=grace)
+        for worker in workers:
+            worker.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
+        for lane in self._lanes.values():
+            if lane.expiry:
+                lane.expiry.cancel()
+            for _, _, message in lane.queue:
+                if not message.future.done():
+                    message.future.cancel()
+        for timer, message in self._delayed.values():
+            timer.cancel()
+            if not message.future.done():
+                message.future.cancel()
+        self._lanes.clear()
+        self._delayed.clear()
+        self._keys.clear()
+
+    def send_message(self, chat_id: ChatId, text: str, **kwargs) -> asyncio.Future:
+        """Queue a sendMessage call"""
+        return self.submit("send_message", chat_id, text=text, **kwargs)
+
+    def submit(self, method: str, chat_id: ChatId, *, priority: int = Priority.REPLY,
+               durable: bool = False, key: Optional[str] = None, max_retries: Optional[int] = None,
+               on_retry: Optional[Callable[[OutboundMessage, Exception], None]] = None,
+               on_done: Optional[Callable[[OutboundMessage, Any, Optional[Exception]], None]] = None,
+               **kwargs) -> asyncio.Future:
+        """
+        Queue ``bot.<method>(chat_id=chat_id, **kwargs)``.
+
+        Returns a future with the API result. Durable sends require
+        JSON-serializable kwargs; they get ``durable_max_retries`` retries on
+        transient errors unless ``max_retries`` sets another budget, and are
+        dead-lettered when they fail for good. ``on_retry`` is called each
+        time the send is put back for another attempt and ``on_done`` with
+        the result or error when it finishes, in the same step that drops it
+        from the outbox.
+
+        ``key`` makes the send idempotent: while a send with the same key is
+        queued its future is returned instead, and a key that was sent
+        recently, also before a restart, is not sent again (the returned
+        future resolves to None).
+        """
+        if key is not None:
+            duplicate = self._duplicate(key)
+            if duplicate is not None:
+                return duplicate
+
+        message = OutboundMessage(
+            next(self._ids), chat_id, method, kwargs, int(priority), durable, key,
+            asyncio.get_running_loop().create_future(), max_retries=max_retries,
+            on_retry=on_retry, on_done=on_done,
+        )
+        # Nobody may await fire-and-forget sends; don't let failures go unreported
+        message.future.add_done_callback(_consume_exception)
+
+        if durable and self.repository is not None:
+            self.repository.save_outbox(message.id, chat_id, method, kwargs, message.priority, key, max_retries)
+        self._enqueue(message)
+        return message.future
+
+    def _duplicate(self, key: str) -> Optional[asyncio.Future]:
+        """The future standing in for a send of ``key``, if one is queued or recently done"""
+        existing = self._keys.get(key)
+        if existing is not None and not existing.future.done():
+            future = existing.future
+        elif key in self._sent_keys:
+            future = asyncio.get_running_loop().create_future()
+            future.set_result(None)
+        else:
+            return None
+        self.duplicates += 1
+        if self.metrics is not None:
+            self.metrics.duplicates.labels("send").inc()
+        logger.debug("Skipping duplicate send %s", key)
+        return future
+
+    def forget_keys(self, prefix: str):
+        """Let recently sent keys starting with ``prefix`` be sent again"""
+        for key in [key for key in self._sent_keys if key.startswith(prefix)]:
+            del self._sent_keys[key]
+            if self.repository is not None:
+                self.repository.delete_sent_key(key)
+
+    def _remember_key(self, key: str, persist: bool = True):
+        self._sent_keys[key] = None
+        self._sent_keys.move_to_end(key)
+        if persist and self.repository is not None:
+            self.repository.save_sent_key(key)
+        while len(self._sent_keys) > self.recent_keys:
+            evicted, _ = self._sent_keys.popitem(last=False)
+            if self.repository is not None:
+                self.repository.delete_sent_key(evicted)
+
+    async def restore(self) -> Dict[str, OutboundMessage]:
+        """
+        Requeue durable sends left over from a previous run, keyed by their ``key``.
+
+        Callers may set ``on_retry``/``on_done`` on the returned messages.
+        Keys sent recently in the previous run are not sent again either.
+        """
+        restored = {}
+        if self.repository is None:
+            return restored
+
+        for key in await self.repository.load_sent_keys():
+            self._remember_key(key, persist=False)
+
+        rows = await self.repository.load_outbox()
+        for row in rows:
+            message = OutboundMessage(
+                row["id"], parse_chat_id(row["chat_id"]), row["method"], row["payload"], row["priority"],
+                True, row["key"], asyncio.get_running_loop().create_future(), max_retries=row["max_retries"],
+            )
+            message.future.add_done_callback(_consume_exception)
+            self._enqueue(message)
+            if message.key:
+                restored[message.key] = message
+
+        if rows:
+            self._ids = itertools.count(rows[-1]["id"] + 1)
+            logger.info("📤 Restored %d unsent messages from the outbox", len(rows))
+        return restored
+
+    def _is_group(self, chat_id: ChatId) -> bool:
+        # Groups and channels have negative ids; @usernames are always public chats
+        return isinstance(chat_id, str) or chat_id < 0
+
+    def _enqueue(self, message: OutboundMessage):
+        if message.key is not None:
+            self._keys[message.key] = message
+        lane = self._lanes.get(message.chat_id)
+        if lane is None:
+            rate = self.group_rate if self._is_group(message.chat_id) else self.chat_rate
+            lane = ChatLane(TokenBucket(rate))
+            self._lanes[message.chat_id] = lane
+        if lane.expiry:
+            lane.expiry.cancel()
+            lane.expiry = None
+
+        heapq.heappush(lane.queue, (message.priority, next(self._seq), message))
+        if self._running and (lane.worker is None or lane.worker.done()):
+            lane.worker = asyncio.create_task(self._drain(message.chat_id, lane))
+
+    async def _drain(self, chat_id: ChatId, lane: ChatLane):
+        while lane.queue and self._running:
+            priority, _, message = lane.queue[0]
+            if message.future.done():
+                heapq.heappop(lane.queue)
+                continue
+
+            await lane.bucket.acquire()
+            await self.global_bucket.acquire(priority)
+            if not self._running:
+                break
+            # A more urgent message may have arrived while waiting for tokens
+            _, _, message = heapq.heappop(lane.queue)
+
+            try:
+                retry_in = await self._deliver(message, lane)
+            except asyncio.CancelledError:
+                if not message.future.done():
+                    message.future.cancel()
+                raise
+            if retry_in:
+                # Back off outside the lane, so the chat's other sends are not held up
+                timer = asyncio.get_running_loop().call_later(retry_in, self._requeue, message)
+                self._delayed[message.id] = (timer, message)
+            elif retry_in is not None:
+                heapq.heappush(lane.queue, (message.priority, next(self._seq), message))
+
+        lane.worker = None
+        # Keep the lane until its bucket refills so the rate holds across bursts
+        if not lane.queue:
+            lane.expiry = asyncio.get_running_loop().call_later(
+                lane.bucket.idle_for(), self._forget_lane, chat_id, lane
+            )
+
+    def _requeue(self, message: OutboundMessage):
+        del self._delayed[message.id]
+        if not message.future.done():
+            self._enqueue(message)
+
+    def _forget_lane(self, chat_id: ChatId, lane: ChatLane):
+        if self._lanes.get(chat_id) is lane and not lane.queue and lane.worker is None:
+            del self._lanes[chat_id]
+
+    async def _deliver(self, message: OutboundMessage, lane: ChatLane) -> Optional[float]:
+        """Send once; return a delay to retry after, or None when finished"""
+        started = time.perf_counter()
+        method = self._methods.get(message.method)
+        try:
+            if method is not None:
+                result = await method(self.bot, chat_id=message.chat_id, **message.kwargs)
+            else:
+                result = await getattr(self.bot, message.method)(chat_id=message.chat_id, **message.kwargs)
+        except TelegramError as e:
+            self._observe(message, started, e)
+            return self._handle_error(message, lane, e)
+        except Exception as e:
+            # e.g. a missing media file; retrying would not help
+            self._observe(message, started, e)
+            self._finish(message, error=e)
+            return None
+        self._observe(message, started)
+        self._finish(message, result=result)
+        return None
+
+    def _observe(self, message: OutboundMessage, started: float, error: Optional[Exception] = None):
+        if self.metrics is not None:
+            self.metrics.observe_send(message.method, time.perf_counter() - started, error)
+
+    def _handle_error(self, message: OutboundMessage, lane: ChatLane, error: TelegramError) -> Optional[float]:
+        # BadRequest subclasses NetworkError, so check permanent errors first
+        if isinstance(error, RetryAfter):
+            logger.warning("Flood control in chat %s, retrying in %ss", message.chat_id, error.retry_after)
+            lane.bucket.pause(error.retry_after)
+            self._retrying(message, error)
+            return 0
+        if isinstance(error, NetworkError) and not isinstance(error, BadRequest):
+            message.attempts += 1
+            max_retries = message.max_retries
+            if max_retries is None:
+                max_retries = self.durable_max_retries if message.durable else self.max_retries
+            if message.attempts <= max_retries:
+                backoff = min(2 ** message.attempts, MAX_BACKOFF_SECONDS)
+                logger.warning("Send to %s failed (%s), retry %d in %ss", message.chat_id, error, message.attempts, backoff)
+                self._retrying(message, error)
+                return backoff
+        self._finish(message, error=error)
+        return None
+
+    def _retrying(self, message: OutboundMessage, error: Exception):
+        self.retried += 1
+        if message.on_retry is not None:
+            message.on_retry(message, error)
+
+    def _finish(self, message: OutboundMessage, result: Any = None, error: Optional[Exception] = None):
+        if message.on_done is not None:
+            message.on_done(message, result, error)
+        if message.durable and self.repository is not None:
+            self.repository.delete_outbox(message.id)
+            if error is not None:
+                self.repository.save_dead_letter(message.id, message.chat_id, message.method, message.kwargs,
+                                                 message.key, repr(error))
+        if message.key is not None and self._keys.get(message.key) is message:
+            del self._keys[message.key]
+            if error is None:
+                self._remember_key(message.key)
+        if error is not None:
+            self.failed += 1
+            logger.error("Dropping %s to %s: %s", message.method, message.chat_id, error)
+            if not message.future.done():
+                message.future.set_exception(error)
+        else:
+            self.sent += 1
+            if not message.future.done():
+                message.future.set_result(result)
+
+
+def _consume_exception(future: asyncio.Future):
+    if not future.cancelled():
+        future.exception()
@@ -0,0 +1,179 @@
+"""
+Concurrent publishing of one post to many chats with per-target delivery state
+"""
+
+import asyncio
+import logging
+from dataclasses import dataclass
+from enum import Enum
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from .dispatcher import ChatId, OutboundDispatcher, OutboundMessage, Priority
+
+logger = logging.getLogger(__name__)
+
+
+class DeliveryState(str, Enum):
+    PENDING = "pending"
+    RETRYING = "retrying"
+    SENT = "sent"
+    FAILED = "failed"
+
+
+@dataclass(slots=True)
+class TargetDelivery:
+    """Where one post stands in one chat"""
+
+    chat_id: ChatId
+    state: DeliveryState = DeliveryState.PENDING
+    message_id: Optional[int] = None
+    attempts: int = 0
+    error: Optional[str] = None
+
+    @property
+    def done(self) -> bool:
+        return self.state in (DeliveryState.SENT, DeliveryState.FAILED)
+
+
+def delivery_key(post_id: int, chat_id: ChatId) -> str:
+    """Outbox key of a post's send to one chat"""
+    return f"post:{post_id}:{chat_id}"
+
+
+def _post_key_prefix(post_id: int) -> str:
+    return f"post:{post_id}:"
+
+
+class FanOut:
+    """
+    Publishes a post to every target chat at once.
+
+    Each target is a separate durable send through the dispatcher, so chats
+    are rate-limited independently and one slow group does not hold up the
+    others. At most ``concurrency`` sends of a post are in flight at a time,
+    and each gets ``max_retries`` attempts on transient errors. The state of
+    every target is persisted in the same write as the outbox change, so
+    after a restart a post resumes with only the targets that have not
+    finished and no chat gets it twice.
+    """
+
+    def __init__(self, dispatcher: OutboundDispatcher, repository=None,
+                 concurrency: int = 20, max_retries: int = 10):
+        self.dispatcher = dispatcher
+        self.repository = repository
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        # Posts being published: post id -> chat id -> delivery
+        self.deliveries: Dict[int, Dict[ChatId, TargetDelivery]] = {}
+        # Sends replayed from the outbox, picked up by the next publish of their post
+        self._restored: Dict[Tuple[int, ChatId], OutboundMessage] = {}
+
+    def load(self, post_id: int, deliveries: Iterable[TargetDelivery]):
+        """Seed the state of a post whose publishing was interrupted"""
+        self.deliveries[post_id] = {delivery.chat_id: delivery for delivery in deliveries}
+
+    def adopt(self, restored: Dict[str, OutboundMessage]) -> Set[int]:
+        """
+        Track sends the dispatcher replayed from the outbox; returns their post ids.
+
+        Call it right after ``OutboundDispatcher.restore``, before the loop
+        runs, so no replayed send can finish unobserved.
+        """
+        post_ids = set()
+        for key, message in restored.items():
+            parts = key.split(":")
+            if len(parts) != 3 or parts[0] != "post":
+                continue
+            post_id = int(parts[1])
+            deliveries = self.deliveries.setdefault(post_id, {})
+            delivery = deliveries.setdefault(message.chat_id, TargetDelivery(message.chat_id))
+            message.on_retry, message.on_done = self._callbacks(post_id, delivery)
+            self._restored[(post_id, message.chat_id)] = message
+            post_ids.add(post_id)
+        return post_ids
+
+    def in_progress(self) -> List[int]:
+        """Posts with targets that have not finished"""
+        return [post_id for post_id, deliveries in self.deliveries.items()
+                if any(not delivery.done for delivery in deliveries.values())]
+
+    async def publish(self, post_id: int, targets: Iterable[ChatId], method: str,
+                      **kwargs: Any) -> List[TargetDelivery]:
+        """Call ``method`` for every target that has not finished yet and wait for all"""
+        deliveries = self.deliveries.setdefault(post_id, {})
+        for chat_id in targets:
+            if chat_id not in deliveries:
+                deliveries[chat_id] = TargetDelivery(chat_id)
+                self._save(post_id, deliveries[chat_id])
+
+        semaphore = asyncio.Semaphore(self.concurrency)
+        await asyncio.gather(*(
+            self._deliver(post_id, delivery, method, semaphore, kwargs)
+            for delivery in deliveries.values() if not delivery.done
+        ))
+        return list(deliveries.values())
+
+    def forget(self, post_id: int):
+        """Drop a finished post from memory; its records stay in the database"""
+        self.deliveries.pop(post_id, None)
+
+    def delete(self, post_id: int):
+        """Drop every trace of a deleted post: its delivery records and its send keys"""
+        self.forget(post_id)
+        self.dispatcher.forget_keys(_post_key_prefix(post_id))
+        if self.repository is not None:
+            self.repository.delete_deliveries(post_id)
+
+    async def _deliver(self, post_id: int, delivery: TargetDelivery, method: str,
+                       semaphore: asyncio.Semaphore, kwargs: Dict[str, Any]):
+        restored = self._restored.pop((post_id, delivery.chat_id), None)
+        if restored is not None:
+            future = restored.future
+        else:
+            await semaphore.acquire()
+            on_retry, on_done = self._callbacks(post_id, delivery)
+            future = self.dispatcher.submit(
+                method, delivery.chat_id,
+                priority=Priority.POST,
+                durable=True,
+                key=delivery_key(post_id, delivery.chat_id),
+                max_retries=self.max_retries,
+                on_retry=on_retry,
+                on_done=on_done,
+                **kwargs,
+            )
+            future.add_done_callback(lambda _: semaphore.release())
+        try:
+            await future
+        except Exception:
+            pass  # recorded by on_done
+
+    def _callbacks(self, post_id: int, delivery: TargetDelivery):
+        """Dispatcher hooks that record the state of ``delivery``"""
+
+        def on_retry(message: OutboundMessage, error: Exception):
+            delivery.state = DeliveryState.RETRYING
+            delivery.attempts = message.attempts
+            delivery.error = str(error)
+            self._save(post_id, delivery)
+
+        def on_done(message: OutboundMessage, result: Any, error: Optional[Exception]):
+            delivery.attempts = message.attempts
+            if error is not None:
+                delivery.state = DeliveryState.FAILED
+                delivery.error = str(error)
+                logger.warning("Post %s to %s failed: %s", post_id, delivery.chat_id, error)
+            else:
+                delivery.state = DeliveryState.SENT
+                # Albums return one message per item; the first identifies the post
+                if isinstance(result, (list, tuple)):
+                    result = result[0] if result else None
+                delivery.message_id = getattr(result, "message_id", None)
+                delivery.error = None
+            self._save(post_id, delivery)
+
+        return on_retry, on_done
+
+    def _save(self, post_id: int, delivery: TargetDelivery):
+        if self.repository is not None:
+            self.repository.save_delivery(post_id, delivery)
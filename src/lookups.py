@@ -0,0 +1,139 @@
+"""
+TTL cache for Bot API lookups whose answers rarely change
+"""
+
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+from telegram import Bot, Chat, ChatMember, User
+from telegram.error import TelegramError
+
+from .dispatcher import ChatId
+
+logger = logging.getLogger(__name__)
+
+
+def chat_key(chat_id: ChatId) -> ChatId:
+    """Numeric ids as int and @usernames lowercased, as Telegram treats them"""
+    if isinstance(chat_id, str):
+        chat_id = chat_id.strip()
+        return int(chat_id) if chat_id.lstrip("-").isdigit() else chat_id.lower()
+    return chat_id
+
+
+def can_post(chat: Chat, member: ChatMember) -> bool:
+    """Whether a chat member with this status may send posts to ``chat``"""
+    if member.status in (ChatMember.LEFT, ChatMember.BANNED):
+        return False
+    if chat.type == Chat.CHANNEL:
+        return member.status == ChatMember.OWNER or bool(getattr(member, "can_post_messages", False))
+    if member.status == ChatMember.RESTRICTED:
+        return bool(getattr(member, "can_send_messages", True))
+    return True
+
+
+class LookupCache:
+    """
+    Answers of get_me, get_chat and get_chat_member, kept for a per-method TTL.
+
+    At most ``max_entries`` answers are kept, least recently used evicted
+    first. Concurrent lookups of the same thing share one request, and
+    errors are never cached. Changes to the bot's own membership call
+    ``invalidate`` so a promotion, ban or removal is seen right away rather
+    than after the TTL.
+    """
+
+    def __init__(self, bot: Bot, ttls: Dict[str, float], max_entries: int = 1000,
+                 clock: Callable[[], float] = time.monotonic):
+        self.bot = bot
+        self.ttls = ttls
+        self.max_entries = max_entries
+        self.clock = clock
+        # (method, *args) -> (expires at, answer)
+        self._entries: "OrderedDict[Tuple, Tuple[float, Any]]" = OrderedDict()
+        self._inflight: Dict[Tuple, asyncio.Task] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    async def _lookup(self, key: Tuple, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > self.clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+            del self._entries[key]
+
+        task = self._inflight.get(key)
+        if task is None:
+            self.misses += 1
+            task = self._inflight[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda done: self._store(key, done))
+        # One caller giving up must not cancel the request the others wait on
+        return await asyncio.shield(task)
+
+    def _store(self, key: Tuple, task: asyncio.Task):
+        # An invalidation while the request was in flight drops its answer
+        if self._inflight.get(key) is not task:
+            return
+        del self._inflight[key]
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._put(key, task.result())
+        # A chat looked up by @username is also known by its id
+        if key[0] == "get_chat" and isinstance(key[1], str):
+            self._put(("get_chat", task.result().id), task.result())
+
+    def _put(self, key: Tuple, answer: Any):
+        self._entries[key] = (self.clock() + self.ttls.get(key[0], 0), answer)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def get_me(self) -> User:
+        return await self._lookup(("get_me",), self.bot.get_me)
+
+    async def get_chat(self, chat_id: ChatId) -> Chat:
+        key = chat_key(chat_id)
+        return await self._lookup(("get_chat", key), lambda: self.bot.get_chat(key))
+
+    async def get_chat_member(self, chat_id: ChatId, user_id: int) -> ChatMember:
+        key = chat_key(chat_id)
+        return await self._lookup(("get_chat_member", key, user_id), lambda: self.bot.get_chat_member(key, user_id))
+
+    async def resolve(self, chat_id: ChatId) -> ChatId:
+        """The numeric id of a chat given by @username; ``chat_id`` itself if it cannot be looked up"""
+        if not isinstance(chat_key(chat_id), str):
+            return chat_key(chat_id)
+        try:
+            return (await self.get_chat(chat_id)).id
+        except TelegramError as e:
+            logger.warning("Could not resolve %s: %s", chat_id, e)
+            return chat_id
+
+    async def can_post(self, chat_id: ChatId) -> Optional[bool]:
+        """Whether the bot may post to ``chat_id``; None if that could not be checked"""
+        try:
+            me = await self.get_me()
+            chat = await self.get_chat(chat_id)
+            return can_post(chat, await self.get_chat_member(chat.id, me.id))
+        except TelegramError as e:
+            logger.warning("Could not check permissions in %s: %s", chat_id, e)
+            return None
+
+    def invalidate(self, chat: Chat):
+        """Forget everything cached about ``chat``, e.g. after the bot's membership changed"""
+        aliases = [chat.id] + ([f"@{chat.username.lower()}"] if chat.username else [])
+        keys = []
+        for alias in aliases:
+            keys.append(("get_chat", alias))
+            keys += [key for key in self._entries if key[0] == "get_chat_member" and key[1] == alias]
+        for key in keys:
+            self._entries.pop(key, None)
+            self._inflight.pop(key, None)
@@ -0,0 +1,220 @@
+"""
+Media uploads that stream from disk and happen once per file
+"""
+
+import asyncio
+import hashlib
+import logging
+import os
+from collections import OrderedDict
+from contextlib import ExitStack
+from typing import IO, Any, Dict, Iterable, List, Optional, Sequence, Tuple, Union
+
+from telegram import Bot, InputFile, InputMediaDocument, InputMediaPhoto, InputMediaVideo, Message
+from telegram.error import BadRequest
+
+from .dispatcher import ChatId
+from .posts import MediaItem
+
+logger = logging.getLogger(__name__)
+
+INPUT_MEDIA = {"photo": InputMediaPhoto, "video": InputMediaVideo, "document": InputMediaDocument}
+
+
+class StreamingInputFile(InputFile):
+    """
+    InputFile that uploads from an open file instead of its bytes.
+
+    python-telegram-bot 20.7 reads file objects into memory; httpx instead
+    streams a file object in the multipart body chunk by chunk (seeking back
+    to the start on every attempt), so large videos are never held whole.
+    The request is built from ``field_tuple``, so that is where the handle
+    goes; ``input_file_content`` stays empty.
+    """
+
+    __slots__ = ("handle",)
+
+    def __init__(self, handle: IO[bytes], filename: str, attach: bool = False):
+        super().__init__(b"", filename=filename, attach=attach)
+        self.handle = handle
+
+    @property
+    def field_tuple(self) -> Tuple[str, IO[bytes], str]:  # type: ignore[override]
+        return self.filename, self.handle, self.mimetype
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file, read in chunks"""
+    with open(path, "rb") as f:
+        return hashlib.file_digest(f, "sha256").hexdigest()
+
+
+def media_from_message(message: Message) -> Optional[MediaItem]:
+    """The attachment of an incoming message as a MediaItem"""
+    if message.photo:
+        return MediaItem("photo", file_id=message.photo[-1].file_id)
+    if message.video:
+        return MediaItem("video", file_id=message.video.file_id)
+    if message.document:
+        return MediaItem("document", file_id=message.document.file_id)
+    return None
+
+
+def _sent_file_id(message: Message, media_type: str) -> Optional[str]:
+    if media_type == "photo":
+        return message.photo[-1].file_id if message.photo else None
+    attachment = getattr(message, media_type, None)
+    return attachment.file_id if attachment else None
+
+
+class MediaCache:
+    """
+    Telegram file_ids of media already uploaded, keyed by content hash.
+
+    The first send of a local file (or URL) uploads it; its file_id is cached
+    and every later send, to any chat, reuses it. Concurrent sends of the
+    same content wait for the one upload in flight instead of starting their
+    own. Entries are persisted and evicted least recently used first once
+    there are more than ``max_entries``. A file_id Telegram rejects is
+    dropped and the file uploaded again.
+    """
+
+    def __init__(self, repository=None, max_entries: int = 10_000):
+        self.repository = repository
+        self.max_entries = max_entries
+        self._file_ids: "OrderedDict[str, str]" = OrderedDict()
+        # path -> (size, mtime_ns, digest); avoids rehashing unchanged files
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._uploads: Dict[str, asyncio.Future] = {}
+        self.hits = 0
+        self.uploads = 0
+
+    def __len__(self) -> int:
+        return len(self._file_ids)
+
+    def load(self, entries: Iterable[Tuple[str, str]]):
+        """Seed from the database, least recently used first"""
+        for key, file_id in entries:
+            self._file_ids[key] = file_id
+        while len(self._file_ids) > self.max_entries:
+            self._evict()
+
+    def get(self, key: str) -> Optional[str]:
+        file_id = self._file_ids.get(key)
+        if file_id is not None:
+            self._file_ids.move_to_end(key)
+            self.hits += 1
+            if self.repository is not None:
+                self.repository.save_media_file(key, file_id)
+        return file_id
+
+    def put(self, key: str, file_id: str):
+        self._file_ids[key] = file_id
+        self._file_ids.move_to_end(key)
+        if self.repository is not None:
+            self.repository.save_media_file(key, file_id)
+        while len(self._file_ids) > self.max_entries:
+            self._evict()
+
+    def discard(self, key: str):
+        if self._file_ids.pop(key, None) is not None and self.repository is not None:
+            self.repository.delete_media_file(key)
+
+    def _evict(self):
+        key, _ = self._file_ids.popitem(last=False)
+        if self.repository is not None:
+            self.repository.delete_media_file(key)
+
+    async def cache_key(self, item: MediaItem) -> Optional[str]:
+        """
+        Content hash of a local file, or a hash of the URL; None for file_ids.
+
+        file_ids are only valid for the kind of media they were sent as, so
+        the type is part of the key.
+        """
+        if item.path is not None:
+            stat = await asyncio.to_thread(os.stat, item.path)
+            known = self._digests.get(item.path)
+            if known is None or known[:2] != (stat.st_size, stat.st_mtime_ns):
+                digest = await asyncio.to_thread(file_digest, item.path)
+                known = self._digests[item.path] = (stat.st_size, stat.st_mtime_ns, digest)
+            return f"{item.type}:sha256:{known[2]}"
+        if item.url is not None:
+            return f"{item.type}:url:{hashlib.sha256(item.url.encode()).hexdigest()}"
+        return None
+
+    async def send(self, bot: Bot, chat_id: ChatId, media: List[Dict[str, str]],
+                   caption: Optional[str] = None, **kwargs: Any) -> Union[Message, Tuple[Message, ...]]:
+        """
+        Send one attachment or an album, uploading only what is not cached.
+
+        Registered with the dispatcher as ``send_media_post``; ``media`` is
+        the JSON form of MediaItems so durable sends survive a restart.
+        """
+        items = [MediaItem.from_dict(data) for data in media]
+        keys = [await self.cache_key(item) for item in items]
+
+        # Let an upload of the same content already on the wire finish first
+        waits = [self._uploads[key] for key in keys if key in self._uploads and key not in self._file_ids]
+        if waits:
+            await asyncio.wait(waits)
+
+        owned = [key for key in dict.fromkeys(keys)
+                 if key is not None and key not in self._file_ids and key not in self._uploads]
+        loop = asyncio.get_running_loop()
+        for key in owned:
+            self._uploads[key] = loop.create_future()
+        try:
+            try:
+                return await self._send(bot, chat_id, items, keys, caption, kwargs)
+            except BadRequest as e:
+                # An expired or foreign file_id: forget it and upload the file again
+                cached = [key for key in keys if key is not None and key in self._file_ids]
+                if not cached or "file" not in str(e).lower():
+                    raise
+                logger.warning("Cached file_id rejected (%s); uploading again", e)
+                for key in cached:
+                    self.discard(key)
+                return await self._send(bot, chat_id, items, keys, caption, kwargs)
+        finally:
+            for key in owned:
+                self._uploads.pop(key).set_result(None)
+
+    async def _send(self, bot: Bot, chat_id: ChatId, items: Sequence[MediaItem], keys: Sequence[Optional[str]],
+                    caption: Optional[str], kwargs: Dict[str, Any]) -> Union[Message, Tuple[Message, ...]]:
+        album = len(items) > 1
+        uploaded = []
+        with ExitStack() as stack:
+            inputs = []
+            for item, key in zip(items, keys):
+                file_id = item.file_id or (self.get(key) if key is not None else None)
+                if file_id is not None:
+                    inputs.append(file_id)
+                elif item.path is not None:
+                    handle = stack.enter_context(open(item.path, "rb"))
+                    inputs.append(StreamingInputFile(handle, os.path.basename(item.path), attach=album))
+                    uploaded.append(len(inputs) - 1)
+                else:
+                    inputs.append(item.url)
+                    uploaded.append(len(inputs) - 1)
+
+            if album:
+                group = [
+                    INPUT_MEDIA[item.type](media, caption=caption if index == 0 else None,
+                                           parse_mode=kwargs.get("parse_mode") if index == 0 else None)
+                    for index, (item, media) in enumerate(zip(items, inputs))
+                ]
+                extra = {k: v for k, v in kwargs.items() if k != "parse_mode"}
+                messages = await bot.send_media_group(chat_id=chat_id, media=group, **extra)
+                result: Union[Message, Tuple[Message, ...]] = tuple(messages)
+            else:
+                method = getattr(bot, f"send_{items[0].type}")
+                messages = [await method(chat_id=chat_id, caption=caption, **{items[0].type: inputs[0]}, **kwargs)]
+                result = messages[0]
+
+        for index in uploaded:
+            file_id = _sent_file_id(messages[index], items[index].type) if index < len(messages) else None
+            if file_id is not None:
+                self.put(keys[index], file_id)
+                self.uploads += 1
+        return result
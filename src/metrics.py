@@ -0,0 +1,192 @@
+"""
+Prometheus metrics for handlers, sends, the scheduler and internal queues
+"""
+
+import functools
+import time
+from typing import Callable, Dict, Optional
+
+from aiohttp import web
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    PlatformCollector,
+    ProcessCollector,
+    generate_latest,
+)
+from telegram import Update
+from telegram.error import TelegramError
+from telegram.ext import Application, ApplicationHandlerStop, ContextTypes
+
+from .routing import update_type
+
+# Handler and send latencies are mostly milliseconds; scheduler lag can reach minutes
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LAG_BUCKETS = (0.01, 0.05, 0.1, 0.5, 1, 5, 15, 60, 300, 900)
+
+
+class Metrics:
+    """All bot metrics, registered in their own registry"""
+
+    def __init__(self, registry: Optional[CollectorRegistry] = None, process: bool = True):
+        self.registry = registry or CollectorRegistry()
+        self.started_at = time.time()
+        # Tenants of one process leave these to the runner's registry
+        if process:
+            ProcessCollector(registry=self.registry)
+            PlatformCollector(registry=self.registry)
+            self.loop_lag = loop_lag_histogram(self.registry)
+        else:
+            self.loop_lag = None
+
+        self.updates = Counter(
+            "telgbot_updates_total", "Updates received", ["type"], registry=self.registry)
+        self.update_lag = Histogram(
+            "telgbot_update_lag_seconds", "Delay between a message being sent and the bot seeing it",
+            buckets=LAG_BUCKETS, registry=self.registry)
+        self.handler_latency = Histogram(
+            "telgbot_handler_latency_seconds", "Handler run time", ["handler"],
+            buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.handler_calls = Counter(
+            "telgbot_handler_calls_total", "Handler invocations by outcome", ["handler", "outcome"],
+            registry=self.registry)
+        self.send_latency = Histogram(
+            "telgbot_send_latency_seconds", "Bot API call time for outgoing messages", ["method"],
+            buckets=LATENCY_BUCKETS, registry=self.registry)
+        self.sends = Counter(
+            "telgbot_sends_total", "Outgoing Bot API calls by outcome", ["method", "outcome"],
+            registry=self.registry)
+        self.api_errors = Counter(
+            "telgbot_api_errors_total", "Telegram API errors by type", ["method", "error"],
+            registry=self.registry)
+        self.scheduler_lag = scheduler_lag_histogram(self.registry)
+        self.queue_depth = Gauge(
+            "telgbot_queue_depth", "Items waiting in internal queues", ["queue"], registry=self.registry)
+        self.updates_shed = Counter(
+            "telgbot_updates_shed_total", "Incoming updates or reply work dropped under load", ["reason"],
+            registry=self.registry)
+        self.duplicates = Counter(
+            "telgbot_duplicates_total", "Replayed updates and repeated sends that were skipped", ["kind"],
+            registry=self.registry)
+        self.log_dropped = Gauge(
+            "telgbot_log_records_dropped", "Log records dropped because the log queue was full",
+            registry=self.registry)
+
+    def track_queue(self, name: str, size: Callable[[], int]):
+        """Report ``size()`` as the depth of queue ``name`` on every scrape"""
+        self.queue_depth.labels(name).set_function(size)
+
+    # --- Handlers --------------------------------------------------------
+
+    async def observe_update(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
+        """Count every update and measure how long it took to reach us"""
+        kind = update_type(update) or "unknown"
+        self.updates.labels(kind).inc()
+        message = update.effective_message
+        if message is not None and message.date is not None:
+            self.update_lag.observe(max(0.0, time.time() - message.date.timestamp()))
+
+    def instrument(self, name: str, callback: Callable) -> Callable:
+        """Wrap a handler callback to record its latency and outcome"""
+        latency = self.handler_latency.labels(name)
+        ok = self.handler_calls.labels(name, "ok")
+        error = self.handler_calls.labels(name, "error")
+
+        @functools.wraps(callback)
+        async def wrapper(update, context):
+            started = time.perf_counter()
+            try:
+                result = await callback(update, context)
+            except ApplicationHandlerStop:
+                # Deliberately ends dispatch for this update
+                ok.inc()
+                raise
+            except Exception:
+                error.inc()
+                raise
+            finally:
+                latency.observe(time.perf_counter() - started)
+            ok.inc()
+            return result
+
+        return wrapper
+
+    def instrument_application(self, application: Application):
+        """Instrument every handler registered on ``application``"""
+        for handlers in application.handlers.values():
+            for handler in handlers:
+                if not getattr(handler.callback, "__instrumented__", False):
+                    handler.callback = self.instrument(handler.callback.__name__, handler.callback)
+                    handler.callback.__instrumented__ = True
+
+    # --- Sends and scheduler ------------------------------------------------
+
+    def observe_send(self, method: str, seconds: float, error: Optional[Exception] = None):
+        self.send_latency.labels(method).observe(seconds)
+        if error is None:
+            self.sends.labels(method, "ok").inc()
+            return
+        self.sends.labels(method, "error").inc()
+        if isinstance(error, TelegramError):
+            self.api_errors.labels(method, type(error).__name__).inc()
+
+    def observe_scheduler_lag(self, seconds: float):
+        self.scheduler_lag.observe(seconds)
+
+    # --- Reporting ---------------------------------------------------------
+
+    def uptime(self) -> float:
+        return time.time() - self.started_at
+
+    def total(self, sample_name: str, **labels: str) -> float:
+        """Sum every sample called ``sample_name`` whose labels include ``labels``"""
+        value = 0.0
+        for metric in self.registry.collect():
+            for sample in metric.samples:
+                if sample.name == sample_name and all(sample.labels.get(k) == v for k, v in labels.items()):
+                    value += sample.value
+        return value
+
+    def summary(self) -> Dict[str, float]:
+        """Headline numbers for /status"""
+        handled = self.total("telgbot_handler_latency_seconds_count")
+        return {
+            "uptime": self.uptime(),
+            "updates": self.total("telgbot_updates_total"),
+            "handler_errors": self.total("telgbot_handler_calls_total", outcome="error"),
+            "avg_handler_ms": 1000 * self.total("telgbot_handler_latency_seconds_sum") / handled if handled else 0.0,
+            "sent": self.total("telgbot_sends_total", outcome="ok"),
+            "send_errors": self.total("telgbot_sends_total", outcome="error"),
+            "retry_after": self.total("telgbot_api_errors_total", error="RetryAfter"),
+            "outbound_queue": self.total("telgbot_queue_depth", queue="outbound"),
+            "shed": self.total("telgbot_updates_shed_total"),
+        }
+
+    async def handle_metrics(self, request: web.Request) -> web.Response:
+        """aiohttp handler serving the Prometheus text format"""
+        return registry_response(self.registry)
+
+
+def loop_lag_histogram(registry: CollectorRegistry) -> Histogram:
+    """How late event-loop timers fire; one per process, since tenants share the loop"""
+    return Histogram(
+        "telgbot_loop_lag_seconds", "How late event-loop timers fire",
+        buckets=LATENCY_BUCKETS, registry=registry)
+
+
+def scheduler_lag_histogram(registry: CollectorRegistry) -> Histogram:
+    """How late scheduled jobs fire; tenants report this through the runner's shared scheduler"""
+    return Histogram(
+        "telgbot_scheduler_lag_seconds", "How late scheduled jobs fire",
+        buckets=LAG_BUCKETS, registry=registry)
+
+
+def registry_response(registry: CollectorRegistry) -> web.Response:
+    """``registry`` in the Prometheus text format"""
+    response = web.Response(body=generate_latest(registry))
+    response.content_type = CONTENT_TYPE_LATEST.split(";")[0]
+    response.charset = "utf-8"
+    return response
@@ -0,0 +1,255 @@
+"""
+Compact in-memory store for scheduled posts
+"""
+
+import asyncio
+import bisect
+import time
+from collections import deque
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .search import PostIndex
+
+MEDIA_TYPES = ("photo", "video", "document")
+
+# Telegram limits for media posts
+MAX_ALBUM_SIZE = 10
+MAX_CAPTION_LENGTH = 1024
+
+
+@dataclass(frozen=True, slots=True)
+class MediaItem:
+    """One attachment: a Telegram file_id, a local file path or a URL"""
+
+    type: str
+    file_id: Optional[str] = None
+    path: Optional[str] = None
+    url: Optional[str] = None
+
+    def to_dict(self) -> Dict[str, str]:
+        data = {"type": self.type}
+        for source in ("file_id", "path", "url"):
+            value = getattr(self, source)
+            if value is not None:
+                data[source] = value
+        return data
+
+    @classmethod
+    def from_dict(cls, data: Any) -> "MediaItem":
+        if not isinstance(data, dict) or data.get("type") not in MEDIA_TYPES:
+            raise ValueError(f"media type must be one of {', '.join(MEDIA_TYPES)}")
+        sources = {key: data[key] for key in ("file_id", "path", "url") if data.get(key)}
+        if len(sources) != 1 or not all(isinstance(value, str) for value in sources.values()):
+            raise ValueError("each media item needs exactly one of file_id, path or url")
+        return cls(data["type"], **sources)
+
+
+def parse_media(value: Any) -> Tuple[MediaItem, ...]:
+    """Validate a JSON media list (or a single item) from the database or an import"""
+    if value is None:
+        return ()
+    items = tuple(MediaItem.from_dict(item) for item in (value if isinstance(value, list) else [value]))
+    if len(items) > MAX_ALBUM_SIZE:
+        raise ValueError(f"at most {MAX_ALBUM_SIZE} media items per post")
+    return items
+
+
+@dataclass(slots=True)
+class ScheduledPost:
+    """A single post; timestamps are epoch seconds"""
+
+    id: int
+    content: str
+    created_at: float
+    scheduled_for: Optional[float] = None
+    posted_at: Optional[float] = None
+    # Attachments; the content becomes their caption
+    media: Tuple[MediaItem, ...] = ()
+
+    @property
+    def posted(self) -> bool:
+        return self.posted_at is not None
+
+
+class PostStore:
+    """
+    Holds every post by id plus a FIFO of posts waiting for the auto-post rotation.
+
+    Posts pinned to a time (``scheduled_for``) are published by their own
+    scheduler job and never enter the rotation queue. Posted or removed ids
+    are skipped lazily at the head of the queue, so ``next_pending`` is O(1)
+    amortized and the counters never require a scan. A sorted list of ids
+    backs cursor paging; removed ids are skipped and compacted lazily too.
+    The word index behind ``search`` is built on first use (in a thread by
+    ``build_index``) and kept up to date from then on.
+    """
+
+    def __init__(self):
+        self._posts: Dict[int, ScheduledPost] = {}
+        self._rotation: Deque[int] = deque()
+        self._ids: List[int] = []
+        self._removed = 0
+        self._next_id = 1
+        self._index: Optional[PostIndex] = None
+        # While the index is built in a thread, the changes to replay on it afterwards
+        self._index_changes: Optional[List[tuple]] = None
+        self._index_build: Optional[asyncio.Future] = None
+        self.pending_count = 0
+        self.posted_count = 0
+
+    def __len__(self) -> int:
+        return len(self._posts)
+
+    def __iter__(self) -> Iterator[ScheduledPost]:
+        return iter(self._posts.values())
+
+    def __bool__(self) -> bool:
+        return bool(self._posts)
+
+    def get(self, post_id: int) -> Optional[ScheduledPost]:
+        return self._posts.get(post_id)
+
+    @property
+    def last_id(self) -> int:
+        """The highest id this store has held, including removed posts"""
+        return self._next_id - 1
+
+    def add(self, content: str, scheduled_for: Optional[float] = None,
+            media: Tuple[MediaItem, ...] = (), post_id: Optional[int] = None,
+            posted_at: Optional[float] = None) -> ScheduledPost:
+        """Create a new post, numbered after the last one unless ``post_id`` is given; pending unless ``posted_at`` is"""
+        if post_id is None:
+            post_id = self._next_id
+        elif post_id in self._posts:
+            raise ValueError(f"post {post_id} already exists")
+        post = ScheduledPost(post_id, content, time.time(), scheduled_for, posted_at, media)
+        self._insert(post)
+        return post
+
+    def load(self, posts: Iterable[ScheduledPost]):
+        """Bulk-insert posts that already have ids, e.g. from the database"""
+        for post in posts:
+            self._insert(post)
+
+    def _insert(self, post: ScheduledPost):
+        self._posts[post.id] = post
+        if not self._ids or post.id > self._ids[-1]:
+            self._ids.append(post.id)
+        else:
+            bisect.insort(self._ids, post.id)
+        self._next_id = max(self._next_id, post.id + 1)
+        self._indexed("add", post.id, post.content, post.posted)
+        if post.posted:
+            self.posted_count += 1
+        else:
+            self.pending_count += 1
+            if post.scheduled_for is None:
+                self._rotation.append(post.id)
+
+    def next_pending(self) -> Optional[ScheduledPost]:
+        """Return the oldest unposted post in the rotation without removing it"""
+        rotation = self._rotation
+        while rotation:
+            post = self._posts.get(rotation[0])
+            if post is not None and not post.posted:
+                return post
+            rotation.popleft()
+        return None
+
+    def mark_posted(self, post: ScheduledPost, posted_at: Optional[float] = None):
+        if post.posted:
+            return
+        post.posted_at = posted_at or time.time()
+        self.pending_count -= 1
+        self.posted_count += 1
+        self._indexed("set_posted", post.id)
+
+    def edit(self, post: ScheduledPost, content: str):
+        """Replace the text of a post"""
+        self._indexed("remove", post.id, post.content)
+        self._indexed("add", post.id, content, post.posted)
+        post.content = content
+
+    def remove(self, post_id: int) -> Optional[ScheduledPost]:
+        """Delete a post; its rotation slot is dropped lazily"""
+        post = self._posts.pop(post_id, None)
+        if post is not None:
+            if post.posted:
+                self.posted_count -= 1
+            else:
+                self.pending_count -= 1
+            self._indexed("remove", post_id, post.content)
+            self._removed += 1
+            if self._removed > len(self._ids) // 2:
+                self._ids = [i for i in self._ids if i in self._posts]
+                self._removed = 0
+        return post
+
+    def _indexed(self, method: str, *args):
+        """Apply a change to the word index, or queue it while the index is being built"""
+        if self._index is not None:
+            getattr(self._index, method)(*args)
+        elif self._index_changes is not None:
+            self._index_changes.append((method, args))
+
+    def _snapshot(self) -> List[Tuple[int, str, bool]]:
+        return [(post.id, post.content, post.posted) for post in self._posts.values()]
+
+    async def build_index(self):
+        """Build the word index without blocking the event loop"""
+        if self._index is not None:
+            return
+        if self._index_build is None:
+            self._index_changes = []
+            self._index_build = asyncio.ensure_future(asyncio.to_thread(PostIndex.from_posts, self._snapshot()))
+        build = self._index_build
+        try:
+            index = await asyncio.shield(build)
+        except Exception:
+            if self._index_build is build:
+                self._index_build = self._index_changes = None
+            raise
+        if self._index_build is build:
+            if self._index is None:
+                for method, args in self._index_changes:
+                    getattr(index, method)(*args)
+                self._index = index
+            self._index_build = self._index_changes = None
+
+    def search(self, query: str, offset: int, limit: int,
+               posted: Optional[bool] = None) -> Tuple[int, List[ScheduledPost]]:
+        """Number of posts matching ``query`` and ``limit`` of them from ``offset``, best first"""
+        if self._index is None:
+            self._index = PostIndex.from_posts(self._snapshot())
+        total, page = self._index.search(query, offset, limit, posted)
+        return total, [self._posts[post_id] for post_id, _ in page]
+
+    def pinned(self) -> List[ScheduledPost]:
+        """Return unposted posts that are pinned to a publish time"""
+        return [post for post in self._posts.values() if post.scheduled_for is not None and not post.posted]
+
+    def page_after(self, cursor: int, limit: int) -> List[ScheduledPost]:
+        """Return up to ``limit`` posts with ids greater than ``cursor``, in id order"""
+        page = []
+        ids = self._ids
+        for i in range(bisect.bisect_right(ids, cursor), len(ids)):
+            post = self._posts.get(ids[i])
+            if post is not None:
+                page.append(post)
+                if len(page) == limit:
+                    break
+        return page
+
+    def page_before(self, cursor: int, limit: int) -> List[ScheduledPost]:
+        """Return up to ``limit`` posts with ids less than ``cursor``, in id order"""
+        page = []
+        ids = self._ids
+        for i in range(bisect.bisect_left(ids, cursor) - 1, -1, -1):
+            post = self._posts.get(ids[i])
+            if post is not None:
+                page.append(post)
+                if len(page) == limit:
+                    break
+        page.reverse()
+        return page
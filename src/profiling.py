@@ -0,0 +1,156 @@
+"""
+Event-loop lag watchdog and on-demand profiling of the running bot
+"""
+
+import asyncio
+import cProfile
+import logging
+import pstats
+import sys
+import threading
+import time
+import traceback
+from pathlib import Path
+from typing import Callable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Frames of the blocked callback included in a watchdog warning
+STACK_LIMIT = 30
+
+
+class LoopWatchdog:
+    """
+    Measure event-loop lag and report whatever blocks the loop.
+
+    A loop timer fires every ``interval`` seconds and reports how late it
+    ran to ``on_lag``. A watchdog thread checks that the timer keeps firing;
+    once it has been late for ``threshold`` seconds the loop is stuck in one
+    callback, and the thread logs that callback's stack while it is still
+    running. Each stall is logged once, with its total length when it ends.
+    """
+
+    def __init__(self, threshold: float = 0.25, interval: float = 0.1,
+                 on_lag: Optional[Callable[[float], None]] = None):
+        self.threshold = threshold
+        self.interval = interval
+        self.on_lag = on_lag
+        self.stalls = 0
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[int] = None
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._thread: Optional[threading.Thread] = None
+        self._stopped = threading.Event()
+        # When the loop timer is next due, and whether the current stall was logged
+        self._due = 0.0
+        self._reported = False
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None
+
+    async def start(self):
+        if self._thread is not None:
+            return
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._stopped.clear()
+        self._due = time.monotonic() + self.interval
+        self._timer = self._loop.call_later(self.interval, self._tick)
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+
+    async def stop(self):
+        if self._thread is None:
+            return
+        self._stopped.set()
+        self._timer.cancel()
+        await asyncio.to_thread(self._thread.join)
+        self._thread = None
+
+    def _tick(self):
+        now = time.monotonic()
+        lag = max(0.0, now - self._due)
+        if self._reported:
+            logger.warning("Event loop was blocked for %.2fs", lag + self.interval)
+            self._reported = False
+        if self.on_lag is not None:
+            self.on_lag(lag)
+        self._due = now + self.interval
+        self._timer = self._loop.call_later(self.interval, self._tick)
+
+    def _watch(self):
+        while not self._stopped.wait(self.threshold / 2):
+            if self._reported or time.monotonic() - self._due < self.threshold:
+                continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            self._reported = True
+            self.stalls += 1
+            stack = "".join(traceback.format_stack(frame, limit=STACK_LIMIT))
+            logger.warning("Event loop blocked for over %.2fs in:\n%s", self.threshold, stack)
+
+
+class ProfilerBusy(RuntimeError):
+    """Only one profile can be captured at a time"""
+
+
+class LoopProfiler:
+    """
+    Capture a cProfile profile of everything the event loop runs for a while.
+
+    The profiler is enabled on the loop thread, so every handler, job and
+    send that runs during the capture is included; work in to_thread
+    helpers is not. Capturing costs a few times the normal CPU per call,
+    which is why it only runs on demand and for at most ``max_seconds``.
+    """
+
+    def __init__(self, max_seconds: float = 300):
+        self.max_seconds = max_seconds
+        self._profile: Optional[cProfile.Profile] = None
+
+    @property
+    def running(self) -> bool:
+        return self._profile is not None
+
+    async def capture(self, seconds: float) -> pstats.Stats:
+        """Profile the loop for ``seconds`` (capped at ``max_seconds``)"""
+        if self._profile is not None:
+            raise ProfilerBusy("a profile is already being captured")
+        profile = self._profile = cProfile.Profile()
+        try:
+            profile.enable()
+            try:
+                await asyncio.sleep(min(seconds, self.max_seconds))
+            finally:
+                profile.disable()
+        finally:
+            self._profile = None
+        return pstats.Stats(profile)
+
+
+def _is_idle(filename: str, name: str) -> bool:
+    # The selector poll (epoll, kqueue, select...) is where the loop waits for work
+    return filename == "~" and "of 'select." in name
+
+
+def idle_seconds(stats: pstats.Stats) -> float:
+    """Time the loop spent waiting for I/O or timers during the capture"""
+    return sum(own for (filename, _, name), (_, _, own, _, _) in stats.stats.items() if _is_idle(filename, name))
+
+
+def top_functions(stats: pstats.Stats, limit: int = 15) -> List[Tuple[str, int, float, float]]:
+    """(function, calls, own seconds, cumulative seconds) of the functions with the most own time, idle waits aside"""
+    rows = []
+    for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+        if _is_idle(filename, name):
+            continue
+        if filename == "~":
+            # Builtins are reported as '~' with the name in brackets
+            label = name
+        else:
+            label = f"{name} ({Path(filename).name}:{line})"
+        rows.append((label, calls, own, cumulative))
+    rows.sort(key=lambda row: row[2], reverse=True)
+    return rows[:limit]
@@ -0,0 +1,164 @@
+"""
+Reply templates selected by trigger keywords
+"""
+
+import random
+from collections import deque
+from dataclasses import dataclass
+from typing import Dict, Iterator, List, Optional, Sequence, Tuple
+
+
+@dataclass(slots=True)
+class ReplyTemplate:
+    """A reply; with no triggers it is a generic reply usable for any message"""
+
+    content: str
+    triggers: Tuple[str, ...] = ()
+
+
+def parse_triggers(value: str) -> Tuple[str, ...]:
+    """Split a comma-separated trigger list, dropping blanks and duplicates"""
+    seen = {}
+    for trigger in value.split(","):
+        trigger = " ".join(trigger.split()).casefold()
+        if trigger:
+            seen[trigger] = None
+    return tuple(seen)
+
+
+def _is_word(char: str) -> bool:
+    return char.isalnum() or char == "_"
+
+
+class KeywordAutomaton:
+    """
+    Aho-Corasick automaton over casefolded keywords.
+
+    Keywords are added to the trie one at a time. Failure and output links
+    are recomputed lazily (one BFS over the trie) before the next search, so
+    a burst of additions costs one rebuild. Searching is a single pass over
+    the text whatever the number of keywords.
+    """
+
+    def __init__(self):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        # Values of keywords ending at a node, and the nearest suffix node that has some
+        self._values: List[List[Tuple[int, int]]] = [[]]
+        self._output_link: List[int] = [0]
+        self._count = 0
+        self._dirty = False
+
+    def __len__(self) -> int:
+        return self._count
+
+    def add(self, keyword: str, value: int):
+        keyword = keyword.casefold()
+        if not keyword:
+            return
+        node = 0
+        for char in keyword:
+            child = self._goto[node].get(char)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][char] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._values.append([])
+                self._output_link.append(0)
+            node = child
+        self._values[node].append((len(keyword), value))
+        self._count += 1
+        self._dirty = True
+
+    def _build(self):
+        goto, fail, values, output_link = self._goto, self._fail, self._values, self._output_link
+        queue = deque()
+        for child in goto[0].values():
+            fail[child] = 0
+            output_link[child] = 0
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for char, child in goto[node].items():
+                state = fail[node]
+                while state and char not in goto[state]:
+                    state = fail[state]
+                fail[child] = goto[state].get(char, 0)
+                link = fail[child]
+                output_link[child] = link if values[link] else output_link[link]
+                queue.append(child)
+        self._dirty = False
+
+    def search(self, text: str) -> Iterator[Tuple[int, int, int]]:
+        """Yield (start, end, value) for every keyword occurrence in casefolded ``text``"""
+        if self._dirty:
+            self._build()
+        goto, fail, values, output_link = self._goto, self._fail, self._values, self._output_link
+        node = 0
+        for index, char in enumerate(text):
+            while node and char not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(char, 0)
+            match = node if values[node] else output_link[node]
+            while match:
+                for length, value in values[match]:
+                    yield index + 1 - length, index + 1, value
+                match = output_link[match]
+
+
+class ReplyMatcher:
+    """
+    Reply templates indexed by their trigger keywords.
+
+    ``choose`` scans the message once with the keyword automaton and prefers
+    the template with the longest trigger found as a whole word or phrase;
+    when nothing matches it falls back to a random generic template. The cost
+    per message depends on the message length, not on the number of templates.
+    """
+
+    def __init__(self, templates: Sequence[ReplyTemplate] = ()):
+        self.templates: List[ReplyTemplate] = []
+        self._generic: List[int] = []
+        self._automaton = KeywordAutomaton()
+        for template in templates:
+            self.add(template)
+
+    def __len__(self) -> int:
+        return len(self.templates)
+
+    def __iter__(self) -> Iterator[ReplyTemplate]:
+        return iter(self.templates)
+
+    def add(self, template: ReplyTemplate) -> int:
+        """Index ``template`` and return its position"""
+        position = len(self.templates)
+        self.templates.append(template)
+        if template.triggers:
+            for trigger in template.triggers:
+                self._automaton.add(trigger, position)
+        else:
+            self._generic.append(position)
+        return position
+
+    def match(self, text: str) -> List[Tuple[int, ReplyTemplate]]:
+        """(trigger length, template) for every trigger found in ``text`` as a whole word"""
+        text = text.casefold()
+        matches = []
+        for start, end, position in self._automaton.search(text):
+            if start > 0 and _is_word(text[start - 1]) and _is_word(text[start]):
+                continue
+            if end < len(text) and _is_word(text[end]) and _is_word(text[end - 1]):
+                continue
+            matches.append((end - start, self.templates[position]))
+        return matches
+
+    def choose(self, text: str, rng: random.Random = random) -> Optional[str]:
+        """Pick a reply for ``text``, or None if there is nothing suitable"""
+        matches = self.match(text) if len(self._automaton) else []
+        if matches:
+            longest = max(length for length, _ in matches)
+            return rng.choice([t.content for length, t in matches if length == longest])
+        if self._generic:
+            return self.templates[rng.choice(self._generic)].content
+        return None
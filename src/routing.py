@@ -0,0 +1,130 @@
+"""
+Which update types the bot subscribes to, derived from its handlers
+"""
+
+from typing import Iterable, List, Optional, Set
+
+from telegram import Update
+from telegram.ext import (
+    Application,
+    BaseHandler,
+    CallbackQueryHandler,
+    ChatJoinRequestHandler,
+    ChatMemberHandler,
+    ChosenInlineResultHandler,
+    CommandHandler,
+    ConversationHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    PollAnswerHandler,
+    PollHandler,
+    PreCheckoutQueryHandler,
+    PrefixHandler,
+    ShippingQueryHandler,
+    filters,
+)
+
+MESSAGE_TYPES = frozenset({
+    Update.MESSAGE, Update.EDITED_MESSAGE, Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST,
+})
+
+# Handlers that only ever see one kind of update
+FIXED_TYPES = {
+    CallbackQueryHandler: {Update.CALLBACK_QUERY},
+    InlineQueryHandler: {Update.INLINE_QUERY},
+    ChosenInlineResultHandler: {Update.CHOSEN_INLINE_RESULT},
+    ShippingQueryHandler: {Update.SHIPPING_QUERY},
+    PreCheckoutQueryHandler: {Update.PRE_CHECKOUT_QUERY},
+    PollHandler: {Update.POLL},
+    PollAnswerHandler: {Update.POLL_ANSWER},
+    ChatJoinRequestHandler: {Update.CHAT_JOIN_REQUEST},
+}
+
+UPDATE_TYPE_FILTERS = {
+    filters.UpdateType.MESSAGE: {Update.MESSAGE},
+    filters.UpdateType.EDITED_MESSAGE: {Update.EDITED_MESSAGE},
+    filters.UpdateType.MESSAGES: {Update.MESSAGE, Update.EDITED_MESSAGE},
+    filters.UpdateType.CHANNEL_POST: {Update.CHANNEL_POST},
+    filters.UpdateType.EDITED_CHANNEL_POST: {Update.EDITED_CHANNEL_POST},
+    filters.UpdateType.CHANNEL_POSTS: {Update.CHANNEL_POST, Update.EDITED_CHANNEL_POST},
+    filters.UpdateType.EDITED: {Update.EDITED_MESSAGE, Update.EDITED_CHANNEL_POST},
+}
+
+
+class _MediaGroup(filters.MessageFilter):
+    """Messages that are part of an album"""
+
+    __slots__ = ()
+
+    def filter(self, message) -> bool:
+        return message.media_group_id is not None
+
+
+MEDIA_GROUP = _MediaGroup(name="MEDIA_GROUP")
+
+
+def filter_update_types(message_filter: filters.BaseFilter) -> Set[str]:
+    """
+    Message update types a filter can accept.
+
+    Only ``filters.UpdateType`` narrows the result; every other filter looks
+    at message content and is assumed to accept any message kind.
+    """
+    known = UPDATE_TYPE_FILTERS.get(message_filter)
+    if known is not None:
+        return set(known)
+    and_filter = getattr(message_filter, "and_filter", None)
+    or_filter = getattr(message_filter, "or_filter", None)
+    if and_filter is not None and not isinstance(and_filter, bool):
+        return filter_update_types(message_filter.base_filter) & filter_update_types(and_filter)
+    if or_filter is not None and not isinstance(or_filter, bool):
+        return filter_update_types(message_filter.base_filter) | filter_update_types(or_filter)
+    inverted = getattr(message_filter, "inv_filter", None)
+    if inverted is not None and inverted in UPDATE_TYPE_FILTERS:
+        return set(MESSAGE_TYPES - UPDATE_TYPE_FILTERS[inverted])
+    return set(MESSAGE_TYPES)
+
+
+def handler_update_types(handler: BaseHandler) -> Set[str]:
+    """Update types ``handler`` can handle; unknown handlers get every type"""
+    for handler_class, types in FIXED_TYPES.items():
+        if isinstance(handler, handler_class):
+            return set(types)
+    if isinstance(handler, (CommandHandler, PrefixHandler, MessageHandler)):
+        return filter_update_types(handler.filters)
+    if isinstance(handler, ChatMemberHandler):
+        if handler.chat_member_types == ChatMemberHandler.MY_CHAT_MEMBER:
+            return {Update.MY_CHAT_MEMBER}
+        if handler.chat_member_types == ChatMemberHandler.CHAT_MEMBER:
+            return {Update.CHAT_MEMBER}
+        return {Update.MY_CHAT_MEMBER, Update.CHAT_MEMBER}
+    if isinstance(handler, ConversationHandler):
+        nested = [*handler.entry_points, *handler.fallbacks,
+                  *(h for handlers in handler.states.values() for h in handlers)]
+        return set().union(*(handler_update_types(h) for h in nested))
+    return set(Update.ALL_TYPES)
+
+
+def allowed_updates(application: Application) -> List[str]:
+    """
+    The smallest ``allowed_updates`` list that still reaches every handler.
+
+    Handlers in negative groups only do bookkeeping on updates that are
+    delivered anyway (metrics, cluster sync), so they don't widen the set.
+    """
+    return update_types_for(
+        handler for group, handlers in application.handlers.items() if group >= 0 for handler in handlers
+    )
+
+
+def update_types_for(handlers: Iterable[BaseHandler]) -> List[str]:
+    """Update types any of ``handlers`` can handle, as an ``allowed_updates`` list"""
+    types: Set[str] = set()
+    for handler in handlers:
+        types |= handler_update_types(handler)
+    return [str(update_type) for update_type in sorted(types)]
+
+
+def update_type(update: Update) -> Optional[str]:
+    """Which kind of update ``update`` is, e.g. ``"message"``"""
+    return next((name for name in Update.ALL_TYPES if getattr(update, name, None) is not None), None)
@@ -0,0 +1,301 @@
+"""
+Asyncio-native job scheduler backed by a heap of due times
+"""
+
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from datetime import datetime, timedelta, timezone, tzinfo
+from typing import Awaitable, Callable, List, Optional, Set
+from zoneinfo import ZoneInfo
+
+logger = logging.getLogger(__name__)
+
+JobCallback = Callable[[], Awaitable[None]]
+
+# Default anchor of interval triggers, so fire times survive restarts
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class Trigger:
+    """Computes when a job should fire next"""
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        """Return the first fire time strictly after ``after``, or None when exhausted"""
+        raise NotImplementedError
+
+
+class DateTrigger(Trigger):
+    """Fire once at an absolute point in time"""
+
+    def __init__(self, run_at: datetime, tz: Optional[tzinfo] = None):
+        if run_at.tzinfo is None:
+            run_at = run_at.replace(tzinfo=tz or timezone.utc)
+        self.run_at = run_at
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        return self.run_at if self.run_at > after else None
+
+    def __repr__(self) -> str:
+        return f"DateTrigger({self.run_at.isoformat()})"
+
+
+class IntervalTrigger(Trigger):
+    """
+    Fire every ``interval``, starting one interval after ``start``.
+
+    ``start`` defaults to the Unix epoch rather than the current time, so a
+    restarted process keeps the same fire times instead of pushing the next
+    run a whole interval out.
+    """
+
+    def __init__(self, interval: timedelta, start: Optional[datetime] = None):
+        if interval <= timedelta(0):
+            raise ValueError("interval must be positive")
+        self.interval = interval
+        self.start = start or EPOCH
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        if after < self.start:
+            return self.start + self.interval
+        # Skip missed runs instead of firing them all back to back
+        elapsed = (after - self.start) // self.interval + 1
+        return self.start + elapsed * self.interval
+
+    def __repr__(self) -> str:
+        return f"IntervalTrigger({self.interval})"
+
+
+class CronTrigger(Trigger):
+    """Fire on a five-field cron expression (minute hour day month weekday) in a time zone"""
+
+    _RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression: str, tz: Optional[tzinfo] = None):
+        fields = expression.split()
+        if len(fields) != 5:
+            raise ValueError(f"cron expression needs 5 fields, got {len(fields)}: {expression!r}")
+        self.expression = expression
+        self.tz = tz or timezone.utc
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse_field(field, low, high) for field, (low, high) in zip(fields, self._RANGES)
+        )
+        # Both 0 and 7 mean Sunday
+        self.weekdays = sorted({day % 7 for day in weekdays})
+        # Standard cron: if both day fields are restricted, either may match. As in
+        # Vixie cron, a field starting with "*" (such as "*/2") counts as unrestricted
+        self._any_day = fields[2].startswith("*")
+        self._any_weekday = fields[4].startswith("*")
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> List[int]:
+        values = set()
+        for part in field.split(","):
+            step = 1
+            if "/" in part:
+                part, step_text = part.split("/", 1)
+                step = int(step_text)
+                if step < 1:
+                    raise ValueError(f"invalid cron step: {step_text!r}")
+            if part == "*":
+                start, end = low, high
+            elif "-" in part:
+                start_text, end_text = part.split("-", 1)
+                start, end = int(start_text), int(end_text)
+            else:
+                start = int(part)
+                end = high if step > 1 else start
+            if start < low or end > high or start > end:
+                raise ValueError(f"cron value out of range {low}-{high}: {part!r}")
+            values.update(range(start, end + 1, step))
+        return sorted(values)
+
+    def _day_matches(self, day: datetime) -> bool:
+        if day.month not in self.months:
+            return False
+        in_days = day.day in self.days
+        # datetime.weekday() is Monday=0; cron uses Sunday=0
+        in_weekdays = (day.weekday() + 1) % 7 in self.weekdays
+        if self._any_day or self._any_weekday:
+            return in_days and in_weekdays
+        return in_days or in_weekdays
+
+    def next_fire(self, after: datetime) -> Optional[datetime]:
+        local = after.astimezone(self.tz).replace(second=0, microsecond=0) + timedelta(minutes=1)
+        day = local.replace(hour=0, minute=0)
+        # Five years covers every valid combination, including Feb 29
+        for _ in range(366 * 5):
+            if self._day_matches(day):
+                for hour in self.hours:
+                    if day.date() == local.date() and hour < local.hour:
+                        continue
+                    for minute in self.minutes:
+                        if day.date() == local.date() and hour == local.hour and minute < local.minute:
+                            continue
+                        candidate = datetime(day.year, day.month, day.day, hour, minute, tzinfo=self.tz)
+                        if candidate > after:
+                            return candidate
+            day = (day + timedelta(days=1)).replace(hour=0, minute=0)
+        return None
+
+    def __repr__(self) -> str:
+        return f"CronTrigger({self.expression!r}, {self.tz})"
+
+
+class Job:
+    """A scheduled callback and its position in the scheduler heap"""
+
+    __slots__ = ("id", "name", "callback", "trigger", "next_run", "cancelled")
+
+    def __init__(self, job_id: int, name: str, callback: JobCallback, trigger: Trigger):
+        self.id = job_id
+        self.name = name
+        self.callback = callback
+        self.trigger = trigger
+        self.next_run: Optional[datetime] = None
+        self.cancelled = False
+
+    def __repr__(self) -> str:
+        return f"Job({self.id}, {self.name!r}, {self.trigger!r}, next_run={self.next_run})"
+
+
+class Scheduler:
+    """
+    Runs jobs on the event loop at their due times.
+
+    Due times are kept in a binary heap, so adding a job is O(log n) and the
+    runner sleeps exactly until the earliest deadline instead of polling.
+    Cancelled jobs are dropped lazily when they reach the top of the heap.
+    """
+
+    def __init__(self, max_jobs: int = 50000, on_lag: Optional[Callable[[float], None]] = None):
+        self.max_jobs = max_jobs
+        # Called with how many seconds late each job fired
+        self.on_lag = on_lag
+        self._heap: List[tuple] = []
+        self._counter = itertools.count()
+        self._jobs = {}
+        self._cancelled = 0
+        self._wakeup: Optional[asyncio.Event] = None
+        self._runner: Optional[asyncio.Task] = None
+        self._running: Set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._jobs)
+
+    def add_job(self, callback: JobCallback, trigger: Trigger, name: Optional[str] = None) -> Job:
+        """Schedule ``callback`` to run whenever ``trigger`` fires"""
+        if len(self._jobs) >= self.max_jobs:
+            raise OverflowError(f"scheduler is full ({self.max_jobs} jobs)")
+
+        job_id = next(self._counter)
+        job = Job(job_id, name or getattr(callback, "__name__", "job"), callback, trigger)
+        job.next_run = trigger.next_fire(datetime.now(timezone.utc))
+        if job.next_run is None:
+            logger.warning("Job %s has no future fire time; not scheduling", job.name)
+            return job
+
+        self._jobs[job_id] = job
+        self._push(job)
+        return job
+
+    def cancel(self, job: Job):
+        """Cancel a job; it will never fire again"""
+        if job.cancelled or self._jobs.pop(job.id, None) is None:
+            return
+        job.cancelled = True
+        self._cancelled += 1
+        # Compact the heap once dead entries dominate it
+        if self._cancelled > 64 and self._cancelled > len(self._heap) // 2:
+            self._heap = [entry for entry in self._heap if not entry[2].cancelled]
+            heapq.heapify(self._heap)
+            self._cancelled = 0
+
+    def get_jobs(self) -> List[Job]:
+        """Return all active jobs"""
+        return list(self._jobs.values())
+
+    def next_run_time(self) -> Optional[datetime]:
+        """Return the earliest pending fire time"""
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+            self._cancelled -= 1
+        return self._heap[0][2].next_run if self._heap else None
+
+    async def start(self):
+        """Start dispatching jobs on the running event loop"""
+        if self._runner is not None:
+            return
+        self._wakeup = asyncio.Event()
+        self._runner = asyncio.create_task(self._run(), name="scheduler")
+        logger.info("⏰ Scheduler started with %d jobs", len(self._jobs))
+
+    async def stop(self):
+        """Stop dispatching and wait for running jobs to finish"""
+        if self._runner is None:
+            return
+        self._runner.cancel()
+        try:
+            await self._runner
+        except asyncio.CancelledError:
+            pass
+        self._runner = None
+        if self._running:
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    def _push(self, job: Job):
+        heapq.heappush(self._heap, (job.next_run.timestamp(), job.id, job))
+        # Only wake the runner when the earliest deadline moved forward
+        if self._wakeup is not None and self._heap[0][2] is job:
+            self._wakeup.set()
+
+    async def _run(self):
+        while True:
+            delay = None
+            while self._heap:
+                due, _, job = self._heap[0]
+                if job.cancelled:
+                    heapq.heappop(self._heap)
+                    self._cancelled -= 1
+                    continue
+                delay = due - time.time()
+                if delay > 0:
+                    break
+                heapq.heappop(self._heap)
+                self._fire(job)
+                delay = None
+
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def _fire(self, job: Job):
+        fired_at = job.next_run
+        if self.on_lag is not None:
+            self.on_lag(max(0.0, time.time() - fired_at.timestamp()))
+        task = asyncio.create_task(self._execute(job), name=f"job-{job.name}")
+        self._running.add(task)
+        task.add_done_callback(self._running.discard)
+
+        job.next_run = job.trigger.next_fire(max(fired_at, datetime.now(timezone.utc)))
+        if job.next_run is None:
+            self._jobs.pop(job.id, None)
+        else:
+            self._push(job)
+
+    async def _execute(self, job: Job):
+        try:
+            await job.callback()
+        except Exception as e:
+            logger.error("Scheduled job %s failed: %s", job.name, e, exc_info=True)
+
+
+def parse_timezone(name: str) -> tzinfo:
+    """Resolve an IANA time zone name, treating UTC specially"""
+    if not name or name.upper() == "UTC":
+        return timezone.utc
+    return ZoneInfo(name)
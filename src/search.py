@@ -0,0 +1,156 @@
+"""
+Inverted index for finding posts by the words in them
+"""
+
+import heapq
+import math
+import re
+from bisect import bisect_left
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+TOKEN_RE = re.compile(r"\w+")
+
+# Query words shorter than this only match whole words, so "a" does not expand to half the vocabulary
+MIN_PREFIX_LENGTH = 2
+# A word that merely starts with the query word scores this fraction of an exact match
+PREFIX_WEIGHT = 0.5
+
+# BM25 term-frequency saturation and length normalization
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+
+def tokenize(text: str) -> List[str]:
+    """Casefolded words of ``text``"""
+    return TOKEN_RE.findall(text.casefold())
+
+
+class PostIndex:
+    """
+    Word postings over post content, with prefix matching and BM25 ranking.
+
+    Every word maps to the posts containing it and how often, so a query
+    touches only the posts that contain its words. The sorted vocabulary
+    used for prefix matching is rebuilt lazily before the next search, so a
+    bulk import costs one sort; words whose last post was removed are
+    skipped until then. Every query word must match (as a word or, from
+    MIN_PREFIX_LENGTH characters on, as a prefix); posts are ranked by their
+    summed BM25 score, newest first among equals.
+    """
+
+    def __init__(self):
+        self._postings: Dict[str, Dict[int, int]] = {}
+        self._words: List[str] = []
+        self._dirty = False
+        # post id -> number of words
+        self._lengths: Dict[int, int] = {}
+        self._total_length = 0
+        self._posted: Set[int] = set()
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    @classmethod
+    def from_posts(cls, posts: Iterable[Tuple[int, str, bool]]) -> "PostIndex":
+        """Index (id, text, posted) of many posts"""
+        index = cls()
+        for post_id, text, posted in posts:
+            index.add(post_id, text, posted)
+        return index
+
+    def add(self, post_id: int, text: str, posted: bool = False):
+        """Index a post that is not indexed yet"""
+        words = tokenize(text)
+        all_postings = self._postings
+        for word in words:
+            postings = all_postings.get(word)
+            if postings is None:
+                postings = all_postings[word] = {}
+                self._dirty = True
+            postings[post_id] = postings.get(post_id, 0) + 1
+        self._lengths[post_id] = len(words)
+        self._total_length += len(words)
+        if posted:
+            self._posted.add(post_id)
+
+    def remove(self, post_id: int, text: str):
+        """Drop a post; ``text`` is what it was indexed with"""
+        length = self._lengths.pop(post_id, None)
+        if length is None:
+            return
+        self._total_length -= length
+        self._posted.discard(post_id)
+        for word in set(tokenize(text)):
+            postings = self._postings.get(word)
+            if postings is not None and postings.pop(post_id, None) is not None and not postings:
+                del self._postings[word]
+
+    def set_posted(self, post_id: int, posted: bool = True):
+        if post_id not in self._lengths:
+            return
+        if posted:
+            self._posted.add(post_id)
+        else:
+            self._posted.discard(post_id)
+
+    def _expand(self, word: str) -> List[Tuple[str, float]]:
+        """Indexed words matching the query word ``word``, with their weights"""
+        if len(word) < MIN_PREFIX_LENGTH:
+            return [(word, 1.0)] if word in self._postings else []
+        if self._dirty:
+            self._words = sorted(self._postings)
+            self._dirty = False
+        matches = []
+        words = self._words
+        for i in range(bisect_left(words, word), len(words)):
+            term = words[i]
+            if not term.startswith(word):
+                break
+            if term in self._postings:
+                matches.append((term, 1.0 if term == word else PREFIX_WEIGHT))
+        return matches
+
+    def search(self, query: str, offset: int = 0, limit: int = 10,
+               posted: Optional[bool] = None) -> Tuple[int, List[Tuple[int, float]]]:
+        """
+        Rank the posts matching every word of ``query``.
+
+        Returns the number of matches and (post id, score) for ``limit`` of
+        them starting at ``offset``; ``posted`` keeps only posted (True) or
+        pending (False) posts.
+        """
+        expansions = [self._expand(word) for word in dict.fromkeys(tokenize(query))]
+        if not expansions or not all(expansions):
+            return 0, []
+        # Rarest word first: later words only score posts still in the running
+        expansions.sort(key=lambda terms: sum(len(self._postings[term]) for term, _ in terms))
+
+        count = len(self._lengths)
+        average_length = self._total_length / count or 1.0
+        scores: Optional[Dict[int, float]] = None
+        for terms in expansions:
+            matches: Dict[int, float] = {}
+            for term, weight in terms:
+                postings = self._postings[term]
+                idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+                if scores is None or len(postings) <= len(scores):
+                    candidates = postings.items()
+                else:
+                    candidates = [(post_id, postings[post_id]) for post_id in scores if post_id in postings]
+                for post_id, frequency in candidates:
+                    if scores is not None and post_id not in scores:
+                        continue
+                    norm = 1 - BM25_B + BM25_B * self._lengths[post_id] / average_length
+                    score = weight * idf * frequency * (BM25_K1 + 1) / (frequency + BM25_K1 * norm)
+                    # A post counts once per query word, by its best-matching word
+                    if score > matches.get(post_id, 0.0):
+                        matches[post_id] = score
+            scores = matches if scores is None else {post_id: scores[post_id] + score
+                                                     for post_id, score in matches.items()}
+            if not scores:
+                return 0, []
+
+        if posted is not None:
+            scores = {post_id: score for post_id, score in scores.items() if (post_id in self._posted) == posted}
+        best = heapq.nsmallest(offset + limit, scores.items(), key=lambda item: (-item[1], -item[0]))
+        return len(scores), best[offset:]
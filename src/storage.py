@@ -0,0 +1,601 @@
+"""
+Async SQLAlchemy persistence with write-behind batching
+"""
+
+import asyncio
+import logging
+from datetime import date, datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from sqlalchemy import (
+    JSON, BigInteger, Boolean, Date, DateTime, Integer, String, Text, case, delete, inspect, select, text, update,
+)
+from sqlalchemy.exc import DataError, IntegrityError
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
+
+from .dispatcher import parse_chat_id
+from .fanout import DeliveryState, TargetDelivery
+from .posts import ScheduledPost, parse_media
+from .replies import ReplyTemplate
+
+logger = logging.getLogger(__name__)
+
+# Rows per INSERT statement; keeps SQLite under its bound-parameter limit
+CHUNK_SIZE = 500
+
+# Repositories on the same database (e.g. tenants of one process) share an engine:
+# url -> [engine, number of open repositories, lock held while creating tables]
+_engines: Dict[str, list] = {}
+
+
+class Base(DeclarativeBase):
+    pass
+
+
+class PostRow(Base):
+    __tablename__ = "posts"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    content: Mapped[str] = mapped_column(Text)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    scheduled_for: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    posted: Mapped[bool] = mapped_column(Boolean, default=False)
+    posted_at: Mapped[Optional[datetime]] = mapped_column(DateTime(timezone=True), nullable=True)
+    media: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True)
+
+
+class ReplyTemplateRow(Base):
+    __tablename__ = "reply_templates"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    position: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    content: Mapped[str] = mapped_column(Text)
+    triggers: Mapped[Optional[Any]] = mapped_column(JSON, nullable=True)
+
+
+class AwayMessageRow(Base):
+    __tablename__ = "away_messages"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    user_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    sent_on: Mapped[date] = mapped_column(Date, index=True)
+
+
+class OutboxRow(Base):
+    __tablename__ = "outbox"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    # Worker n numbers its sends from n << 32, past the range of a 32-bit INTEGER
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    chat_id: Mapped[str] = mapped_column(String(64))
+    method: Mapped[str] = mapped_column(String(32))
+    payload: Mapped[Any] = mapped_column(JSON)
+    priority: Mapped[int] = mapped_column(Integer)
+    key: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    worker: Mapped[int] = mapped_column(Integer, default=0)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    max_retries: Mapped[Optional[int]] = mapped_column(Integer, nullable=True)
+
+
+class DeadLetterRow(Base):
+    """A durable send that failed for good, kept for inspection"""
+
+    __tablename__ = "dead_letters"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    id: Mapped[int] = mapped_column(BigInteger, primary_key=True, autoincrement=False)
+    chat_id: Mapped[str] = mapped_column(String(64))
+    method: Mapped[str] = mapped_column(String(32))
+    payload: Mapped[Any] = mapped_column(JSON)
+    key: Mapped[Optional[str]] = mapped_column(String(128), nullable=True)
+    error: Mapped[str] = mapped_column(Text)
+    failed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class PostDeliveryRow(Base):
+    __tablename__ = "post_deliveries"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    post_id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=False)
+    chat_id: Mapped[str] = mapped_column(String(64), primary_key=True)
+    state: Mapped[str] = mapped_column(String(16))
+    message_id: Mapped[Optional[int]] = mapped_column(BigInteger, nullable=True)
+    attempts: Mapped[int] = mapped_column(Integer, default=0)
+    error: Mapped[Optional[str]] = mapped_column(Text, nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+
+
+class MediaFileRow(Base):
+    __tablename__ = "media_files"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    key: Mapped[str] = mapped_column(String(80), primary_key=True)
+    file_id: Mapped[str] = mapped_column(Text)
+    used_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
+class SentKeyRow(Base):
+    """Idempotency keys of recent sends, so a restart does not send them again"""
+
+    __tablename__ = "sent_keys"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    key: Mapped[str] = mapped_column(String(128), primary_key=True)
+    sent_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), index=True)
+
+
+class CounterRow(Base):
+    """Id sequences; values only ever go up, so ids are never handed out twice"""
+
+    __tablename__ = "counters"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    name: Mapped[str] = mapped_column(String(32), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger)
+
+
+class SettingRow(Base):
+    __tablename__ = "settings"
+
+    bot_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    key: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[Any] = mapped_column(JSON)
+
+
+def _add_missing_columns(conn):
+    """create_all never alters existing tables; add nullable columns introduced since"""
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name not in existing and column.nullable:
+                column_type = column.type.compile(conn.dialect)
+                conn.execute(text(f"ALTER TABLE {table.name} ADD COLUMN {column.name} {column_type}"))
+                logger.info("💾 Added column %s.%s", table.name, column.name)
+
+
+def _widen_integer_columns(conn):
+    """create_all never alters existing tables; widen INTEGER columns that are BIGINT in the model"""
+    if conn.dialect.name != "postgresql":
+        return  # SQLite integers are always 64-bit
+    inspector = inspect(conn)
+    for table in Base.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"]: column["type"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            current = existing.get(column.name)
+            if isinstance(column.type, BigInteger) and isinstance(current, Integer) \
+                    and not isinstance(current, BigInteger):
+                conn.execute(text(f"ALTER TABLE {table.name} ALTER COLUMN {column.name} TYPE BIGINT"))
+                logger.info("💾 Widened %s.%s to BIGINT", table.name, column.name)
+
+
+def to_async_url(url: str) -> str:
+    """Map a plain database URL onto its asyncio driver"""
+    scheme, sep, rest = url.partition("://")
+    if "+" in scheme:
+        return url
+    if scheme == "sqlite":
+        return f"sqlite+aiosqlite{sep}{rest}"
+    if scheme in ("postgres", "postgresql"):
+        return f"postgresql+asyncpg{sep}{rest}"
+    return url
+
+
+async def acquire_engine(url: str, pool_size: int = 5) -> AsyncEngine:
+    """The shared engine for ``url``, created (with its tables) on first use"""
+    entry = _engines.get(url)
+    if entry is None:
+        engine_kwargs = {"pool_pre_ping": True}
+        if not url.startswith("sqlite"):
+            engine_kwargs.update(pool_size=pool_size, max_overflow=pool_size)
+        entry = _engines[url] = [create_async_engine(url, **engine_kwargs), 0, asyncio.Lock()]
+        async with entry[2]:
+            try:
+                async with entry[0].begin() as conn:
+                    await conn.run_sync(Base.metadata.create_all)
+                    await conn.run_sync(_add_missing_columns)
+                    await conn.run_sync(_widen_integer_columns)
+            except BaseException:
+                del _engines[url]
+                await entry[0].dispose()
+                raise
+            logger.info("💾 Connected to database %s", entry[0].url.render_as_string(hide_password=True))
+    else:
+        # Wait until whoever created it has finished creating the tables
+        async with entry[2]:
+            pass
+        if _engines.get(url) is not entry:
+            return await acquire_engine(url, pool_size)  # creating it failed
+    entry[1] += 1
+    return entry[0]
+
+
+async def release_engine(url: str):
+    """Drop one user of ``url``'s engine; the last one disposes its pool"""
+    entry = _engines.get(url)
+    if entry is None:
+        return
+    entry[1] -= 1
+    if entry[1] <= 0:
+        del _engines[url]
+        await entry[0].dispose()
+
+
+def _to_db_time(value: Optional[float]) -> Optional[datetime]:
+    """Convert epoch seconds to an aware UTC datetime"""
+    if value is None:
+        return None
+    return datetime.fromtimestamp(value, timezone.utc)
+
+
+def _from_db_time(value: Optional[datetime]) -> Optional[float]:
+    if value is None:
+        return None
+    # SQLite drops the offset; everything is stored as UTC
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+class Repository:
+    """
+    Persists bot state for one bot id.
+
+    Reads happen once at startup; the bot keeps the loaded state in memory and
+    serves everything from there. Writes are queued, coalesced by primary key
+    and flushed in batches by a background task, so handlers never wait on a
+    commit.
+    """
+
+    def __init__(self, database_url: str, bot_id: int, pool_size: int = 5,
+                 flush_interval: float = 0.5, max_batch: int = 1000, worker: int = 0):
+        self.database_url = to_async_url(database_url)
+        self.bot_id = bot_id
+        # Cluster workers share the tables but each replays only its own outbox
+        self.worker = worker
+        self.pool_size = pool_size
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.engine: Optional[AsyncEngine] = None
+        # None marks a pending delete
+        self._pending: Dict[Tuple[str, tuple], Optional[Dict[str, Any]]] = {}
+        self._dirty: Optional[asyncio.Event] = None
+        self._flusher: Optional[asyncio.Task] = None
+        self._flush_lock = asyncio.Lock()
+
+    async def open(self):
+        """Attach to the (shared) engine and start the background flusher"""
+        self.engine = await acquire_engine(self.database_url, self.pool_size)
+        self._dirty = asyncio.Event()
+        self._flusher = asyncio.create_task(self._flush_loop(), name="repository-flush")
+
+    async def close(self):
+        """Flush outstanding writes and release the connection pool"""
+        if self._flusher is not None:
+            self._flusher.cancel()
+            try:
+                await self._flusher
+            except asyncio.CancelledError:
+                pass
+            self._flusher = None
+        if self.engine is not None:
+            await self.flush()
+            self.engine = None
+            await release_engine(self.database_url)
+
+    # --- Reads -----------------------------------------------------------
+
+    async def load_posts(self) -> List[ScheduledPost]:
+        async with self.engine.connect() as conn:
+            result = await conn.stream(
+                select(PostRow.__table__).where(PostRow.bot_id == self.bot_id).order_by(PostRow.id)
+            )
+            return [
+                ScheduledPost(
+                    row.id,
+                    row.content,
+                    _from_db_time(row.created_at),
+                    _from_db_time(row.scheduled_for),
+                    _from_db_time(row.posted_at),
+                    parse_media(row.media),
+                )
+                async for row in result
+            ]
+
+    async def load_reply_templates(self) -> List[ReplyTemplate]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(ReplyTemplateRow.content, ReplyTemplateRow.triggers)
+                .where(ReplyTemplateRow.bot_id == self.bot_id)
+                .order_by(ReplyTemplateRow.position)
+            )
+            return [ReplyTemplate(row.content, tuple(row.triggers or ())) for row in result]
+
+    async def load_away_messages(self, sent_on: date) -> List[int]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(AwayMessageRow.user_id)
+                .where(AwayMessageRow.bot_id == self.bot_id, AwayMessageRow.sent_on == sent_on)
+            )
+            return list(result.scalars())
+
+    async def load_settings(self) -> Dict[str, Any]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(SettingRow.key, SettingRow.value).where(SettingRow.bot_id == self.bot_id)
+            )
+            return {key: value for key, value in result}
+
+    async def load_deliveries(self, post_ids: Iterable[int]) -> Dict[int, List[TargetDelivery]]:
+        """Per-target delivery records of ``post_ids``"""
+        deliveries: Dict[int, List[TargetDelivery]] = {}
+        post_ids = list(post_ids)
+        async with self.engine.connect() as conn:
+            for i in range(0, len(post_ids), CHUNK_SIZE):
+                result = await conn.execute(
+                    select(PostDeliveryRow.__table__)
+                    .where(PostDeliveryRow.bot_id == self.bot_id,
+                           PostDeliveryRow.post_id.in_(post_ids[i:i + CHUNK_SIZE]))
+                )
+                for row in result:
+                    deliveries.setdefault(row.post_id, []).append(TargetDelivery(
+                        parse_chat_id(row.chat_id), DeliveryState(row.state), row.message_id,
+                        row.attempts, row.error,
+                    ))
+        return deliveries
+
+    async def load_media_files(self) -> List[Tuple[str, str]]:
+        """(key, file_id) of cached uploads, least recently used first"""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(MediaFileRow.key, MediaFileRow.file_id)
+                .where(MediaFileRow.bot_id == self.bot_id)
+                .order_by(MediaFileRow.used_at)
+            )
+            return [(key, file_id) for key, file_id in result]
+
+    async def load_sent_keys(self) -> List[str]:
+        """Idempotency keys of recent sends, oldest first"""
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(SentKeyRow.key)
+                .where(SentKeyRow.bot_id == self.bot_id)
+                .order_by(SentKeyRow.sent_at)
+            )
+            return list(result.scalars())
+
+    async def load_outbox(self) -> List[Dict[str, Any]]:
+        async with self.engine.connect() as conn:
+            result = await conn.execute(
+                select(OutboxRow.__table__)
+                .where(OutboxRow.bot_id == self.bot_id, OutboxRow.worker == self.worker)
+                .order_by(OutboxRow.id)
+            )
+            return [row._asdict() for row in result]
+
+    async def allocate_ids(self, name: str, count: int = 1, floor: int = 0) -> int:
+        """
+        Reserve ``count`` consecutive ids from sequence ``name``; returns the first.
+
+        Ids are handed out by one atomic update, so cluster workers sharing
+        the database never get the same id and a deleted id is never reused.
+        ``floor`` is the highest id already in use, for data written before
+        the sequence existed.
+        """
+        table = CounterRow.__table__
+        async with self.engine.begin() as conn:
+            await conn.execute(
+                self._insert(table).values(bot_id=self.bot_id, name=name, value=floor).on_conflict_do_nothing()
+            )
+            result = await conn.execute(
+                update(table)
+                .where(table.c.bot_id == self.bot_id, table.c.name == name)
+                .values(value=case((table.c.value < floor, floor), else_=table.c.value) + count)
+                .returning(table.c.value)
+            )
+            return result.scalar_one() - count + 1
+
+    # --- Writes (queued) -------------------------------------------------
+
+    def save_post(self, post: ScheduledPost):
+        self._queue(PostRow.__tablename__, (post.id,), {
+            "id": post.id,
+            "content": post.content,
+            "created_at": _to_db_time(post.created_at),
+            "scheduled_for": _to_db_time(post.scheduled_for),
+            "posted": post.posted,
+            "posted_at": _to_db_time(post.posted_at),
+            "media": [item.to_dict() for item in post.media] or None,
+        })
+
+    def delete_post(self, post_id: int):
+        self._queue(PostRow.__tablename__, (post_id,), None)
+
+    def save_reply_template(self, position: int, template: ReplyTemplate):
+        self._queue(ReplyTemplateRow.__tablename__, (position,), {
+            "position": position, "content": template.content, "triggers": list(template.triggers),
+        })
+
+    def mark_away_message(self, user_id: int, sent_on: date):
+        self._queue(AwayMessageRow.__tablename__, (user_id,), {"user_id": user_id, "sent_on": sent_on})
+
+    def save_setting(self, key: str, value: Any):
+        self._queue(SettingRow.__tablename__, (key,), {"key": key, "value": value})
+
+    def save_outbox(self, message_id: int, chat_id, method: str, payload: Dict[str, Any],
+                    priority: int, key: Optional[str], max_retries: Optional[int] = None):
+        self._queue(OutboxRow.__tablename__, (message_id,), {
+            "id": message_id,
+            "chat_id": str(chat_id),
+            "method": method,
+            "payload": payload,
+            "priority": priority,
+            "key": key,
+            "worker": self.worker,
+            "created_at": datetime.now(timezone.utc),
+            "max_retries": max_retries,
+        })
+
+    def save_dead_letter(self, message_id: int, chat_id, method: str, payload: Dict[str, Any],
+                         key: Optional[str], error: str):
+        self._queue(DeadLetterRow.__tablename__, (message_id,), {
+            "id": message_id,
+            "chat_id": str(chat_id),
+            "method": method,
+            "payload": payload,
+            "key": key,
+            "error": error,
+            "failed_at": datetime.now(timezone.utc),
+        })
+
+    def save_media_file(self, key: str, file_id: str):
+        self._queue(MediaFileRow.__tablename__, (key,), {
+            "key": key, "file_id": file_id, "used_at": datetime.now(timezone.utc),
+        })
+
+    def delete_media_file(self, key: str):
+        self._queue(MediaFileRow.__tablename__, (key,), None)
+
+    def save_sent_key(self, key: str):
+        self._queue(SentKeyRow.__tablename__, (key,), {"key": key, "sent_at": datetime.now(timezone.utc)})
+
+    def delete_sent_key(self, key: str):
+        self._queue(SentKeyRow.__tablename__, (key,), None)
+
+    def save_delivery(self, post_id: int, delivery: TargetDelivery):
+        self._queue(PostDeliveryRow.__tablename__, (post_id, str(delivery.chat_id)), {
+            "post_id": post_id,
+            "chat_id": str(delivery.chat_id),
+            "state": delivery.state.value,
+            "message_id": delivery.message_id,
+            "attempts": delivery.attempts,
+            "error": delivery.error,
+            "updated_at": datetime.now(timezone.utc),
+        })
+
+    def delete_deliveries(self, post_id: int):
+        # Deletes match the first key column, so this drops the post's delivery to every chat
+        self._queue(PostDeliveryRow.__tablename__, (post_id,), None)
+
+    def delete_outbox(self, message_id: int):
+        self._queue(OutboxRow.__tablename__, (message_id,), None)
+
+    def _queue(self, table: str, key: tuple, row: Optional[Dict[str, Any]]):
+        # Later writes to the same row replace earlier ones before they hit the database
+        if row is not None:
+            row["bot_id"] = self.bot_id
+        else:
+            # A delete covers every row sharing its first key column, so saves queued before
+            # it are dropped; deletes run first at flush, leaving saves queued after it intact
+            for pending in [k for k in self._pending if k[0] == table and k[1][0] == key[0]]:
+                del self._pending[pending]
+        self._pending[(table, key)] = row
+        if self._dirty is not None:
+            self._dirty.set()
+
+    async def _flush_loop(self):
+        while True:
+            await self._dirty.wait()
+            # Give bursts a moment to coalesce unless the batch is already full
+            if len(self._pending) < self.max_batch:
+                await asyncio.sleep(self.flush_interval)
+            self._dirty.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Database flush failed, will retry: %s", e)
+                self._dirty.set()
+                await asyncio.sleep(self.flush_interval)
+
+    async def flush(self):
+        """
+        Write all queued rows in a single transaction.
+
+        If the database rejects the batch because of the rows themselves
+        (bad values, constraint violations), they are written one at a time
+        and the offending rows are logged and dropped, so one bad row cannot
+        block every later write. Other errors put the batch back for a retry.
+        """
+        async with self._flush_lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+
+            try:
+                async with self.engine.begin() as conn:
+                    await self._write(conn, batch)
+            except (DataError, IntegrityError) as e:
+                logger.warning("Database rejected a batch of %d rows, writing them one by one: %s", len(batch), e.orig)
+                await self._write_each(batch)
+            except BaseException:
+                self._restore(batch)
+                raise
+
+            logger.debug("Flushed %d rows to the database", len(batch))
+
+    async def _write_each(self, batch: Dict[Tuple[str, tuple], Optional[Dict[str, Any]]]):
+        items = list(batch.items())
+        for n, (key, row) in enumerate(items):
+            try:
+                async with self.engine.begin() as conn:
+                    await self._write(conn, {key: row})
+            except (DataError, IntegrityError) as e:
+                logger.error("Dropping %s row %s the database rejected: %s", key[0], key[1], e.orig)
+            except BaseException:
+                self._restore(dict(items[n:]))
+                raise
+
+    def _restore(self, batch: Dict[Tuple[str, tuple], Optional[Dict[str, Any]]]):
+        # Put the batch back ahead of anything queued meanwhile, which is replayed over it
+        queued, self._pending = self._pending, dict(batch)
+        for (table, key), row in queued.items():
+            self._queue(table, key, row)
+
+    async def _write(self, conn, batch: Dict[Tuple[str, tuple], Optional[Dict[str, Any]]]):
+        by_table: Dict[str, List[Dict[str, Any]]] = {}
+        deletes: Dict[str, List[Any]] = {}
+        for (table, key), row in batch.items():
+            if row is None:
+                deletes.setdefault(table, []).append(key[0])
+            else:
+                by_table.setdefault(table, []).append(row)
+
+        for table_name, keys in deletes.items():
+            table = Base.metadata.tables[table_name]
+            # Deletes match (bot_id, first key column): one row, or all deliveries of a post
+            key_column = next(c for c in table.primary_key if c.name != "bot_id")
+            for i in range(0, len(keys), CHUNK_SIZE):
+                await conn.execute(
+                    delete(table).where(
+                        table.c.bot_id == self.bot_id,
+                        key_column.in_(keys[i:i + CHUNK_SIZE]),
+                    )
+                )
+        for table_name, rows in by_table.items():
+            table = Base.metadata.tables[table_name]
+            for i in range(0, len(rows), CHUNK_SIZE):
+                await conn.execute(self._upsert(table, rows[i:i + CHUNK_SIZE]))
+
+    def _insert(self, table):
+        # Only the dialect in use is imported
+        if self.engine.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        return insert(table)
+
+    def _upsert(self, table, rows: List[Dict[str, Any]]):
+        stmt = self._insert(table).values(rows)
+        primary_key = [column.name for column in table.primary_key]
+        update_columns = {
+            column.name: stmt.excluded[column.name]
+            for column in table.columns
+            if column.name not in primary_key
+        }
+        return stmt.on_conflict_do_update(index_elements=primary_key, set_=update_columns)
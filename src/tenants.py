@@ -0,0 +1,216 @@
+"""
+Multi-tenant runner: many bots in one process on one event loop
+"""
+
+import asyncio
+import json
+import logging
+import signal
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set
+
+from aiohttp import web
+from prometheus_client import CollectorRegistry, Gauge, PlatformCollector, ProcessCollector
+
+from .bot import TelegramAutoBot
+from .config import Config
+from .metrics import loop_lag_histogram, registry_response, scheduler_lag_histogram
+from .profiling import LoopProfiler, LoopWatchdog
+from .scheduler import Scheduler
+from .utils.http_client import SharedRequest, build_request
+from .utils.redis_client import close_redis
+from .webhook import WebhookServer
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class SharedResources:
+    """What the tenants of one process share instead of each opening their own"""
+
+    request: SharedRequest
+    scheduler: Scheduler
+    http_server: WebhookServer
+    profiler: LoopProfiler
+    # None when LOOP_LAG_THRESHOLD is 0
+    watchdog: Optional[LoopWatchdog]
+
+
+def load_tenants(path: str) -> List[Dict[str, Any]]:
+    """
+    Tenant settings from a JSON file: a list of objects keyed like the
+    environment variables, each with at least BOT_TOKEN and USER_ID.
+    Anything a tenant leaves out comes from the environment.
+    """
+    tenants = json.loads(Path(path).read_text(encoding="utf-8"))
+    if not isinstance(tenants, list) or not all(isinstance(tenant, dict) for tenant in tenants):
+        raise ValueError(f"{path} must hold a JSON list of objects")
+    return tenants
+
+
+def tenant_id(settings: Dict[str, Any]) -> int:
+    """The bot id of a tenant, taken from its token"""
+    bot_id = str(settings.get("BOT_TOKEN", "")).split(":", 1)[0]
+    if not bot_id.isdigit():
+        raise ValueError("tenant has no valid BOT_TOKEN")
+    return int(bot_id)
+
+
+class TenantRunner:
+    """
+    Hosts a TelegramAutoBot per tenant on one event loop.
+
+    The tenants share one HTTP connection pool, one scheduler, one HTTP
+    server (webhooks and metrics) and, through Repository, one database
+    engine per URL. Everything else (posts, settings, outbox, rate limits,
+    update intake) stays per bot, and each bot's rows are keyed by its id.
+    Tenants are added and removed while the others keep running; SIGHUP
+    re-reads TENANTS_FILE and applies the difference.
+    """
+
+    def __init__(self, config: Config):
+        self.config = config
+        # Process-wide metrics here, each tenant's own under /metrics/<bot id>
+        self.registry = CollectorRegistry()
+        ProcessCollector(registry=self.registry)
+        PlatformCollector(registry=self.registry)
+        Gauge("telgbot_tenants", "Bots hosted by this process", registry=self.registry) \
+            .set_function(lambda: len(self.tenants))
+
+        # Each polling tenant holds one connection for its long poll
+        pool_size = config.HTTP_POOL_SIZE + (0 if config.use_webhook() else config.MAX_TENANTS)
+        self.shared = SharedResources(
+            request=build_request(config, pool_size=pool_size, request_class=SharedRequest),
+            # Started and stopped here, not by the tenants
+            scheduler=Scheduler(
+                max_jobs=config.MAX_TENANTS * (config.MAX_SCHEDULED_POSTS + 1),
+                on_lag=scheduler_lag_histogram(self.registry).observe,
+            ),
+            http_server=WebhookServer(config.WEBHOOK_LISTEN, config.PORT),
+            profiler=LoopProfiler(config.PROFILE_MAX_SECONDS),
+            watchdog=None,
+        )
+        self.tenants: Dict[int, TelegramAutoBot] = {}
+        self._settings: Dict[int, Dict[str, Any]] = {}
+        # Starting or stopping one tenant never waits for another
+        self._locks: Dict[int, asyncio.Lock] = {}
+        # Reloads started by SIGHUP, kept until they finish
+        self._tasks: Set[asyncio.Task] = set()
+
+        if config.LOOP_LAG_THRESHOLD > 0:
+            self.shared.watchdog = LoopWatchdog(
+                config.LOOP_LAG_THRESHOLD, config.LOOP_LAG_INTERVAL,
+                on_lag=loop_lag_histogram(self.registry).observe,
+            )
+        self.shared.http_server.add_get_route("/metrics", self._handle_metrics)
+        self.shared.http_server.add_get_route("/metrics/{bot_id}", self._handle_tenant_metrics)
+
+    def _tenant_config(self, bot_id: int, settings: Dict[str, Any]) -> Config:
+        settings = dict(settings)
+        # Every tenant gets its own webhook path under the shared URL
+        if self.config.WEBHOOK_URL and "WEBHOOK_URL" not in settings:
+            settings["WEBHOOK_URL"] = f"{self.config.WEBHOOK_URL.rstrip('/')}/{bot_id}"
+        config = Config(settings)
+        is_valid, errors = config.validate()
+        if not is_valid:
+            raise ValueError("; ".join(errors))
+        return config
+
+    async def add(self, settings: Dict[str, Any]) -> TelegramAutoBot:
+        """Start hosting a tenant; replaces a running tenant with the same bot id"""
+        bot_id = tenant_id(settings)
+        async with self._locks.setdefault(bot_id, asyncio.Lock()):
+            if bot_id in self.tenants:
+                await self._stop(bot_id)
+            if len(self.tenants) >= self.config.MAX_TENANTS:
+                raise OverflowError(f"already hosting MAX_TENANTS ({self.config.MAX_TENANTS}) bots")
+            config = self._tenant_config(bot_id, settings)
+            bot = TelegramAutoBot(config.BOT_TOKEN, config.USER_ID, config, shared=self.shared)
+            # Reserve the slot while starting so concurrent adds respect MAX_TENANTS
+            self.tenants[bot_id] = bot
+            try:
+                await bot.start_tenant()
+            except BaseException:
+                del self.tenants[bot_id]
+                raise
+            self._settings[bot_id] = dict(settings)
+        logger.info("Tenant %s started (%d hosted)", bot_id, len(self.tenants))
+        return bot
+
+    async def remove(self, bot_id: int):
+        """Stop hosting a tenant; its state stays in the database"""
+        async with self._locks.setdefault(bot_id, asyncio.Lock()):
+            if bot_id in self.tenants:
+                await self._stop(bot_id)
+                logger.info("Tenant %s stopped (%d hosted)", bot_id, len(self.tenants))
+
+    async def _stop(self, bot_id: int):
+        bot = self.tenants.pop(bot_id)
+        self._settings.pop(bot_id, None)
+        try:
+            await bot.stop_tenant()
+        except Exception as e:
+            logger.error("Stopping tenant %s failed: %s", bot_id, e, exc_info=True)
+
+    async def reload(self):
+        """Make the hosted tenants match TENANTS_FILE"""
+        try:
+            wanted = {tenant_id(settings): settings for settings in load_tenants(self.config.TENANTS_FILE)}
+        except (OSError, ValueError) as e:
+            logger.error("Not reloading tenants: %s", e)
+            return
+
+        for bot_id in [bot_id for bot_id in self.tenants if bot_id not in wanted]:
+            await self.remove(bot_id)
+        changed = [settings for bot_id, settings in wanted.items() if self._settings.get(bot_id) != settings]
+        results = await asyncio.gather(*(self.add(settings) for settings in changed), return_exceptions=True)
+        for settings, result in zip(changed, results):
+            if isinstance(result, BaseException):
+                logger.error("Tenant %s failed to start: %s", tenant_id(settings), result)
+
+    def _reload_in_background(self):
+        task = asyncio.create_task(self.reload())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _handle_metrics(self, request: web.Request) -> web.Response:
+        return registry_response(self.registry)
+
+    async def _handle_tenant_metrics(self, request: web.Request) -> web.Response:
+        bot_id = request.match_info["bot_id"]
+        bot = self.tenants.get(int(bot_id)) if bot_id.isdigit() else None
+        if bot is None:
+            return web.Response(status=404)
+        return await bot.metrics.handle_metrics(request)
+
+    async def run(self, stop_event: Optional[asyncio.Event] = None):
+        """Host the tenants from TENANTS_FILE until SIGINT/SIGTERM (or ``stop_event``)"""
+        stop_event = stop_event or asyncio.Event()
+        loop = asyncio.get_running_loop()
+        handlers = {"SIGINT": stop_event.set, "SIGTERM": stop_event.set,
+                    "SIGHUP": self._reload_in_background}
+        for name, callback in handlers.items():
+            try:
+                loop.add_signal_handler(getattr(signal, name), callback)
+            except (NotImplementedError, AttributeError):  # Windows has no SIGHUP and no signal handlers
+                pass
+
+        await self.shared.request.initialize()
+        await self.shared.http_server.start()
+        await self.shared.scheduler.start()
+        if self.shared.watchdog is not None:
+            await self.shared.watchdog.start()
+        try:
+            await self.reload()
+            logger.info("🚀 Hosting %d bots", len(self.tenants))
+            await stop_event.wait()
+        finally:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+            await asyncio.gather(*(self.remove(bot_id) for bot_id in list(self.tenants)))
+            if self.shared.watchdog is not None:
+                await self.shared.watchdog.stop()
+            await self.shared.scheduler.stop()
+            await self.shared.http_server.stop()
+            await self.shared.request.shutdown()
+            await close_redis()
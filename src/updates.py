@@ -0,0 +1,197 @@
+"""
+Concurrent update processing that keeps each chat's updates in order
+"""
+
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from enum import IntEnum
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Hashable, List, Optional
+
+from telegram import Update
+from telegram.ext import BaseUpdateProcessor
+
+from .dispatcher import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+
+class Importance(IntEnum):
+    """How much an update matters when the bot is overloaded"""
+
+    ESSENTIAL = 0  # admin commands; never shed or rate-limited
+    NORMAL = 1
+    OPTIONAL = 2  # only reply-guy work; shed first
+
+
+class InboundLimiter:
+    """
+    Token bucket per key (user or chat) for incoming updates.
+
+    Up to ``burst`` updates pass at once, refilled at ``rate`` per second.
+    Buckets that have refilled are forgotten once there are ``max_keys``,
+    so a raid by many accounts cannot grow the table without bound.
+    """
+
+    def __init__(self, rate: float, burst: int, max_keys: int = 100_000):
+        self.rate = rate
+        self.burst = burst
+        self.max_keys = max_keys
+        self._buckets: Dict[Hashable, TokenBucket] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def allow(self, key: Hashable) -> bool:
+        if self.rate <= 0:
+            return True
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._prune()
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst)
+        return bucket.try_acquire()
+
+    def _prune(self):
+        self._buckets = {key: bucket for key, bucket in self._buckets.items() if bucket.idle_for() > 0}
+        if len(self._buckets) >= self.max_keys:
+            self._buckets.clear()
+
+
+class PerChatUpdateProcessor(BaseUpdateProcessor):
+    """
+    Process updates from different chats concurrently, one chat at a time.
+
+    Updates for the same chat wait on a FIFO lock, so handlers in one chat see
+    messages in arrival order while other chats keep flowing. An update takes
+    one of the ``max_concurrent_updates`` slots only once it holds its chat's
+    lock, so a backlog in one busy chat never occupies slots other chats
+    need. Locks exist only while a chat has updates in flight.
+
+    Intake is bounded: updates over the per-user or per-chat rate are
+    dropped, and at ``max_pending`` admitted updates every new non-essential
+    one is. Once ``high_watermark`` are pending the processor is
+    ``shedding`` until the backlog falls to ``low_watermark``; meanwhile
+    optional updates are dropped and handlers should skip optional work.
+    Essential updates always pass and skip the concurrency limit.
+    """
+
+    def __init__(self, max_concurrent_updates: int, max_pending: int = 0,
+                 high_watermark: int = 0, low_watermark: int = 0,
+                 user_limiter: Optional[InboundLimiter] = None, chat_limiter: Optional[InboundLimiter] = None,
+                 classify: Optional[Callable[[Update], Importance]] = None,
+                 on_shed: Optional[Callable[[str], None]] = None,
+                 on_start: Optional[Callable[[object], None]] = None,
+                 on_finish: Optional[Callable[[object], None]] = None):
+        super().__init__(max_concurrent_updates)
+        # chat id -> [lock, number of updates holding or waiting for it]
+        self._locks: Dict[Any, List] = {}
+        self.max_pending = max_pending
+        self.high_watermark = high_watermark
+        self.low_watermark = low_watermark
+        self.user_limiter = user_limiter
+        self.chat_limiter = chat_limiter
+        self.classify = classify
+        self.on_shed = on_shed
+        # Called when an update arrives and once it is handled or dropped
+        self.on_start = on_start
+        self.on_finish = on_finish
+        self.pending = 0
+        self.shedding = False
+        # reason -> updates (or pieces of work) dropped
+        self.shed: Dict[str, int] = {}
+        # Updates that never reached a handler
+        self.dropped = 0
+
+    def count_shed(self, reason: str):
+        """Record dropped work; handlers call it when they skip optional work"""
+        self.shed[reason] = self.shed.get(reason, 0) + 1
+        if self.on_shed is not None:
+            self.on_shed(reason)
+
+    def _shed_reason(self, update: object, importance: Importance) -> Optional[str]:
+        """Why ``update`` must be dropped, or None to admit it"""
+        if isinstance(update, Update):
+            chat, user = update.effective_chat, update.effective_user
+            if user is not None and self.user_limiter is not None and not self.user_limiter.allow(user.id):
+                return "user_rate"
+            if chat is not None and self.chat_limiter is not None and not self.chat_limiter.allow(chat.id):
+                return "chat_rate"
+        if self.max_pending and self.pending >= self.max_pending:
+            return "overload"
+        if self.shedding and importance >= Importance.OPTIONAL:
+            return "reply_guy"
+        return None
+
+    def _update_shedding(self):
+        if not self.high_watermark:
+            return
+        if not self.shedding and self.pending >= self.high_watermark:
+            self.shedding = True
+            logger.warning("Shedding optional work: %d updates pending", self.pending)
+        elif self.shedding and self.pending <= self.low_watermark:
+            self.shedding = False
+            logger.info("Stopped shedding: %d updates pending", self.pending)
+
+    async def process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        if self.on_start is not None:
+            self.on_start(update)
+        try:
+            await self._admit(update, coroutine)
+        finally:
+            if self.on_finish is not None:
+                self.on_finish(update)
+
+    async def _admit(self, update: object, coroutine: Awaitable[Any]) -> None:
+        importance = Importance.NORMAL
+        if self.classify is not None and isinstance(update, Update):
+            importance = self.classify(update)
+        if importance is not Importance.ESSENTIAL:
+            reason = self._shed_reason(update, importance)
+            if reason is not None:
+                coroutine.close()
+                self.dropped += 1
+                self.count_shed(reason)
+                return
+
+        self.pending += 1
+        self._update_shedding()
+        try:
+            async with self._chat_turn(update):
+                if importance is Importance.ESSENTIAL:
+                    await self.do_process_update(update, coroutine)
+                else:
+                    # Takes a concurrency slot, then calls do_process_update
+                    await super().process_update(update, coroutine)
+        finally:
+            self.pending -= 1
+            self._update_shedding()
+
+    @asynccontextmanager
+    async def _chat_turn(self, update: object) -> AsyncIterator[None]:
+        """Wait until every earlier update of the same chat has been processed"""
+        chat = update.effective_chat if isinstance(update, Update) else None
+        if chat is None:
+            yield
+            return
+
+        entry = self._locks.get(chat.id)
+        if entry is None:
+            entry = self._locks[chat.id] = [asyncio.Lock(), 0]
+        entry[1] += 1
+        try:
+            async with entry[0]:
+                yield
+        finally:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._locks[chat.id]
+
+    async def do_process_update(self, update: object, coroutine: Awaitable[Any]) -> None:
+        await coroutine
+
+    async def initialize(self) -> None:
+        pass
+
+    async def shutdown(self) -> None:
+        pass
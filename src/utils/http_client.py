@@ -0,0 +1,95 @@
+"""
+Shared, tunable HTTP connection pool for Bot API calls
+"""
+
+from typing import AsyncIterator, Optional
+
+import httpx
+from telegram import Bot
+from telegram.request import HTTPXRequest
+
+from ..config import Config
+
+
+class PooledRequest(HTTPXRequest):
+    """HTTPXRequest that also lets idle keep-alive connections be tuned"""
+
+    def __init__(self, connection_pool_size: int, keepalive_expiry: Optional[float] = 30.0, **kwargs):
+        self.keepalive_expiry = keepalive_expiry
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+
+    def _build_client(self) -> httpx.AsyncClient:
+        # HTTPXRequest has no keep-alive option; patch the limits it builds
+        limits: httpx.Limits = self._client_kwargs["limits"]
+        self._client_kwargs["limits"] = httpx.Limits(
+            max_connections=limits.max_connections,
+            max_keepalive_connections=limits.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+        return super()._build_client()
+
+    async def iter_bytes(self, url: str, chunk_size: int = 64 * 1024) -> AsyncIterator[bytes]:
+        """Stream a download (e.g. a file from getFile) through the shared pool"""
+        async with self._client.stream("GET", url) as response:
+            response.raise_for_status()
+            async for chunk in response.aiter_bytes(chunk_size):
+                yield chunk
+
+
+class SharedRequest(PooledRequest):
+    """
+    PooledRequest used by several bots at once (tenants of one process).
+
+    Every Bot initializes and shuts down its requests; only the first
+    ``initialize`` opens the pool and only the last ``shutdown`` closes it.
+    """
+
+    def __init__(self, connection_pool_size: int, **kwargs):
+        super().__init__(connection_pool_size=connection_pool_size, **kwargs)
+        self._users = 0
+
+    async def initialize(self) -> None:
+        self._users += 1
+        if self._users == 1:
+            await super().initialize()
+
+    async def shutdown(self) -> None:
+        if self._users == 0:
+            return
+        self._users -= 1
+        if self._users == 0:
+            await super().shutdown()
+
+
+def build_request(config: Config, pool_size: Optional[int] = None, request_class=PooledRequest) -> PooledRequest:
+    """
+    One connection pool for every Bot API call, sized and timed from Config.
+
+    The same instance is used for getUpdates and for sends; a long poll holds
+    one connection, so the pool must have at least two.
+    """
+    return request_class(
+        connection_pool_size=pool_size or config.HTTP_POOL_SIZE,
+        keepalive_expiry=config.HTTP_KEEPALIVE,
+        connect_timeout=config.HTTP_CONNECT_TIMEOUT,
+        read_timeout=config.HTTP_READ_TIMEOUT,
+        write_timeout=config.HTTP_WRITE_TIMEOUT,
+        pool_timeout=config.HTTP_POOL_TIMEOUT,
+        http_version=config.HTTP_VERSION,
+    )
+
+
+def bot_api_urls(config: Config) -> dict:
+    """``base_url``/``base_file_url`` for a self-hosted Bot API server, if configured"""
+    if not config.BOT_API_URL:
+        return {}
+    return {
+        "base_url": f"{config.BOT_API_URL}/bot",
+        "base_file_url": f"{config.BOT_API_URL}/file/bot",
+    }
+
+
+def create_bot(config: Config, request: Optional[PooledRequest] = None) -> Bot:
+    """A Bot for ``config.BOT_TOKEN`` whose calls share one pooled request"""
+    request = request or build_request(config)
+    return Bot(config.BOT_TOKEN, request=request, get_updates_request=request, **bot_api_urls(config))
@@ -1,27 +1,218 @@
 # src/utils/logger.py
+"""
+Non-blocking structured logging.
+
+Log calls only put records on a bounded queue; a QueueListener thread formats
+them as JSON with structlog and writes them to stdout and LOG_FILE, so a slow
+sink never stalls the event loop. Repeated events are rate-limited per call
+site before they reach the queue.
+"""
+
+import atexit
+import copy
 import logging
+import queue
 import sys
+import time
+from logging.handlers import QueueHandler, QueueListener
+from typing import Dict, Optional, Tuple
+
+import structlog
+
+from ..config import Config
+
+# Chatty libraries that log every request at INFO
+QUIET_LOGGERS = ("httpx", "httpcore", "apscheduler", "aiohttp.access")
+
+_listener: Optional[QueueListener] = None
+
+
+class DroppingQueueHandler(QueueHandler):
+    """QueueHandler that drops records instead of blocking when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The listener is a thread in this process, so exc_info can travel as is;
+        # only merge %-args now, since they may be mutated after the call returns
+        record = copy.copy(record)
+        if record.args:
+            record.msg = record.getMessage()
+            record.args = None
+        return record
 
-def setup_logger():
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class RateLimitFilter(logging.Filter):
     """
-    Configures and returns a logger instance for the application.
+    Token bucket per call site (logger, level and message template).
+
+    Up to ``burst`` records pass at once, refilled at ``rate`` per second.
+    Beyond that one record in ``sample_every`` still gets through, so a flood
+    stays visible; the next record that passes carries a ``suppressed`` count.
+    Records at ``exempt_level`` or above always pass.
     """
-    logger = logging.getLogger("TelgBot") # Give your logger a specific name
-    logger.setLevel(logging.INFO) # Set the default logging level to INFO
 
-    # Create a stream handler to output logs to the console
-    stream_handler = logging.StreamHandler(sys.stdout)
-    stream_handler.setLevel(logging.INFO) # Console output will show INFO and above
+    def __init__(self, rate: float, burst: int, sample_every: int = 0, max_keys: int = 10_000,
+                 exempt_level: int = logging.ERROR):
+        super().__init__()
+        self.rate = rate
+        self.burst = burst
+        self.sample_every = sample_every
+        self.max_keys = max_keys
+        self.exempt_level = exempt_level
+        # key -> [tokens, last refill, suppressed since last pass]
+        self._buckets: Dict[Tuple[str, int, str], list] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if self.rate <= 0 or record.levelno >= self.exempt_level:
+            return True
+        # structlog records carry their event dict as msg
+        template = record.msg.get("event") if isinstance(record.msg, dict) else record.msg
+        key = (record.name, record.levelno, str(template))
+        now = time.monotonic()
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            if len(self._buckets) >= self.max_keys:
+                self._buckets.clear()
+            bucket = self._buckets[key] = [float(self.burst), now, 0]
+        else:
+            bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+            bucket[1] = now
+
+        if bucket[0] >= 1:
+            bucket[0] -= 1
+        else:
+            bucket[2] += 1
+            if not self.sample_every or bucket[2] % self.sample_every:
+                return False
+        if bucket[2]:
+            record.suppressed = bucket[2]
+            bucket[2] = 0
+        return True
+
+
+def _add_record_extras(logger, method_name: str, event_dict: dict) -> dict:
+    """Copy ``suppressed`` (set by RateLimitFilter) into the structured output"""
+    record = event_dict.get("_record")
+    suppressed = getattr(record, "suppressed", None)
+    if suppressed:
+        event_dict["suppressed"] = suppressed
+    return event_dict
+
+
+def _shared_processors() -> list:
+    """Fields every record gets, whether it came from logging or structlog"""
+    return [
+        structlog.stdlib.add_log_level,
+        structlog.stdlib.add_logger_name,
+        structlog.processors.TimeStamper(fmt="iso", utc=True),
+    ]
 
-    # Define the log message format
-    formatter = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+def _formatter(log_format: str) -> structlog.stdlib.ProcessorFormatter:
+    if log_format == "console":
+        renderer = structlog.dev.ConsoleRenderer(colors=False)
+    else:
+        renderer = structlog.processors.JSONRenderer(ensure_ascii=False)
+    return structlog.stdlib.ProcessorFormatter(
+        foreign_pre_chain=_shared_processors(),
+        processors=[
+            _add_record_extras,
+            structlog.stdlib.ProcessorFormatter.remove_processors_meta,
+            structlog.processors.format_exc_info,
+            renderer,
+        ],
     )
-    stream_handler.setFormatter(formatter)
 
-    # Add the handler to the logger
-    # This check prevents adding duplicate handlers if setup_logger is called multiple times
-    if not logger.handlers:
-        logger.addHandler(stream_handler)
 
+def setup_logger(config: Optional[Config] = None) -> logging.Logger:
+    """
+    Configures and returns a logger instance for the application.
+
+    Safe to call more than once; only the first call installs the handlers.
+    """
+    global _listener
+    config = config or Config()
+    logger = logging.getLogger("TelgBot")
+    if _listener is not None:
+        return logger
+
+    level = logging.getLevelName(config.LOG_LEVEL.upper())
+    if not isinstance(level, int):
+        level = logging.INFO
+
+    formatter = _formatter(config.LOG_FORMAT)
+    sinks = [logging.StreamHandler(sys.stdout)]
+    if config.LOG_FILE:
+        sinks.append(logging.FileHandler(config.LOG_FILE, encoding="utf-8"))
+    for sink in sinks:
+        sink.setFormatter(formatter)
+
+    handler = DroppingQueueHandler(queue.Queue(config.LOG_QUEUE_SIZE))
+    exempt_level = logging.getLevelName(config.LOG_RATE_EXEMPT_LEVEL.upper())
+    if not isinstance(exempt_level, int):
+        exempt_level = logging.ERROR
+    handler.addFilter(RateLimitFilter(config.LOG_RATE_LIMIT, config.LOG_RATE_BURST, config.LOG_SAMPLE_EVERY,
+                                      exempt_level=exempt_level))
+
+    root = logging.getLogger()
+    for existing in root.handlers[:]:
+        root.removeHandler(existing)
+    root.addHandler(handler)
+    root.setLevel(level)
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(max(level, logging.WARNING))
+
+    # structlog loggers go through the same queue
+    structlog.configure(
+        processors=[
+            structlog.stdlib.filter_by_level,
+            structlog.contextvars.merge_contextvars,
+            structlog.stdlib.PositionalArgumentsFormatter(),
+            *_shared_processors(),
+            structlog.stdlib.ProcessorFormatter.wrap_for_formatter,
+        ],
+        logger_factory=structlog.stdlib.LoggerFactory(),
+        wrapper_class=structlog.stdlib.BoundLogger,
+        cache_logger_on_first_use=True,
+    )
+
+    _listener = QueueListener(handler.queue, *sinks, respect_handler_level=True)
+    _listener.start()
+    atexit.register(shutdown_logging)
     return logger
+
+
+def _queue_handler() -> Optional[DroppingQueueHandler]:
+    for handler in logging.getLogger().handlers:
+        if isinstance(handler, DroppingQueueHandler):
+            return handler
+    return None
+
+
+def queued_records() -> int:
+    """Records waiting for the listener thread"""
+    handler = _queue_handler()
+    return handler.queue.qsize() if handler else 0
+
+
+def dropped_records() -> int:
+    """Records lost because the log queue was full"""
+    handler = _queue_handler()
+    return handler.dropped if handler else 0
+
+
+def shutdown_logging():
+    """Flush queued records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
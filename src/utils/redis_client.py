@@ -0,0 +1,28 @@
+"""
+Shared Redis connections
+"""
+
+from typing import TYPE_CHECKING, Dict
+
+if TYPE_CHECKING:
+    from redis import asyncio as aioredis
+
+_clients: Dict[str, "aioredis.Redis"] = {}
+
+
+def get_redis(url: str) -> "aioredis.Redis":
+    """Return a client for ``url``, sharing one connection pool per URL"""
+    client = _clients.get(url)
+    if client is None:
+        # Imported here so deployments without Redis don't pay for it at startup
+        from redis import asyncio as aioredis
+        client = aioredis.Redis.from_url(url, decode_responses=True)
+        _clients[url] = client
+    return client
+
+
+async def close_redis():
+    """Close every shared client"""
+    while _clients:
+        _, client = _clients.popitem()
+        await client.aclose()
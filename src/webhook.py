@@ -0,0 +1,108 @@
+"""
+Webhook receiver for Telegram updates
+"""
+
+import hmac
+import json
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import urlparse
+
+from aiohttp import web
+from telegram import Update
+from telegram.ext import Application
+
+logger = logging.getLogger(__name__)
+
+SECRET_HEADER = "X-Telegram-Bot-Api-Secret-Token"
+
+
+class WebhookServer:
+    """Async HTTP server that feeds webhook updates into Applications"""
+
+    def __init__(self, host: str = "0.0.0.0", port: int = 8000):
+        self.host = host
+        self.port = port
+        self.app = web.Application()
+        self.app.router.add_post("/{path:.*}", self._handle_update)
+        self.app.router.add_get("/healthz", self._handle_health)
+        self._routes: Dict[str, Tuple[str, Application]] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    def add_route(self, path: str, secret_token: str, application: Application):
+        """Route updates POSTed to ``path`` into ``application``"""
+        self._routes["/" + path.strip("/")] = (secret_token, application)
+
+    def remove_route(self, path: str):
+        """Stop accepting updates on ``path``"""
+        self._routes.pop("/" + path.strip("/"), None)
+
+    def add_get_route(self, path: str, handler):
+        """Serve an extra GET endpoint (e.g. /metrics) on the same port"""
+        self.app.router.add_get(path, handler)
+
+    async def start(self):
+        """Start listening on the configured host and port"""
+        self._runner = web.AppRunner(self.app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        logger.info("🌐 Webhook server listening on %s:%s", self.host, self.port)
+
+    async def stop(self):
+        """Stop the HTTP server"""
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    async def _handle_health(self, request: web.Request) -> web.Response:
+        return web.Response(text="ok")
+
+    async def _handle_update(self, request: web.Request) -> web.Response:
+        route = self._routes.get(request.path)
+        if route is None:
+            return web.Response(status=404)
+
+        secret_token, application = route
+        received = request.headers.get(SECRET_HEADER, "")
+        if not hmac.compare_digest(received.encode(), secret_token.encode()):
+            logger.warning("Rejected webhook request with bad secret token from %s", request.remote)
+            return web.Response(status=403)
+
+        updates = _parse_updates(await request.read())
+        if updates is None:
+            return web.Response(status=400)
+        for data in updates:
+            update = _to_update(data, application)
+            if update is not None:
+                application.update_queue.put_nowait(update)
+
+        # Reply immediately; the Application processes the queue on its own.
+        return web.Response(status=200)
+
+
+def _parse_updates(body: bytes) -> Optional[List[Any]]:
+    """The updates in a request body, or None if it is not an update or a list of them"""
+    try:
+        payload = json.loads(body)
+    except ValueError:
+        return None
+    # Telegram sends one update per request, but accept batches as well
+    # so relays and load tests can deliver several at once.
+    if isinstance(payload, dict):
+        return [payload]
+    return payload if isinstance(payload, list) else None
+
+
+def _to_update(data: Any, application: Application) -> Optional[Update]:
+    # A malformed update is dropped; failing the request would make the sender retry it forever
+    try:
+        return Update.de_json(data, application.bot)
+    except Exception as e:
+        logger.warning("Dropping malformed update %.200r: %s", data, e)
+        return None
+
+
+def webhook_path(webhook_url: str) -> str:
+    """Return the URL path Telegram will POST updates to"""
+    return urlparse(webhook_url).path or "/"
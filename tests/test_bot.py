@@ -0,0 +1,122 @@
+import asyncio
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+from telegram import Chat, Message, Update
+from telegram.ext import ApplicationHandlerStop
+
+from src.bot import TelegramAutoBot
+from src.cluster import LocalStateStore
+from src.profiling import LoopProfiler
+from src.config import Config
+
+
+@pytest.fixture
+def config(tmp_path):
+    return Config({"BOT_TOKEN": "123:abc", "USER_ID": 1, "DATABASE_URL": f"sqlite:///{tmp_path / 'bot.db'}"})
+
+
+@pytest.fixture
+def bot(config):
+    return TelegramAutoBot(config.BOT_TOKEN, config.USER_ID, config)
+
+
+def test_cluster_front_ends_ask_for_what_the_workers_handle(config, bot):
+    assert TelegramAutoBot.routed_updates(config) == bot.allowed_updates()
+    assert "chat_member" not in bot.allowed_updates()
+
+
+@pytest.mark.asyncio
+async def test_spawned_tasks_are_kept_until_done(bot):
+    release = asyncio.Event()
+    task = bot._spawn(release.wait())
+    assert bot._tasks == {task}
+    release.set()
+    await task
+    await asyncio.sleep(0)
+    assert bot._tasks == set()
+
+
+@pytest.mark.asyncio
+async def test_album_failures_are_logged(bot, monkeypatch, caplog):
+    async def fail(*args):
+        raise RuntimeError("database is down")
+
+    monkeypatch.setattr(bot, "_add_post", fail)
+    bot._albums["album"] = {"items": [], "content": "Caption", "update": None}
+    await bot._finish_album("album")
+    assert "Adding album album failed: database is down" in caplog.text
+    assert bot._albums == {}
+
+
+@pytest.mark.asyncio
+async def test_update_types_without_a_handler_are_dropped(bot):
+    message = Message(1, None, Chat(1, Chat.PRIVATE), text="hi")
+    await bot._drop_unhandled(Update(1, message=message), None)
+    with pytest.raises(ApplicationHandlerStop):
+        await bot._drop_unhandled(Update(2, channel_post=message), None)
+
+
+@pytest.mark.asyncio
+async def test_shared_state_reloads_in_the_background(bot, monkeypatch):
+    bot.cluster_store = LocalStateStore()
+    release = asyncio.Event()
+    loads = []
+
+    async def load_state():
+        loads.append(bot._state_version)
+        await release.wait()
+
+    async def flush():
+        pass
+
+    monkeypatch.setattr(bot, "load_state", load_state)
+    monkeypatch.setattr(bot.repository, "flush", flush)
+
+    # Another worker changed the state: updates go on while it is reloaded
+    await bot.cluster_store.incr(bot._state_version_key())
+    await asyncio.wait_for(bot._sync_before_update(None, None), 1)
+    await asyncio.sleep(0)
+    assert loads == ["1"]
+
+    # A second change while loading makes it load once more; a caller that needs it waits
+    await bot.cluster_store.incr(bot._state_version_key())
+    waiter = asyncio.create_task(bot.sync_shared_state(max_age=0))
+    await asyncio.sleep(0.01)
+    assert not waiter.done()
+    release.set()
+    await asyncio.wait_for(waiter, 1)
+    assert loads == ["1", "2"]
+
+
+@pytest.mark.asyncio
+async def test_profile_command_reports_the_busiest_functions(bot, monkeypatch):
+    replies, documents = [], []
+
+    async def reply(update, text, **kwargs):
+        replies.append(text)
+
+    async def submit(method, chat_id, document, caption, **kwargs):
+        documents.append((method, chat_id, Path(document).suffix, Path(document).exists(), caption))
+
+    monkeypatch.setattr(bot, "reply", reply)
+    monkeypatch.setattr(bot.dispatcher, "submit", submit)
+    bot.profiler = LoopProfiler(max_seconds=1)
+    update = SimpleNamespace(effective_chat=SimpleNamespace(id=1))
+
+    await bot.profile_command(update, SimpleNamespace(args=["5"]))
+    assert replies == ["❌ Usage: `/profile <seconds>` (up to 1)"]
+    assert not bot._tasks
+
+    replies.clear()
+    await bot.profile_command(update, SimpleNamespace(args=["0.05"]))
+    assert replies == ["⏱ Profiling for 0.05s..."]
+    # The capture runs as a tracked task, off the update path
+    await asyncio.wait_for(asyncio.gather(*bot._tasks), 2)
+
+    summary = replies[1].splitlines()
+    assert summary[0].startswith("⏱ Event loop busy") and summary[0].endswith("calls)")
+    assert summary[2] == "own s   cum s     calls  function"
+    assert documents == [("send_document", 1, ".prof", True, "📈 0.05s cProfile")]
+
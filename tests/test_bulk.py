@@ -0,0 +1,119 @@
+import io
+import json
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from src.bulk import PostRecord, detect_format, parse_posts, write_export
+from src.posts import MediaItem, ScheduledPost
+
+FUTURE = "2099-01-01T09:00:00+00:00"
+FUTURE_TS = datetime.fromisoformat(FUTURE).timestamp()
+
+
+async def chunks(data: bytes, size: int = 7):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+async def parse(data: str, fmt: str, size: int = 7):
+    return [row async for row in parse_posts(chunks(data.encode(), size), fmt, timezone.utc)]
+
+
+def test_detect_format():
+    assert detect_format("posts.CSV") == "csv"
+    assert detect_format("posts.ndjson") == "jsonl"
+    assert detect_format("posts.txt") is None
+    assert detect_format(None) is None
+
+
+@pytest.mark.asyncio
+async def test_csv_with_header_and_multiline_quotes():
+    data = f'scheduled_for,content\n{FUTURE},"Line one\nline ""two"""\n,Plain ünïcode\n'
+    assert await parse(data, "csv") == [
+        (2, PostRecord('Line one\nline "two"', FUTURE_TS)),
+        (4, PostRecord("Plain ünïcode")),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_csv_without_header():
+    assert await parse(f"First post,{FUTURE}\nSecond post\n", "csv", size=3) == [
+        (1, PostRecord("First post", FUTURE_TS)),
+        (2, PostRecord("Second post")),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_invalid_rows_are_reported_by_line():
+    data = "content,scheduled_for\n  ,\nok,2000-01-01T00:00:00\nlater,not a date\n" + "x" * 5000 + "\n"
+    errors = dict(await parse(data, "csv"))
+    assert list(errors) == [2, 3, 4, 5]
+    assert errors[2] == "content is empty"
+    assert errors[3] == "publish time is in the past"
+    assert "not a date" in errors[4]
+    assert errors[5] == "content is longer than 4096 characters"
+
+
+@pytest.mark.asyncio
+async def test_jsonl_objects_and_strings():
+    data = "\n".join([
+        json.dumps({"content": "An object", "publish_at": FUTURE_TS}),
+        json.dumps("Just text"),
+        "",
+        "[1, 2]",
+        "{broken",
+    ])
+    rows = await parse(data, "jsonl")
+    assert rows[:2] == [(1, PostRecord("An object", FUTURE_TS)), (2, PostRecord("Just text"))]
+    assert [number for number, row in rows[2:]] == [4, 5]
+    assert rows[2][1] == "expected an object or a string"
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+async def test_export_of_pending_posts_imports_again(fmt):
+    posts = [
+        ScheduledPost(1, 'Quoted "text",\nover two lines', time.time()),
+        ScheduledPost(2, "Pinned", time.time(), scheduled_for=FUTURE_TS),
+        ScheduledPost(3, "Album", time.time(),
+                      media=(MediaItem("photo", file_id="abc"), MediaItem("video", url="https://x/v.mp4"))),
+    ]
+    out = io.BytesIO()
+    assert write_export(posts, fmt, out, timezone.utc) == 3
+    assert not out.closed
+
+    rows = await parse(out.getvalue().decode(), fmt)
+    assert [row for _, row in rows] == [
+        PostRecord(posts[0].content), PostRecord("Pinned", FUTURE_TS), PostRecord("Album", media=posts[2].media),
+    ]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("fmt", ["csv", "jsonl"])
+async def test_posted_posts_round_trip_with_their_past_times(fmt):
+    posted = ScheduledPost(1, "Sent", time.time() - 120, scheduled_for=1735732800.0, posted_at=1735732810.0)
+    missed = ScheduledPost(2, "Missed", time.time() - 120, scheduled_for=1735732800.0)
+    out = io.BytesIO()
+    write_export([posted, missed], fmt, out, timezone.utc)
+
+    rows = await parse(out.getvalue().decode(), fmt)
+    assert rows[0][1] == PostRecord("Sent", posted.scheduled_for, posted_at=posted.posted_at)
+    # A pending post whose time went by needs a new one
+    assert rows[1][1] == "publish time is in the past"
+
+
+@pytest.mark.asyncio
+async def test_media_rows():
+    data = "\n".join([
+        json.dumps({"media": {"type": "document", "path": "report.pdf"}}),
+        json.dumps({"content": "x", "media": [{"type": "audio", "file_id": "a"}]}),
+        json.dumps({"content": "x", "media": [{"type": "photo", "file_id": "a", "url": "https://x"}]}),
+        json.dumps({"content": "x" * 1025, "media": [{"type": "photo", "file_id": "a"}]}),
+    ])
+    rows = dict(await parse(data, "jsonl"))
+    assert rows[1] == PostRecord("", media=(MediaItem("document", path="report.pdf"),))
+    assert rows[2] == "media type must be one of photo, video, document"
+    assert rows[3] == "each media item needs exactly one of file_id, path or url"
+    assert rows[4] == "content is longer than 1024 characters"
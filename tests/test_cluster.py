@@ -0,0 +1,206 @@
+import asyncio
+from types import SimpleNamespace
+
+import aiohttp
+import pytest
+import pytest_asyncio
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+
+from src.cluster import WORKER_PATH, HashRing, LeaderLease, LocalStateStore, UpdateRouter, routing_key
+from src.webhook import SECRET_HEADER
+
+NODES = ["http://worker-0", "http://worker-1", "http://worker-2"]
+
+
+def test_routing_is_stable_and_uses_every_node():
+    ring = HashRing(NODES)
+    owners = {chat_id: ring.node_for(chat_id) for chat_id in range(1000)}
+    assert owners == {chat_id: HashRing(NODES).node_for(chat_id) for chat_id in range(1000)}
+    assert set(owners.values()) == set(NODES)
+
+
+def test_removing_a_node_only_moves_its_keys():
+    ring = HashRing(NODES)
+    before = {chat_id: ring.node_for(chat_id) for chat_id in range(1000)}
+    ring.remove(NODES[1])
+    for chat_id, owner in before.items():
+        if owner != NODES[1]:
+            assert ring.node_for(chat_id) == owner
+        else:
+            assert ring.node_for(chat_id) != NODES[1]
+
+
+def test_adding_a_node_only_takes_keys_for_itself():
+    ring = HashRing(NODES[:2])
+    before = {chat_id: ring.node_for(chat_id) for chat_id in range(1000)}
+    ring.add(NODES[2])
+    moved = [chat_id for chat_id, owner in before.items() if ring.node_for(chat_id) != owner]
+    assert moved
+    assert all(ring.node_for(chat_id) == NODES[2] for chat_id in moved)
+
+
+def test_empty_ring():
+    with pytest.raises(LookupError):
+        HashRing([]).node_for(1)
+
+
+def test_updates_route_by_chat():
+    assert routing_key({"update_id": 1, "message": {"chat": {"id": -100}, "from": {"id": 7}}}) == -100
+    assert routing_key({"update_id": 2, "callback_query": {"from": {"id": 7}, "message": {"chat": {"id": 5}}}}) == 5
+    assert routing_key({"update_id": 3, "callback_query": {"from": {"id": 7}}}) == 7
+    assert routing_key({"update_id": 4, "inline_query": {"from": {"id": 8}}}) == 8
+    assert routing_key({"update_id": 5}) == 5
+
+
+@pytest.mark.asyncio
+async def test_local_store_expiry_and_conditional_set():
+    store = LocalStateStore()
+    assert await store.set("key", "a", ttl=0.05, nx=True)
+    assert not await store.set("key", "b", nx=True)
+    assert await store.get("key") == "a"
+    await asyncio.sleep(0.06)
+    assert await store.get("key") is None
+    assert await store.incr("version") == 1
+    assert await store.incr("version") == 2
+
+
+@pytest.mark.asyncio
+async def test_one_leader_at_a_time():
+    store = LocalStateStore()
+    first = LeaderLease(store, "jobs", ttl=1, owner="first")
+    second = LeaderLease(store, "jobs", ttl=1, owner="second")
+    await first.start()
+    await second.start()
+    try:
+        assert first.is_leader and not second.is_leader
+        assert not await store.renew(first.key, "second", 1)
+
+        await first.stop()
+        await second._tick()
+        assert second.is_leader
+    finally:
+        await first.stop()
+        await second.stop()
+    assert await store.get(second.key) is None
+
+
+class FakeWorker:
+    """A worker endpoint answering with ``statuses`` in turn (then 200); records every batch it gets"""
+
+    def __init__(self, *statuses):
+        self.statuses = list(statuses)
+        self.batches = []
+        app = web.Application()
+        app.router.add_post(WORKER_PATH, self.accept)
+        self.server = TestServer(app)
+
+    async def accept(self, request):
+        assert request.headers[SECRET_HEADER] == "secret"
+        self.batches.append([data["update_id"] for data in await request.json()])
+        return web.Response(status=self.statuses.pop(0) if self.statuses else 200)
+
+    async def wait_for(self, count: int):
+        for _ in range(300):
+            if len(self.batches) >= count:
+                return
+            await asyncio.sleep(0.01)
+
+
+@pytest_asyncio.fixture
+async def forward():
+    """Starts a router whose only worker is the given FakeWorker"""
+    started = []
+
+    async def start(worker: FakeWorker):
+        await worker.server.start_server()
+        url = str(worker.server.make_url("/")).rstrip("/")
+        router = UpdateRouter(SimpleNamespace(CLUSTER_SECRET="secret"), [url])
+        router._session = aiohttp.ClientSession()
+        queue = router._queues[url] = asyncio.Queue()
+        started.append((router, worker, asyncio.create_task(router._send_loop(url, queue))))
+        return router
+
+    yield start
+    for router, worker, sender in started:
+        sender.cancel()
+        await asyncio.gather(sender, return_exceptions=True)
+        await router._session.close()
+        await worker.server.close()
+
+
+def chat_update(update_id: int) -> dict:
+    return {"update_id": update_id, "message": {"chat": {"id": 1}}}
+
+
+@pytest.mark.asyncio
+async def test_router_forwards_batches_to_the_owning_worker(forward):
+    worker = FakeWorker()
+    router = await forward(worker)
+    for update_id in range(3):
+        router.route(chat_update(update_id))
+    await worker.wait_for(1)
+    assert worker.batches == [[0, 1, 2]]
+
+
+@pytest.mark.asyncio
+async def test_rejected_batches_are_dropped_and_failed_ones_retried(forward):
+    worker = FakeWorker(400, 503)
+    router = await forward(worker)
+    router.route(chat_update(1))
+    await worker.wait_for(1)
+    router.route(chat_update(2))
+    await worker.wait_for(3)
+    assert worker.batches == [[1], [2], [2]]
+
+
+class FakePollingBot:
+    """getUpdates returning one update, then nothing; records the offset of every call"""
+
+    def __init__(self):
+        self.offsets = []
+
+    async def get_updates(self, offset, timeout, allowed_updates):
+        self.offsets.append(offset)
+        if len(self.offsets) == 1:
+            return [SimpleNamespace(update_id=7, to_dict=lambda: chat_update(7))]
+        await asyncio.sleep(3600)
+
+
+@pytest.mark.asyncio
+async def test_polled_updates_are_confirmed_only_once_the_worker_has_them(forward):
+    worker = FakeWorker(503)
+    router = await forward(worker)
+    bot = FakePollingBot()
+    poller = asyncio.create_task(router._poll(bot))
+    try:
+        await worker.wait_for(1)
+        await asyncio.sleep(0.05)
+        # The worker failed the batch, so the offset has not moved past it
+        assert bot.offsets == [None]
+
+        await worker.wait_for(2)
+        for _ in range(100):
+            if len(bot.offsets) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert bot.offsets == [None, 8]
+    finally:
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+
+
+@pytest.mark.asyncio
+async def test_router_webhook_rejects_bad_requests():
+    router = UpdateRouter(SimpleNamespace(CLUSTER_SECRET="secret"), NODES)
+    router._webhook_secret = "hook"
+    for node in NODES:
+        router._queues[node] = asyncio.Queue()
+    app = web.Application()
+    app.router.add_post("/", router._receive_webhook)
+    async with TestClient(TestServer(app)) as client:
+        assert (await client.post("/", data="{}", headers={SECRET_HEADER: "wrong"})).status == 403
+        assert (await client.post("/", data="{broken", headers={SECRET_HEADER: "hook"})).status == 400
+        body = '[{"update_id": 1, "message": {"chat": {"id": 1}}}, 42]'
+        assert (await client.post("/", data=body, headers={SECRET_HEADER: "hook"})).status == 200
+    assert sum(queue.qsize() for queue in router._queues.values()) == 1
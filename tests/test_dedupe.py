@@ -0,0 +1,89 @@
+from datetime import date
+
+import pytest
+
+from src.dedupe import DailyDedupe, UpdateDedupe, create_away_dedupe
+
+
+class DayDedupe(DailyDedupe):
+    day_override = date(2025, 1, 1)
+
+    def _today(self) -> date:
+        return self.day_override
+
+
+@pytest.mark.asyncio
+async def test_daily_marks_reset_at_midnight():
+    dedupe = DayDedupe()
+    assert await dedupe.check_and_mark(1)
+    assert not await dedupe.check_and_mark(1)
+    assert await dedupe.count() == 1
+
+    dedupe.day_override = date(2025, 1, 2)
+    assert await dedupe.count() == 0
+    assert await dedupe.check_and_mark(1)
+
+
+@pytest.mark.asyncio
+async def test_seed_only_restores_today():
+    dedupe = DayDedupe()
+    dedupe.seed(date(2024, 12, 31), [1, 2])
+    assert await dedupe.count() == 0
+    dedupe.seed(date(2025, 1, 1), [1, 2])
+    assert not await dedupe.check_and_mark(2)
+
+
+def test_in_process_dedupe_without_redis():
+    dedupe = create_away_dedupe(None, "bot")
+    assert isinstance(dedupe, DailyDedupe)
+    assert not dedupe.persistent
+
+
+def test_update_ids_are_seen_once():
+    dedupe = UpdateDedupe()
+    assert dedupe.check_and_mark(10)
+    assert not dedupe.check_and_mark(10)
+    assert dedupe.check_and_mark(11)
+
+
+def test_floor_counts_as_seen():
+    dedupe = UpdateDedupe()
+    dedupe.floor = 10
+    assert not dedupe.check_and_mark(9)
+    assert not dedupe.check_and_mark(10)
+    assert dedupe.check_and_mark(11)
+    assert len(dedupe) == 1
+
+
+def test_oldest_ids_are_dropped_past_max_entries():
+    dedupe = UpdateDedupe(max_entries=2)
+    for update_id in (1, 2, 3):
+        dedupe.check_and_mark(update_id)
+    assert len(dedupe) == 2
+    assert dedupe.check_and_mark(1)
+    assert not dedupe.check_and_mark(3)
+
+
+def test_completed_waits_for_earlier_updates():
+    dedupe = UpdateDedupe()
+    for update_id in (1, 2, 3):
+        dedupe.started(update_id)
+    assert not dedupe.finished(2)
+    assert not dedupe.finished(3)
+    assert dedupe.completed == 0
+
+    assert dedupe.finished(1)
+    assert dedupe.completed == 3
+
+
+def test_completed_stops_below_an_unfinished_update():
+    dedupe = UpdateDedupe()
+    for update_id in (5, 6, 7):
+        dedupe.started(update_id)
+    assert dedupe.finished(5)
+    assert dedupe.completed == 5
+    dedupe.finished(7)
+    assert dedupe.completed == 5
+    dedupe.started(8)
+    assert dedupe.finished(6)
+    assert dedupe.completed == 7
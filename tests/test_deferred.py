@@ -0,0 +1,48 @@
+import asyncio
+
+import pytest
+
+from src.deferred import DeferredQueue
+
+
+@pytest.mark.asyncio
+async def test_callbacks_run_after_their_delay():
+    queue = DeferredQueue()
+    ran = []
+
+    async def record(name):
+        ran.append(name)
+
+    assert queue.defer(0.05, lambda: record("late"))
+    assert queue.defer(0.01, lambda: record("early"))
+    assert ran == []
+    await asyncio.sleep(0.1)
+    assert ran == ["early", "late"]
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_full_queue_drops_items():
+    queue = DeferredQueue(max_pending=1)
+
+    async def nothing():
+        pass
+
+    assert queue.defer(10, nothing)
+    assert not queue.defer(10, nothing)
+    assert queue.dropped == 1
+    await queue.stop()
+    assert len(queue) == 0
+
+
+@pytest.mark.asyncio
+async def test_failures_do_not_escape():
+    queue = DeferredQueue()
+
+    async def fail():
+        raise RuntimeError("boom")
+
+    queue.defer(0, fail)
+    await asyncio.sleep(0.01)
+    await queue.stop()
+    assert len(queue) == 0
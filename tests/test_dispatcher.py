@@ -0,0 +1,271 @@
+import asyncio
+
+import pytest
+from sqlalchemy import select
+from telegram.error import BadRequest, NetworkError, RetryAfter
+
+from src import dispatcher as dispatcher_module
+from src.dispatcher import OutboundDispatcher, Priority
+from src.storage import DeadLetterRow, Repository
+
+
+class FakeBot:
+    """Records sends; ``errors`` are raised by the next calls, in order"""
+
+    def __init__(self, *errors):
+        self.errors = list(errors)
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.errors:
+            raise self.errors.pop(0)
+        self.sent.append((chat_id, text))
+        return len(self.sent)
+
+
+@pytest.fixture
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "MAX_BACKOFF_SECONDS", 0)
+
+
+async def run(bot, **kwargs):
+    dispatcher = OutboundDispatcher(bot, chat_rate=1000, group_rate=1000, **kwargs)
+    await dispatcher.start()
+    return dispatcher
+
+
+@pytest.mark.asyncio
+async def test_queued_sends_go_out_by_priority():
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(bot, chat_rate=1000)
+    dispatcher.send_message(1, "reply", priority=Priority.REPLY)
+    dispatcher.send_message(1, "post", priority=Priority.POST)
+    last = dispatcher.send_message(1, "admin", priority=Priority.ADMIN)
+    assert dispatcher.pending() == 3
+
+    await dispatcher.start()
+    try:
+        await asyncio.wait_for(last, timeout=2)
+        await asyncio.sleep(0.05)
+    finally:
+        await dispatcher.stop()
+    assert [text for _, text in bot.sent] == ["admin", "post", "reply"]
+
+
+@pytest.mark.asyncio
+async def test_queued_key_returns_the_same_future():
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(bot)
+    first = dispatcher.send_message(1, "hi", key="post:1:1")
+    assert dispatcher.send_message(1, "hi", key="post:1:1") is first
+    assert dispatcher.duplicates == 1
+
+    await dispatcher.start()
+    try:
+        assert await asyncio.wait_for(first, timeout=2) == 1
+    finally:
+        await dispatcher.stop()
+    assert bot.sent == [(1, "hi")]
+
+
+@pytest.mark.asyncio
+async def test_recently_sent_key_is_not_sent_again():
+    bot = FakeBot()
+    dispatcher = await run(bot, recent_keys=1)
+    try:
+        await asyncio.wait_for(dispatcher.send_message(1, "hi", key="a"), timeout=2)
+        assert await dispatcher.send_message(1, "hi", key="a") is None
+        assert len(bot.sent) == 1
+
+        # Only the last ``recent_keys`` keys are remembered
+        await asyncio.wait_for(dispatcher.send_message(1, "hi", key="b"), timeout=2)
+        await asyncio.wait_for(dispatcher.send_message(1, "hi", key="a"), timeout=2)
+        assert len(bot.sent) == 3
+
+        dispatcher.forget_keys("a")
+        await asyncio.wait_for(dispatcher.send_message(1, "hi", key="a"), timeout=2)
+        assert len(bot.sent) == 4
+    finally:
+        await dispatcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_failed_key_can_be_retried():
+    bot = FakeBot(BadRequest("chat not found"))
+    dispatcher = await run(bot)
+    try:
+        with pytest.raises(BadRequest):
+            await asyncio.wait_for(dispatcher.send_message(1, "hi", key="k"), timeout=2)
+        assert await asyncio.wait_for(dispatcher.send_message(1, "hi", key="k"), timeout=2) == 1
+    finally:
+        await dispatcher.stop()
+
+
+@pytest.mark.asyncio
+async def test_network_errors_are_retried(no_backoff):
+    bot = FakeBot(NetworkError("reset"), NetworkError("reset"))
+    dispatcher = await run(bot)
+    try:
+        assert await asyncio.wait_for(dispatcher.send_message(1, "hi"), timeout=2) == 1
+    finally:
+        await dispatcher.stop()
+    assert (dispatcher.retried, dispatcher.sent, dispatcher.failed) == (2, 1, 0)
+
+
+@pytest.mark.asyncio
+async def test_flood_control_pauses_and_retries():
+    bot = FakeBot(RetryAfter(0))
+    dispatcher = await run(bot)
+    try:
+        assert await asyncio.wait_for(dispatcher.send_message(1, "hi"), timeout=2) == 1
+    finally:
+        await dispatcher.stop()
+    assert dispatcher.retried == 1
+
+
+@pytest.mark.asyncio
+async def test_retries_stop_at_the_budget(no_backoff):
+    bot = FakeBot(*[NetworkError("reset")] * 3)
+    dispatcher = await run(bot, max_retries=2)
+    try:
+        with pytest.raises(NetworkError):
+            await asyncio.wait_for(dispatcher.send_message(1, "hi"), timeout=2)
+    finally:
+        await dispatcher.stop()
+    assert bot.sent == []
+    assert (dispatcher.retried, dispatcher.failed) == (2, 1)
+
+
+@pytest.mark.asyncio
+async def test_backing_off_does_not_hold_up_the_chat(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "MAX_BACKOFF_SECONDS", 0.2)
+    bot = FakeBot(NetworkError("reset"))
+    dispatcher = await run(bot)
+    try:
+        first = dispatcher.send_message(1, "first")
+        second = dispatcher.send_message(1, "second")
+        await asyncio.wait_for(second, timeout=0.1)
+        assert dispatcher.pending() == 1
+        await asyncio.wait_for(first, timeout=2)
+    finally:
+        await dispatcher.stop()
+    assert [text for _, text in bot.sent] == ["second", "first"]
+
+
+@pytest.mark.asyncio
+async def test_durable_sends_are_dead_lettered_after_their_budget(tmp_path, no_backoff):
+    repository = Repository(f"sqlite:///{tmp_path / 'bot.db'}", bot_id=1, flush_interval=60)
+    await repository.open()
+    try:
+        bot = FakeBot(*[NetworkError("reset")] * 3)
+        dispatcher = await run(bot, repository=repository, durable_max_retries=2)
+        try:
+            with pytest.raises(NetworkError):
+                await asyncio.wait_for(dispatcher.submit("send_message", 1, text="post", durable=True), timeout=2)
+        finally:
+            await dispatcher.stop()
+        assert dispatcher.retried == 2
+
+        await repository.flush()
+        assert await repository.load_outbox() == []
+        async with repository.engine.connect() as conn:
+            rows = (await conn.execute(select(DeadLetterRow.__table__))).all()
+        assert [(row.chat_id, row.payload) for row in rows] == [("1", {"text": "post"})]
+        assert "reset" in rows[0].error
+    finally:
+        await repository.close()
+
+
+@pytest.mark.asyncio
+async def test_bad_request_is_not_retried(no_backoff):
+    bot = FakeBot(BadRequest("message is too long"))
+    dispatcher = await run(bot)
+    try:
+        with pytest.raises(BadRequest):
+            await asyncio.wait_for(dispatcher.send_message(1, "hi"), timeout=2)
+    finally:
+        await dispatcher.stop()
+    assert dispatcher.retried == 0
+
+
+@pytest.mark.asyncio
+async def test_registered_methods_get_the_bot():
+    calls = []
+
+    async def send_media_post(bot, chat_id, media):
+        if not media:
+            raise FileNotFoundError("nothing to send")
+        calls.append((bot, chat_id, media))
+        return "sent"
+
+    bot = FakeBot()
+    dispatcher = await run(bot)
+    dispatcher.register_method("send_media_post", send_media_post)
+    try:
+        assert await asyncio.wait_for(dispatcher.submit("send_media_post", 1, media=["a"]), timeout=2) == "sent"
+        # Errors outside the Bot API are not retried
+        with pytest.raises(FileNotFoundError):
+            await asyncio.wait_for(dispatcher.submit("send_media_post", 1, media=[]), timeout=2)
+    finally:
+        await dispatcher.stop()
+    assert calls == [(bot, 1, ["a"])]
+    assert (dispatcher.retried, dispatcher.failed) == (0, 1)
+
+
+@pytest.mark.asyncio
+async def test_durable_sends_survive_a_restart(tmp_path):
+    repository = Repository(f"sqlite:///{tmp_path / 'bot.db'}", bot_id=1, flush_interval=60)
+    await repository.open()
+    try:
+        # Queued but never sent before the first dispatcher stops
+        stopped = OutboundDispatcher(FakeBot(), repository)
+        stopped.submit("send_message", -100, text="post", priority=Priority.POST, durable=True, key="post:1")
+        await stopped.stop()
+        await repository.flush()
+
+        bot = FakeBot()
+        dispatcher = OutboundDispatcher(bot, repository, group_rate=1000)
+        restored = await dispatcher.restore()
+        assert list(restored) == ["post:1"]
+        await dispatcher.start()
+        try:
+            await asyncio.wait_for(restored["post:1"].future, timeout=2)
+        finally:
+            await dispatcher.stop()
+        assert bot.sent == [(-100, "post")]
+
+        await repository.flush()
+        assert await repository.load_outbox() == []
+    finally:
+        await repository.close()
+
+
+@pytest.mark.asyncio
+async def test_sent_keys_are_remembered_across_a_restart(tmp_path):
+    repository = Repository(f"sqlite:///{tmp_path / 'bot.db'}", bot_id=1, flush_interval=60)
+    await repository.open()
+    try:
+        bot = FakeBot()
+        dispatcher = await run(bot, repository=repository, recent_keys=2)
+        try:
+            for key in ["a", "b", "c"]:
+                await asyncio.wait_for(dispatcher.send_message(1, "hi", key=key), timeout=2)
+            dispatcher.forget_keys("c")
+        finally:
+            await dispatcher.stop()
+        await repository.flush()
+        # Only the last ``recent_keys`` are kept, minus forgotten ones
+        assert await repository.load_sent_keys() == ["b"]
+
+        restarted = OutboundDispatcher(bot, repository, chat_rate=1000)
+        await restarted.restore()
+        await restarted.start()
+        try:
+            assert await restarted.send_message(1, "hi", key="b") is None
+            await asyncio.wait_for(restarted.send_message(1, "hi", key="c"), timeout=2)
+        finally:
+            await restarted.stop()
+        assert len(bot.sent) == 4
+    finally:
+        await repository.close()
+
@@ -0,0 +1,50 @@
+import socket
+
+import pytest
+import pytest_asyncio
+from telegram import Bot
+from telegram.error import RetryAfter
+
+from benchmarks.fake_bot_api import FakeBotAPI
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest_asyncio.fixture
+async def api():
+    api = FakeBotAPI(port=free_port(), chat_rate_limit=1)
+    await api.start()
+    try:
+        yield api
+    finally:
+        await api.stop()
+
+
+@pytest_asyncio.fixture
+async def bot(api):
+    bot = Bot("123:abc", base_url=f"{api.url}/bot")
+    async with bot:
+        yield bot
+
+
+@pytest.mark.asyncio
+async def test_sends_are_recorded_and_rate_limited(api, bot):
+    message = await bot.send_message(-100, "hello")
+    assert (message.chat.id, message.text) == (-100, "hello")
+    with pytest.raises(RetryAfter):
+        await bot.send_message(-100, "too soon")
+    await bot.send_message(5, "other chat")
+    assert [(method, chat_id) for _, method, chat_id in api.sent] == [("sendMessage", -100), ("sendMessage", 5)]
+    assert api.retry_afters == 1
+
+
+@pytest.mark.asyncio
+async def test_pushed_updates_are_polled_until_acknowledged(api, bot):
+    api.push([{"message": {"message_id": 1, "date": 0, "chat": {"id": 5, "type": "private"}, "text": "hi"}}])
+    updates = await bot.get_updates(timeout=1)
+    assert [update.message.text for update in updates] == ["hi"]
+    assert await bot.get_updates(offset=updates[-1].update_id + 1) == ()
@@ -0,0 +1,133 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+import pytest_asyncio
+from telegram.error import BadRequest, NetworkError
+
+from src import dispatcher as dispatcher_module
+from src.dispatcher import OutboundDispatcher
+from src.fanout import DeliveryState, FanOut, TargetDelivery, delivery_key
+from src.storage import Repository
+
+TARGETS = [-100, -200, -300]
+
+
+class FakeBot:
+    """Answers sends with a message; ``errors`` maps a chat to errors raised by its next sends"""
+
+    def __init__(self, errors=None):
+        self.errors = {chat_id: list(errors) for chat_id, errors in (errors or {}).items()}
+        self.sent = []
+
+    async def send_message(self, chat_id, text, **kwargs):
+        if self.errors.get(chat_id):
+            raise self.errors[chat_id].pop(0)
+        self.sent.append(chat_id)
+        return SimpleNamespace(message_id=len(self.sent))
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(dispatcher_module, "MAX_BACKOFF_SECONDS", 0)
+
+
+@pytest_asyncio.fixture
+async def repository(tmp_path):
+    repository = Repository(f"sqlite:///{tmp_path / 'bot.db'}", bot_id=1, flush_interval=60)
+    await repository.open()
+    try:
+        yield repository
+    finally:
+        await repository.close()
+
+
+def states(deliveries):
+    return {delivery.chat_id: delivery.state for delivery in deliveries}
+
+
+def test_delivery_key():
+    assert delivery_key(7, -100) == "post:7:-100"
+
+
+@pytest.mark.asyncio
+async def test_publish_to_every_target_and_record_each_outcome(repository):
+    bot = FakeBot({-200: [NetworkError("reset")], -300: [BadRequest("chat not found")]})
+    dispatcher = OutboundDispatcher(bot, repository, group_rate=1000)
+    fanout = FanOut(dispatcher, repository, max_retries=3)
+    await dispatcher.start()
+    try:
+        deliveries = await asyncio.wait_for(fanout.publish(1, TARGETS, "send_message", text="hello"), timeout=2)
+    finally:
+        await dispatcher.stop()
+
+    assert states(deliveries) == {-100: DeliveryState.SENT, -200: DeliveryState.SENT, -300: DeliveryState.FAILED}
+    retried = next(delivery for delivery in deliveries if delivery.chat_id == -200)
+    assert (retried.attempts, retried.error) == (1, None)
+    assert fanout.in_progress() == []
+
+    await repository.flush()
+    stored = (await repository.load_deliveries([1]))[1]
+    assert states(stored) == states(deliveries)
+    assert next(d for d in stored if d.chat_id == -300).error == "chat not found"
+
+
+@pytest.mark.asyncio
+async def test_publish_again_only_sends_unfinished_targets():
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(bot, group_rate=1000)
+    fanout = FanOut(dispatcher)
+    fanout.load(1, [TargetDelivery(-100, DeliveryState.SENT, message_id=9), TargetDelivery(-200)])
+    assert fanout.in_progress() == [1]
+    await dispatcher.start()
+    try:
+        await asyncio.wait_for(fanout.publish(1, TARGETS, "send_message", text="hello"), timeout=2)
+    finally:
+        await dispatcher.stop()
+    assert sorted(bot.sent) == [-300, -200]
+
+
+@pytest.mark.asyncio
+async def test_interrupted_publish_resumes_without_duplicates(repository):
+    # The first run queues the sends but stops before any goes out
+    first = OutboundDispatcher(FakeBot(), repository, group_rate=1000)
+    publishing = asyncio.ensure_future(FanOut(first, repository).publish(1, TARGETS, "send_message", text="hello"))
+    while first.pending() < len(TARGETS):
+        await asyncio.sleep(0)
+    await first.stop()
+    await asyncio.gather(publishing, return_exceptions=True)
+    await repository.flush()
+
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(bot, repository, group_rate=1000)
+    fanout = FanOut(dispatcher, repository)
+    for post_id, deliveries in (await repository.load_deliveries([1])).items():
+        fanout.load(post_id, deliveries)
+    assert fanout.adopt(await dispatcher.restore()) == {1}
+    await dispatcher.start()
+    try:
+        deliveries = await asyncio.wait_for(fanout.publish(1, TARGETS, "send_message", text="hello"), timeout=2)
+    finally:
+        await dispatcher.stop()
+    assert sorted(bot.sent) == sorted(TARGETS)
+    assert set(states(deliveries).values()) == {DeliveryState.SENT}
+
+
+@pytest.mark.asyncio
+async def test_deleted_post_leaves_no_state_behind(repository):
+    bot = FakeBot()
+    dispatcher = OutboundDispatcher(bot, repository, group_rate=1000)
+    fanout = FanOut(dispatcher, repository)
+    await dispatcher.start()
+    try:
+        await asyncio.wait_for(fanout.publish(1, TARGETS, "send_message", text="hello"), timeout=2)
+        await repository.flush()
+        fanout.delete(1)
+        await repository.flush()
+        assert await repository.load_deliveries([1]) == {}
+
+        # A new post with the same id would be sent again
+        await asyncio.wait_for(fanout.publish(1, TARGETS[:1], "send_message", text="again"), timeout=2)
+    finally:
+        await dispatcher.stop()
+    assert sorted(bot.sent) == sorted(TARGETS + TARGETS[:1])
@@ -0,0 +1,37 @@
+import pytest
+
+from src.config import Config
+from src.utils.http_client import bot_api_urls, build_request, create_bot
+
+
+@pytest.fixture
+def config(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "123:abc")
+    monkeypatch.setenv("HTTP_POOL_SIZE", "4")
+    monkeypatch.setenv("HTTP_KEEPALIVE", "15")
+    monkeypatch.delenv("BOT_API_URL", raising=False)
+    return Config()
+
+
+def test_pool_is_sized_from_config(config):
+    limits = build_request(config)._client_kwargs["limits"]
+    assert (limits.max_connections, limits.keepalive_expiry) == (4, 15)
+
+
+def test_bot_api_urls(config):
+    assert bot_api_urls(config) == {}
+    config.BOT_API_URL = "http://localhost:8081"
+    assert bot_api_urls(config) == {
+        "base_url": "http://localhost:8081/bot",
+        "base_file_url": "http://localhost:8081/file/bot",
+    }
+
+
+def test_one_pool_for_updates_and_sends(config):
+    bot = create_bot(config)
+    assert bot._request[0] is bot._request[1]
+
+
+def test_pool_must_fit_a_long_poll(config):
+    config.HTTP_POOL_SIZE = 1
+    assert any("HTTP_POOL_SIZE" in error for error in config.validate()[1])
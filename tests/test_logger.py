@@ -0,0 +1,59 @@
+import json
+import logging
+import queue
+
+from src.utils.logger import DroppingQueueHandler, RateLimitFilter, _formatter
+
+
+def record(msg="Send to %s failed", args=(1,), level=logging.WARNING, name="src.dispatcher") -> logging.LogRecord:
+    return logging.LogRecord(name, level, __file__, 1, msg, args, None)
+
+
+def test_bursts_pass_then_floods_are_suppressed():
+    limiter = RateLimitFilter(rate=0.001, burst=3)
+    assert [limiter.filter(record(args=(i,))) for i in range(5)] == [True, True, True, False, False]
+    # Other call sites have their own bucket
+    assert limiter.filter(record("Other event %s"))
+
+
+def test_sampled_record_carries_the_suppressed_count():
+    limiter = RateLimitFilter(rate=0.001, burst=1, sample_every=3)
+    results = [limiter.filter(item) for item in [record() for _ in range(4)]]
+    assert results == [True, False, False, True]
+
+    passed = record()
+    limiter.filter(record())
+    limiter.filter(record())
+    assert limiter.filter(passed)
+    assert passed.suppressed == 3
+
+
+def test_errors_are_never_limited():
+    limiter = RateLimitFilter(rate=0.001, burst=1)
+    assert all(limiter.filter(record(level=logging.ERROR)) for _ in range(10))
+    assert [limiter.filter(record()) for _ in range(2)] == [True, False]
+
+    limiter = RateLimitFilter(rate=0.001, burst=1, exempt_level=logging.CRITICAL)
+    assert [limiter.filter(record(level=logging.ERROR)) for _ in range(2)] == [True, False]
+
+
+def test_zero_rate_disables_limiting():
+    limiter = RateLimitFilter(rate=0, burst=0)
+    assert all(limiter.filter(record()) for _ in range(100))
+
+
+def test_full_queue_drops_records():
+    handler = DroppingQueueHandler(queue.Queue(1))
+    handler.handle(record(args=("a",)))
+    handler.handle(record(args=("b",)))
+    assert handler.dropped == 1
+    queued = handler.queue.get_nowait()
+    assert (queued.msg, queued.args) == ("Send to a failed", None)
+
+
+def test_json_output_includes_suppressed():
+    item = record()
+    item.suppressed = 7
+    output = json.loads(_formatter("json").format(item))
+    assert output["event"] == "Send to 1 failed"
+    assert (output["level"], output["logger"], output["suppressed"]) == ("warning", "src.dispatcher", 7)
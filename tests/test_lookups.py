@@ -0,0 +1,148 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram import Chat, ChatMember, ChatMemberLeft, ChatMemberMember, ChatMemberOwner, User
+from telegram.error import BadRequest
+
+from src.lookups import LookupCache, can_post, chat_key
+
+ME = User(42, "bot", True)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class FakeBot:
+    """Counts lookups; ``members`` maps (chat id, user id) to a ChatMember"""
+
+    def __init__(self):
+        self.calls = []
+        self.chats = {-100: Chat(-100, Chat.CHANNEL, username="News")}
+        self.members = {(-100, ME.id): ChatMemberOwner(ME, False)}
+
+    async def get_me(self):
+        self.calls.append("get_me")
+        return ME
+
+    async def get_chat(self, chat_id):
+        self.calls.append(("get_chat", chat_id))
+        await asyncio.sleep(0)
+        if chat_id == "@news":
+            return self.chats[-100]
+        if chat_id not in self.chats:
+            raise BadRequest("Chat not found")
+        return self.chats[chat_id]
+
+    async def get_chat_member(self, chat_id, user_id):
+        self.calls.append(("get_chat_member", chat_id, user_id))
+        return self.members[(chat_id, user_id)]
+
+
+@pytest.fixture
+def clock():
+    return Clock()
+
+
+@pytest.fixture
+def bot():
+    return FakeBot()
+
+
+@pytest.fixture
+def cache(bot, clock):
+    return LookupCache(bot, {"get_me": 3600, "get_chat": 60, "get_chat_member": 30}, clock=clock)
+
+
+def test_chat_keys():
+    assert chat_key("-100123") == -100123
+    assert chat_key(" @News ") == "@news"
+    assert chat_key(5) == 5
+
+
+def test_who_can_post():
+    user = User(1, "u", False)
+    group = Chat(-1, Chat.SUPERGROUP)
+    channel = Chat(-2, Chat.CHANNEL)
+    assert can_post(group, ChatMemberMember(user))
+    assert not can_post(group, ChatMemberLeft(user))
+    assert not can_post(group, SimpleNamespace(status=ChatMember.RESTRICTED, can_send_messages=False))
+    assert can_post(channel, ChatMemberOwner(user, False))
+    assert not can_post(channel, ChatMemberMember(user))
+
+
+@pytest.mark.asyncio
+async def test_answers_are_kept_for_their_ttl(cache, bot, clock):
+    assert (await cache.get_chat(-100)).username == "News"
+    await cache.get_chat("-100")
+    assert bot.calls == [("get_chat", -100)]
+    assert (cache.hits, cache.misses) == (1, 1)
+
+    clock.now = 61
+    await cache.get_chat(-100)
+    assert len(bot.calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_lookups_share_one_request(cache, bot):
+    chats = await asyncio.gather(*(cache.get_chat(-100) for _ in range(5)))
+    assert all(chat is chats[0] for chat in chats)
+    assert bot.calls == [("get_chat", -100)]
+
+
+@pytest.mark.asyncio
+async def test_errors_are_not_cached(cache, bot):
+    for _ in range(2):
+        with pytest.raises(BadRequest):
+            await cache.get_chat(-5)
+    assert len(bot.calls) == 2
+    assert len(cache) == 0
+
+
+@pytest.mark.asyncio
+async def test_username_lookups_also_cache_the_id(cache, bot):
+    assert await cache.resolve("@News") == -100
+    assert await cache.resolve(-100) == -100
+    await cache.get_chat(-100)
+    assert bot.calls == [("get_chat", "@news")]
+    assert await cache.resolve("@missing") == "@missing"
+
+
+@pytest.mark.asyncio
+async def test_can_post_checks_the_bots_membership(cache, bot):
+    assert await cache.can_post("@news")
+    assert await cache.can_post(-100)
+    assert bot.calls.count("get_me") == 1
+    assert await cache.can_post(-5) is None
+
+
+@pytest.mark.asyncio
+async def test_membership_changes_invalidate_the_chat(cache, bot):
+    await cache.get_chat_member(-100, ME.id)
+    await cache.get_chat("@news")
+    bot.members[(-100, ME.id)] = ChatMemberLeft(ME)
+
+    cache.invalidate(bot.chats[-100])
+    assert (await cache.get_chat_member(-100, ME.id)).status == ChatMember.LEFT
+    await cache.get_chat("@news")
+    await cache.get_chat(-100)
+    assert bot.calls.count(("get_chat", "@news")) == 2
+    assert ("get_chat", -100) not in bot.calls
+
+
+@pytest.mark.asyncio
+async def test_least_recently_used_answers_are_evicted(bot, clock):
+    bot.chats.update({-1: Chat(-1, Chat.GROUP), -2: Chat(-2, Chat.GROUP)})
+    cache = LookupCache(bot, {"get_chat": 60}, max_entries=2, clock=clock)
+    for chat_id in (-1, -2, -1, -100):
+        await cache.get_chat(chat_id)
+    assert len(cache) == 2
+    await cache.get_chat(-1)
+    assert bot.calls.count(("get_chat", -1)) == 1
+    await cache.get_chat(-2)
+    assert bot.calls.count(("get_chat", -2)) == 2
@@ -0,0 +1,149 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+from telegram import InputFile
+from telegram.error import BadRequest
+
+from src.media import MediaCache, StreamingInputFile, file_digest
+from src.posts import MediaItem, parse_media
+
+
+class FakeBot:
+    """Records what each send got and answers with a fresh file_id per upload"""
+
+    def __init__(self, reject=()):
+        self.reject = set(reject)
+        self.calls = []
+        self.uploaded = 0
+
+    def _message(self, media_type, media):
+        if isinstance(media, str):
+            if media in self.reject:
+                raise BadRequest("Wrong file identifier specified")
+            file_id = media
+        else:
+            file_id = f"id{self.uploaded}"
+            self.uploaded += 1
+        attachment = SimpleNamespace(file_id=file_id)
+        return SimpleNamespace(**{media_type: [attachment] if media_type == "photo" else attachment})
+
+    async def send_photo(self, chat_id, photo, caption=None, **kwargs):
+        self.calls.append(photo)
+        await asyncio.sleep(0)
+        return self._message("photo", photo)
+
+    async def send_document(self, chat_id, document, caption=None, **kwargs):
+        self.calls.append(document)
+        return self._message("document", document)
+
+    async def send_media_group(self, chat_id, media, **kwargs):
+        self.calls.append([item.media for item in media])
+        return [self._message(item.type, item.media) for item in media]
+
+
+@pytest.fixture
+def photo(tmp_path):
+    path = tmp_path / "photo.jpg"
+    path.write_bytes(b"jpeg" * 1000)
+    return str(path)
+
+
+def test_media_items_from_json():
+    items = parse_media([{"type": "photo", "file_id": "a"}, {"type": "video", "url": "https://x"}])
+    assert items == (MediaItem("photo", file_id="a"), MediaItem("video", url="https://x"))
+    assert [item.to_dict() for item in items] == [{"type": "photo", "file_id": "a"}, {"type": "video", "url": "https://x"}]
+    assert parse_media({"type": "document", "path": "a.pdf"}) == (MediaItem("document", path="a.pdf"),)
+    assert parse_media(None) == ()
+    with pytest.raises(ValueError):
+        parse_media([{"type": "photo", "file_id": "a"}] * 11)
+
+
+def test_streaming_input_file_keeps_the_handle(photo):
+    with open(photo, "rb") as handle:
+        input_file = StreamingInputFile(handle, "photo.jpg")
+        assert isinstance(input_file, InputFile)
+        assert input_file.input_file_content == b""
+        # What the multipart request is built from
+        assert input_file.field_tuple == ("photo.jpg", handle, "image/jpeg")
+
+
+@pytest.mark.asyncio
+async def test_cache_keys(photo):
+    cache = MediaCache()
+    assert await cache.cache_key(MediaItem("photo", file_id="a")) is None
+    assert await cache.cache_key(MediaItem("photo", path=photo)) == f"photo:sha256:{file_digest(photo)}"
+    # The same file sent as another kind of media needs its own upload
+    assert await cache.cache_key(MediaItem("document", path=photo)) != await cache.cache_key(MediaItem("photo", path=photo))
+    assert (await cache.cache_key(MediaItem("video", url="https://x"))).startswith("video:url:")
+
+
+@pytest.mark.asyncio
+async def test_file_is_uploaded_once(photo):
+    bot = FakeBot()
+    cache = MediaCache()
+    media = [{"type": "photo", "path": photo}]
+    await cache.send(bot, 1, media, caption="first")
+    await cache.send(bot, 2, media, caption="second")
+    assert isinstance(bot.calls[0], StreamingInputFile)
+    assert bot.calls[1] == "id0"
+    assert (cache.uploads, cache.hits, len(cache)) == (1, 1, 1)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_sends_wait_for_one_upload(photo):
+    bot = FakeBot()
+    cache = MediaCache()
+    media = [{"type": "photo", "path": photo}]
+    await asyncio.gather(*(cache.send(bot, chat_id, media) for chat_id in range(5)))
+    assert sum(isinstance(call, InputFile) for call in bot.calls) == 1
+    assert cache.uploads == 1
+
+
+@pytest.mark.asyncio
+async def test_album_caches_each_item(photo, tmp_path):
+    document = tmp_path / "report.pdf"
+    document.write_bytes(b"%PDF")
+    bot = FakeBot()
+    cache = MediaCache()
+    media = [{"type": "photo", "path": photo}, {"type": "document", "path": str(document)}]
+    messages = await cache.send(bot, 1, media, caption="Album")
+    assert len(messages) == 2
+    assert len(cache) == 2
+    await cache.send(bot, 2, media)
+    assert bot.calls[-1] == ["id0", "id1"]
+
+
+@pytest.mark.asyncio
+async def test_rejected_file_id_is_uploaded_again(photo):
+    cache = MediaCache()
+    key = await cache.cache_key(MediaItem("photo", path=photo))
+    cache.put(key, "expired")
+    bot = FakeBot(reject={"expired"})
+    await cache.send(bot, 1, [{"type": "photo", "path": photo}])
+    assert bot.calls[0] == "expired"
+    assert isinstance(bot.calls[1], InputFile)
+    assert cache.get(key) == "id0"
+
+
+@pytest.mark.asyncio
+async def test_other_bad_requests_are_not_retried(photo):
+    class ChatNotFound(FakeBot):
+        async def send_photo(self, chat_id, photo, **kwargs):
+            self.calls.append(photo)
+            raise BadRequest("Chat not found")
+
+    bot = ChatNotFound()
+    with pytest.raises(BadRequest):
+        await MediaCache().send(bot, 1, [{"type": "photo", "path": photo}])
+    assert len(bot.calls) == 1
+
+
+def test_least_recently_used_entries_are_evicted():
+    cache = MediaCache(max_entries=2)
+    cache.load([("a", "1"), ("b", "2"), ("c", "3")])
+    assert len(cache) == 2 and cache.get("a") is None
+    cache.get("b")
+    cache.put("d", "4")
+    assert cache.get("c") is None
+    assert (cache.get("b"), cache.get("d")) == ("2", "4")
@@ -0,0 +1,100 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Chat, Message, Update
+from telegram.error import RetryAfter
+
+from src.metrics import Metrics
+from src.scheduler import DateTrigger, Scheduler
+
+
+def message_update(update_id: int, sent_seconds_ago: float = 0.0) -> Update:
+    sent = datetime.now(timezone.utc) - timedelta(seconds=sent_seconds_ago)
+    return Update(update_id, message=Message(update_id, sent, Chat(1, Chat.PRIVATE), text="hi"))
+
+
+@pytest.mark.asyncio
+async def test_handlers_are_timed_by_outcome():
+    metrics = Metrics()
+
+    async def ok(update, context):
+        return "done"
+
+    async def broken(update, context):
+        raise ValueError("boom")
+
+    assert await metrics.instrument("ok", ok)(None, None) == "done"
+    with pytest.raises(ValueError):
+        await metrics.instrument("broken", broken)(None, None)
+
+    assert metrics.total("telgbot_handler_calls_total", handler="ok", outcome="ok") == 1
+    assert metrics.total("telgbot_handler_calls_total", handler="broken", outcome="error") == 1
+    summary = metrics.summary()
+    assert summary["handler_errors"] == 1
+    assert summary["avg_handler_ms"] >= 0
+
+
+@pytest.mark.asyncio
+async def test_updates_are_counted_by_type():
+    metrics = Metrics()
+    await metrics.observe_update(message_update(1, sent_seconds_ago=2), None)
+    await metrics.observe_update(Update(2), None)
+    assert metrics.total("telgbot_updates_total", type="message") == 1
+    assert metrics.total("telgbot_updates_total", type="unknown") == 1
+    assert metrics.total("telgbot_update_lag_seconds_sum") >= 2
+
+
+def test_sends_and_api_errors():
+    metrics = Metrics()
+    metrics.observe_send("send_message", 0.01)
+    metrics.observe_send("send_message", 0.02, RetryAfter(3))
+    metrics.observe_send("send_photo", 0.02, OSError("missing file"))
+    summary = metrics.summary()
+    assert (summary["sent"], summary["send_errors"], summary["retry_after"]) == (1, 2, 1)
+
+
+def test_queue_depth_is_read_on_scrape():
+    metrics = Metrics()
+    queue = [1, 2, 3]
+    metrics.track_queue("outbound", lambda: len(queue))
+    assert metrics.summary()["outbound_queue"] == 3
+    queue.pop()
+    assert metrics.summary()["outbound_queue"] == 2
+
+
+@pytest.mark.asyncio
+async def test_scheduler_reports_lag():
+    metrics = Metrics()
+    scheduler = Scheduler(on_lag=metrics.observe_scheduler_lag)
+    fired = asyncio.Event()
+
+    async def job():
+        fired.set()
+
+    scheduler.add_job(job, DateTrigger(datetime.now(timezone.utc) + timedelta(milliseconds=20)))
+    await scheduler.start()
+    try:
+        await asyncio.wait_for(fired.wait(), timeout=2)
+    finally:
+        await scheduler.stop()
+    assert metrics.total("telgbot_scheduler_lag_seconds_count") == 1
+
+
+@pytest.mark.asyncio
+async def test_metrics_endpoint():
+    metrics = Metrics()
+    metrics.observe_send("send_message", 0.01)
+    app = web.Application()
+    app.router.add_get("/metrics", metrics.handle_metrics)
+    client = TestClient(TestServer(app))
+    await client.start_server()
+    try:
+        response = await client.get("/metrics")
+        assert response.status == 200
+        assert response.content_type == "text/plain"
+        assert 'telgbot_sends_total{method="send_message",outcome="ok"} 1.0' in await response.text()
+    finally:
+        await client.close()
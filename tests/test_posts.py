@@ -0,0 +1,109 @@
+import pytest
+
+from src.posts import PostStore, ScheduledPost
+from src.storage import Repository
+
+
+def test_ids_count_up_and_are_not_reused():
+    store = PostStore()
+    first, second = store.add("one"), store.add("two")
+    assert (first.id, second.id) == (1, 2)
+
+    store.remove(second.id)
+    assert store.get(second.id) is None
+    assert store.last_id == 2
+    assert store.add("three").id == 3
+
+
+def test_explicit_id_must_be_free():
+    store = PostStore()
+    store.add("one", post_id=5)
+    assert store.last_id == 5
+    assert store.add("two").id == 6
+    with pytest.raises(ValueError):
+        store.add("again", post_id=5)
+
+
+def test_load_continues_after_the_highest_id():
+    store = PostStore()
+    store.load([ScheduledPost(7, "old", 0.0, posted_at=1.0), ScheduledPost(3, "older", 0.0)])
+    assert (store.posted_count, store.pending_count) == (1, 1)
+    assert store.add("new").id == 8
+
+
+def test_rotation_skips_posted_removed_and_pinned_posts():
+    store = PostStore()
+    first = store.add("first")
+    second = store.add("second")
+    store.add("pinned", scheduled_for=1e10)
+    third = store.add("third")
+
+    assert store.next_pending() is first
+    store.mark_posted(first)
+    store.remove(second.id)
+    assert store.next_pending() is third
+    assert (store.pending_count, store.posted_count) == (2, 1)
+    assert [post.content for post in store.pinned()] == ["pinned"]
+
+    store.mark_posted(third)
+    assert store.next_pending() is None
+
+
+def test_marking_twice_counts_once():
+    store = PostStore()
+    post = store.add("one")
+    store.mark_posted(post, posted_at=5.0)
+    store.mark_posted(post, posted_at=6.0)
+    assert (post.posted_at, store.pending_count, store.posted_count) == (5.0, 0, 1)
+
+
+def test_cursor_paging_skips_removed_posts():
+    store = PostStore()
+    for i in range(10):
+        store.add(f"post {i}")
+    for post_id in (3, 4, 8):
+        store.remove(post_id)
+
+    assert [post.id for post in store.page_after(0, 3)] == [1, 2, 5]
+    assert [post.id for post in store.page_after(5, 3)] == [6, 7, 9]
+    assert [post.id for post in store.page_after(9, 3)] == [10]
+    assert [post.id for post in store.page_before(6, 3)] == [1, 2, 5]
+    assert [post.id for post in store.page_before(1, 3)] == []
+
+
+def test_cursor_paging_after_many_removals():
+    store = PostStore()
+    for i in range(10):
+        store.add(f"post {i}")
+    # Removing most posts compacts the id list
+    for post_id in range(1, 9):
+        store.remove(post_id)
+    assert [post.id for post in store.page_after(0, 5)] == [9, 10]
+    assert [post.id for post in store.page_before(11, 5)] == [9, 10]
+
+
+@pytest.mark.asyncio
+async def test_allocated_ids_never_repeat(tmp_path):
+    url = f"sqlite:///{tmp_path / 'bot.db'}"
+    repository = Repository(url, bot_id=1)
+    await repository.open()
+    try:
+        # Seeded from the ids already in use
+        assert await repository.allocate_ids("posts", floor=3) == 4
+        assert await repository.allocate_ids("posts", count=10, floor=3) == 5
+        assert await repository.allocate_ids("posts") == 15
+        # A higher floor (posts written by an older version) moves the sequence up
+        assert await repository.allocate_ids("posts", floor=40) == 41
+    finally:
+        await repository.close()
+
+    # The sequence survives a restart; another bot sharing the database has its own
+    reopened, other = Repository(url, bot_id=1), Repository(url, bot_id=2)
+    await reopened.open()
+    await other.open()
+    try:
+        assert await reopened.allocate_ids("posts") == 42
+        assert await other.allocate_ids("posts") == 1
+    finally:
+        await other.close()
+        await reopened.close()
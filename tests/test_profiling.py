@@ -0,0 +1,63 @@
+import asyncio
+import logging
+import time
+
+import pytest
+
+from src.profiling import LoopProfiler, LoopWatchdog, ProfilerBusy, idle_seconds, top_functions
+
+
+def busy_work(seconds: float):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+
+@pytest.mark.asyncio
+async def test_watchdog_logs_what_blocks_the_loop(caplog):
+    lags = []
+    watchdog = LoopWatchdog(threshold=0.05, interval=0.01, on_lag=lags.append)
+    await watchdog.start()
+    try:
+        await asyncio.sleep(0.05)
+        with caplog.at_level(logging.WARNING, logger="src.profiling"):
+            time.sleep(0.2)
+            await asyncio.sleep(0.05)
+    finally:
+        await watchdog.stop()
+
+    assert not watchdog.running
+    assert watchdog.stalls == 1
+    assert max(lags) >= 0.1
+    messages = [record.getMessage() for record in caplog.records]
+    assert any("blocked for over" in message and "time.sleep(0.2)" in message for message in messages)
+    assert any(message.startswith("Event loop was blocked for") for message in messages)
+
+
+@pytest.mark.asyncio
+async def test_profile_shows_loop_work_apart_from_idle_time():
+    profiler = LoopProfiler(max_seconds=0.3)
+
+    async def work():
+        await asyncio.sleep(0.05)
+        busy_work(0.05)
+
+    task = asyncio.ensure_future(work())
+    stats = await profiler.capture(10)
+    await task
+
+    assert not profiler.running
+    assert idle_seconds(stats) > 0
+    labels = [label for label, _, _, _ in top_functions(stats)]
+    assert any(label.startswith("busy_work (test_profiling.py:") for label in labels)
+    assert not any("of 'select." in label for label in labels)
+
+
+@pytest.mark.asyncio
+async def test_one_profile_at_a_time():
+    profiler = LoopProfiler()
+    capture = asyncio.ensure_future(profiler.capture(0.05))
+    await asyncio.sleep(0)
+    with pytest.raises(ProfilerBusy):
+        await profiler.capture(0.05)
+    await capture
@@ -0,0 +1,39 @@
+import random
+
+from src.replies import ReplyMatcher, ReplyTemplate, parse_triggers
+
+
+def test_parse_triggers():
+    assert parse_triggers(" Price,  HOW   much ,, price ") == ("price", "how much")
+
+
+def test_triggers_match_whole_words_only():
+    matcher = ReplyMatcher([ReplyTemplate("See the pinned post", ("price",))])
+    assert matcher.choose("What's the PRICE?") == "See the pinned post"
+    assert matcher.choose("priceless") is None
+    assert matcher.choose("overprice") is None
+
+
+def test_longest_trigger_wins():
+    matcher = ReplyMatcher([
+        ReplyTemplate("generic"),
+        ReplyTemplate("about price", ("price",)),
+        ReplyTemplate("about price lists", ("price list",)),
+    ])
+    assert matcher.choose("send me the price list please") == "about price lists"
+    assert matcher.choose("price?") == "about price"
+
+
+def test_falls_back_to_generic_templates():
+    matcher = ReplyMatcher([ReplyTemplate("hello"), ReplyTemplate("about price", ("price",))])
+    rng = random.Random(0)
+    assert matcher.choose("good morning", rng) == "hello"
+    assert ReplyMatcher().choose("anything") is None
+
+
+def test_templates_added_later_are_matched():
+    matcher = ReplyMatcher()
+    assert matcher.add(ReplyTemplate("shipping info", ("ship", "delivery"))) == 0
+    assert matcher.choose("when is delivery?") == "shipping info"
+    assert [length for length, _ in matcher.match("ship the delivery")] == [4, 8]
+    assert len(matcher) == 1
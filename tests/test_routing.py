@@ -0,0 +1,82 @@
+from datetime import datetime, timezone
+
+from telegram import Chat, Message, Update
+from telegram.ext import (
+    Application,
+    CallbackQueryHandler,
+    ChatMemberHandler,
+    CommandHandler,
+    ConversationHandler,
+    InlineQueryHandler,
+    MessageHandler,
+    TypeHandler,
+    filters,
+)
+
+from src.routing import (
+    MEDIA_GROUP, allowed_updates, filter_update_types, handler_update_types, update_type, update_types_for,
+)
+
+
+async def callback(update, context):
+    pass
+
+
+def message(**kwargs) -> Message:
+    return Message(1, datetime.now(timezone.utc), Chat(1, Chat.PRIVATE), **kwargs)
+
+
+def test_update_type_filters_narrow_message_kinds():
+    assert filter_update_types(filters.TEXT) == {"message", "edited_message", "channel_post", "edited_channel_post"}
+    assert filter_update_types(filters.UpdateType.MESSAGE & filters.TEXT) == {"message"}
+    assert filter_update_types(filters.UpdateType.MESSAGE | filters.UpdateType.CHANNEL_POST) == {
+        "message", "channel_post",
+    }
+    assert filter_update_types(~filters.UpdateType.EDITED) == {"message", "channel_post"}
+
+
+def test_handler_update_types():
+    assert handler_update_types(CallbackQueryHandler(callback)) == {"callback_query"}
+    assert handler_update_types(
+        CommandHandler("start", callback, filters=filters.UpdateType.MESSAGE)
+    ) == {"message"}
+    assert handler_update_types(ChatMemberHandler(callback, ChatMemberHandler.MY_CHAT_MEMBER)) == {"my_chat_member"}
+    assert handler_update_types(ChatMemberHandler(callback, ChatMemberHandler.ANY_CHAT_MEMBER)) == {
+        "my_chat_member", "chat_member",
+    }
+    conversation = ConversationHandler(
+        entry_points=[CommandHandler("go", callback, filters=filters.UpdateType.MESSAGE)],
+        states={0: [MessageHandler(filters.UpdateType.EDITED_MESSAGE, callback)]},
+        fallbacks=[],
+    )
+    assert handler_update_types(conversation) == {"message", "edited_message"}
+    assert handler_update_types(InlineQueryHandler(callback)) == {"inline_query"}
+    assert handler_update_types(TypeHandler(Update, callback)) == set(Update.ALL_TYPES)
+
+
+def test_allowed_updates_ignore_bookkeeping_groups():
+    application = Application.builder().token("123:abc").build()
+    application.add_handler(CommandHandler("start", callback, filters=filters.UpdateType.MESSAGE))
+    application.add_handler(CallbackQueryHandler(callback), group=1)
+    application.add_handler(TypeHandler(Update, callback), group=-100)
+    assert allowed_updates(application) == ["callback_query", "message"]
+
+
+def test_update_types_for_handlers():
+    handlers = [
+        MessageHandler(filters.UpdateType.MESSAGE & filters.TEXT, callback),
+        CallbackQueryHandler(callback),
+    ]
+    assert update_types_for(handlers) == ["callback_query", "message"]
+    assert update_types_for([]) == []
+
+
+def test_update_type():
+    assert update_type(Update(1, message=message(text="hi"))) == "message"
+    assert update_type(Update(2, edited_message=message(text="hi"))) == "edited_message"
+    assert update_type(Update(3)) is None
+
+
+def test_media_group_matches_album_messages():
+    assert MEDIA_GROUP.check_update(Update(1, message=message(media_group_id="album")))
+    assert not MEDIA_GROUP.check_update(Update(1, message=message(text="hi")))
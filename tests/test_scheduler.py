@@ -0,0 +1,139 @@
+import asyncio
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from src.scheduler import CronTrigger, DateTrigger, IntervalTrigger, Scheduler, parse_timezone
+
+
+def at(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+def test_interval_first_fire_is_one_interval_after_start():
+    trigger = IntervalTrigger(timedelta(hours=1), start=at(2025, 1, 1, 12))
+    assert trigger.next_fire(at(2025, 1, 1, 11)) == at(2025, 1, 1, 13)
+
+
+def test_interval_skips_missed_runs():
+    trigger = IntervalTrigger(timedelta(hours=1), start=at(2025, 1, 1, 12))
+    assert trigger.next_fire(at(2025, 1, 1, 14, 30)) == at(2025, 1, 1, 15)
+    assert trigger.next_fire(at(2025, 1, 1, 15)) == at(2025, 1, 1, 16)
+
+
+def test_interval_fire_times_survive_a_restart():
+    # Anchored at the epoch, not at whenever the trigger was made
+    first, restarted = IntervalTrigger(timedelta(hours=6)), IntervalTrigger(timedelta(hours=6))
+    assert first.next_fire(at(2025, 1, 1, 13, 5)) == restarted.next_fire(at(2025, 1, 1, 13, 5)) == at(2025, 1, 1, 18)
+
+
+def test_interval_must_be_positive():
+    with pytest.raises(ValueError):
+        IntervalTrigger(timedelta(0))
+
+
+def test_cron_next_weekday():
+    trigger = CronTrigger("30 9 * * 1-5")
+    # Friday 10:00 -> Monday 09:30
+    assert trigger.next_fire(at(2025, 1, 3, 10)) == at(2025, 1, 6, 9, 30)
+    assert trigger.next_fire(at(2025, 1, 6, 9, 29)) == at(2025, 1, 6, 9, 30)
+
+
+def test_cron_fires_strictly_after():
+    trigger = CronTrigger("*/15 * * * *")
+    assert trigger.next_fire(at(2025, 1, 1, 12, 15)) == at(2025, 1, 1, 12, 30)
+    assert trigger.next_fire(at(2025, 1, 1, 23, 50)) == at(2025, 1, 2, 0, 0)
+
+
+def test_cron_restricted_day_fields_match_either():
+    # The 13th of the month or any Friday
+    trigger = CronTrigger("0 0 13 * 5")
+    assert trigger.next_fire(at(2025, 6, 1)) == at(2025, 6, 6)
+    assert trigger.next_fire(at(2025, 6, 10)) == at(2025, 6, 13)
+
+
+def test_cron_stepped_star_day_fields_are_unrestricted():
+    # Odd days of the month that are Mondays, as in Vixie cron
+    trigger = CronTrigger("0 0 */2 * 1")
+    assert trigger.next_fire(at(2025, 6, 1)) == at(2025, 6, 9)
+    # Every second weekday (Sun, Tue, Thu, Sat), on the 10th only
+    trigger = CronTrigger("0 0 10 * */2")
+    assert trigger.next_fire(at(2025, 6, 1)) == at(2025, 6, 10)
+    assert trigger.next_fire(at(2025, 6, 10)) == at(2025, 7, 10)
+    assert CronTrigger("0 0 */1 * 5").next_fire(at(2025, 6, 1)) == at(2025, 6, 6)
+
+
+def test_cron_sunday_is_0_or_7():
+    assert CronTrigger("0 12 * * 7").weekdays == CronTrigger("0 12 * * 0").weekdays == [0]
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* * * * 8", "*/0 * * * *", "5-1 * * * *"])
+def test_cron_rejects_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronTrigger(expression)
+
+
+def test_parse_timezone():
+    assert parse_timezone("") is parse_timezone("utc") is timezone.utc
+    assert str(parse_timezone("Europe/Berlin")) == "Europe/Berlin"
+
+
+async def noop():
+    pass
+
+
+def test_heap_keeps_earliest_job_first():
+    scheduler = Scheduler()
+    now = datetime.now(timezone.utc)
+    late = scheduler.add_job(noop, DateTrigger(now + timedelta(hours=2)))
+    early = scheduler.add_job(noop, DateTrigger(now + timedelta(hours=1)))
+    assert len(scheduler) == 2
+    assert scheduler.next_run_time() == early.next_run
+
+    scheduler.cancel(early)
+    assert early.cancelled
+    assert scheduler.get_jobs() == [late]
+    assert scheduler.next_run_time() == late.next_run
+
+    scheduler.cancel(late)
+    scheduler.cancel(late)
+    assert len(scheduler) == 0
+    assert scheduler.next_run_time() is None
+
+
+def test_past_date_is_not_scheduled():
+    scheduler = Scheduler()
+    scheduler.add_job(noop, DateTrigger(datetime.now(timezone.utc) - timedelta(minutes=1)))
+    assert len(scheduler) == 0
+
+
+def test_full_scheduler_rejects_jobs():
+    scheduler = Scheduler(max_jobs=1)
+    scheduler.add_job(noop, IntervalTrigger(timedelta(hours=1)))
+    with pytest.raises(OverflowError):
+        scheduler.add_job(noop, IntervalTrigger(timedelta(hours=1)))
+
+
+@pytest.mark.asyncio
+async def test_runs_due_jobs_and_skips_cancelled_ones():
+    scheduler = Scheduler()
+    fired = []
+    done = asyncio.Event()
+
+    async def record(name):
+        fired.append(name)
+        done.set()
+
+    soon = datetime.now(timezone.utc) + timedelta(milliseconds=50)
+    cancelled = scheduler.add_job(lambda: record("cancelled"), DateTrigger(soon))
+    scheduler.add_job(lambda: record("kept"), DateTrigger(soon + timedelta(milliseconds=20)))
+    scheduler.cancel(cancelled)
+
+    await scheduler.start()
+    try:
+        await asyncio.wait_for(done.wait(), timeout=2)
+    finally:
+        await scheduler.stop()
+    assert fired == ["kept"]
+    # One-shot jobs are forgotten after they fire
+    assert len(scheduler) == 0
@@ -0,0 +1,83 @@
+import asyncio
+
+import pytest
+
+from src.posts import PostStore
+from src.search import PostIndex, tokenize
+
+
+def make_index() -> PostIndex:
+    return PostIndex.from_posts([
+        (1, "Launch day promo: 20% off everything", False),
+        (2, "Promotional prices end Friday", True),
+        (3, "New launch video is live", False),
+        (4, "launch launch launch", False),
+    ])
+
+
+def ids(result):
+    total, page = result
+    return total, [post_id for post_id, _ in page]
+
+
+def test_tokenize_casefolds_words():
+    assert tokenize("Launch DAY, 20% off!") == ["launch", "day", "20", "off"]
+
+
+def test_every_query_word_must_match():
+    index = make_index()
+    assert ids(index.search("launch promo")) == (1, [1])
+    assert ids(index.search("launch missing")) == (0, [])
+    assert ids(index.search("")) == (0, [])
+
+
+def test_prefixes_match_below_exact_words():
+    index = make_index()
+    total, page = index.search("promo")
+    assert total == 2
+    assert [post_id for post_id, _ in page] == [1, 2]
+    # Single letters only match whole words
+    assert ids(index.search("l")) == (0, [])
+
+
+def test_ranking_and_paging():
+    index = make_index()
+    assert ids(index.search("launch")) == (3, [4, 3, 1])
+    assert ids(index.search("launch", offset=1, limit=1)) == (3, [3])
+    assert ids(index.search("launch", offset=5)) == (3, [])
+
+
+def test_posted_filter():
+    index = make_index()
+    assert ids(index.search("promo", posted=True)) == (1, [2])
+    assert ids(index.search("promo", posted=False)) == (1, [1])
+    index.set_posted(1)
+    assert ids(index.search("promo", posted=False)) == (0, [])
+
+
+def test_removed_posts_are_not_found():
+    index = make_index()
+    index.remove(2, "Promotional prices end Friday")
+    assert ids(index.search("promo")) == (1, [1])
+    assert ids(index.search("friday")) == (0, [])
+    assert len(index) == 3
+
+
+def test_post_store_keeps_the_index_current():
+    store = PostStore()
+    post = store.add("Summer sale starts")
+    assert store.search("sale", 0, 10)[0] == 1
+    store.edit(post, "Winter sale starts")
+    assert store.search("summer", 0, 10)[0] == 0
+    store.remove(post.id)
+    assert store.search("winter", 0, 10) == (0, [])
+
+
+@pytest.mark.asyncio
+async def test_changes_during_a_background_build_are_kept():
+    store = PostStore()
+    store.add("Summer sale starts")
+    build = asyncio.ensure_future(store.build_index())
+    store.add("Autumn sale starts")
+    await build
+    assert store.search("sale", 0, 10)[0] == 2
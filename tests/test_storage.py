@@ -0,0 +1,195 @@
+import sqlite3
+from datetime import date
+
+import pytest
+import pytest_asyncio
+
+from src.fanout import DeliveryState, TargetDelivery
+from src.posts import MediaItem, ScheduledPost
+from src.replies import ReplyTemplate
+from src.storage import Repository, to_async_url
+
+CREATED_AT = 1735732800.0
+
+
+def post(post_id: int, content: str = "hello", **fields) -> ScheduledPost:
+    return ScheduledPost(post_id, content, CREATED_AT, **fields)
+
+
+@pytest.fixture
+def database_url(tmp_path):
+    return f"sqlite:///{tmp_path / 'bot.db'}"
+
+
+@pytest_asyncio.fixture
+async def repository(database_url):
+    # A long interval keeps the background flusher out of the way; tests flush explicitly
+    repository = Repository(database_url, bot_id=1, flush_interval=60)
+    await repository.open()
+    try:
+        yield repository
+    finally:
+        await repository.close()
+
+
+def test_async_urls():
+    assert to_async_url("sqlite:///bot.db") == "sqlite+aiosqlite:///bot.db"
+    assert to_async_url("postgres://u@h/db") == "postgresql+asyncpg://u@h/db"
+    assert to_async_url("postgresql+asyncpg://u@h/db") == "postgresql+asyncpg://u@h/db"
+
+
+@pytest.mark.asyncio
+async def test_writes_to_one_row_are_coalesced(repository):
+    repository.save_post(post(1, "first"))
+    repository.save_post(post(1, "second"))
+    repository.save_post(post(2))
+    assert len(repository._pending) == 2
+
+    await repository.flush()
+    assert not repository._pending
+    assert [row.content for row in await repository.load_posts()] == ["second", "hello"]
+
+    repository.save_post(post(1, "third", scheduled_for=CREATED_AT + 60, posted_at=CREATED_AT + 90))
+    await repository.flush()
+    assert (await repository.load_posts())[0] == post(
+        1, "third", scheduled_for=CREATED_AT + 60, posted_at=CREATED_AT + 90
+    )
+
+
+@pytest.mark.asyncio
+async def test_close_flushes_queued_writes(database_url):
+    repository = Repository(database_url, bot_id=1, flush_interval=60)
+    await repository.open()
+    repository.save_post(post(1))
+    repository.save_setting("config", {"reply_probability": 0.5})
+    await repository.close()
+
+    reopened = Repository(database_url, bot_id=1)
+    await reopened.open()
+    try:
+        assert [row.id for row in await reopened.load_posts()] == [1]
+        assert await reopened.load_settings() == {"config": {"reply_probability": 0.5}}
+    finally:
+        await reopened.close()
+
+
+@pytest.mark.asyncio
+async def test_bots_do_not_see_each_other(database_url, repository):
+    repository.save_post(post(1))
+    await repository.flush()
+    other = Repository(database_url, bot_id=2)
+    await other.open()
+    try:
+        assert await other.load_posts() == []
+    finally:
+        await other.close()
+
+
+@pytest.mark.asyncio
+async def test_deleted_posts_are_gone(repository):
+    repository.save_post(post(1))
+    repository.save_post(post(2))
+    await repository.flush()
+    repository.delete_post(1)
+    await repository.flush()
+    assert [row.id for row in await repository.load_posts()] == [2]
+
+
+@pytest.mark.asyncio
+async def test_deletes_and_saves_apply_in_queued_order(repository):
+    repository.save_delivery(5, TargetDelivery(-100, DeliveryState.SENT, 7))
+    await repository.flush()
+
+    # A save queued after a delete survives it...
+    repository.delete_deliveries(5)
+    repository.save_delivery(5, TargetDelivery(-200, DeliveryState.PENDING))
+    await repository.flush()
+    assert [d.chat_id for d in (await repository.load_deliveries([5]))[5]] == [-200]
+
+    # ...and one queued before it does not
+    repository.save_delivery(5, TargetDelivery(-300, DeliveryState.PENDING))
+    repository.delete_deliveries(5)
+    await repository.flush()
+    assert await repository.load_deliveries([5]) == {}
+
+
+@pytest.mark.asyncio
+async def test_away_messages_are_kept_per_day(repository):
+    repository.mark_away_message(10, date(2025, 1, 1))
+    repository.mark_away_message(11, date(2025, 1, 2))
+    await repository.flush()
+    assert list(await repository.load_away_messages(date(2025, 1, 2))) == [11]
+
+
+@pytest.mark.asyncio
+async def test_reply_templates_keep_their_triggers(repository):
+    repository.save_reply_template(0, ReplyTemplate("Hello!"))
+    repository.save_reply_template(1, ReplyTemplate("See the pinned post", ("price", "how much")))
+    await repository.flush()
+    assert await repository.load_reply_templates() == [
+        ReplyTemplate("Hello!"),
+        ReplyTemplate("See the pinned post", ("price", "how much")),
+    ]
+
+
+@pytest.mark.asyncio
+async def test_media_posts_and_cached_uploads(repository):
+    album = (MediaItem("photo", path="/media/a.jpg"), MediaItem("video", file_id="abc"))
+    repository.save_post(post(1, media=album))
+    repository.save_media_file("photo:sha256:a", "file-a")
+    repository.save_media_file("photo:sha256:b", "file-b")
+    repository.save_media_file("photo:sha256:c", "file-c")
+    await repository.flush()
+    repository.save_media_file("photo:sha256:a", "file-a")
+    repository.delete_media_file("photo:sha256:b")
+    await repository.flush()
+
+    assert (await repository.load_posts())[0].media == album
+    assert await repository.load_media_files() == [("photo:sha256:c", "file-c"), ("photo:sha256:a", "file-a")]
+
+
+@pytest.mark.asyncio
+async def test_new_nullable_columns_are_added_to_old_tables(tmp_path):
+    path = tmp_path / "old.db"
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE reply_templates (bot_id BIGINT, position INTEGER, content TEXT, "
+                     "PRIMARY KEY (bot_id, position))")
+        conn.execute("INSERT INTO reply_templates VALUES (1, 0, 'Old reply')")
+
+    repository = Repository(f"sqlite:///{path}", bot_id=1)
+    await repository.open()
+    try:
+        assert await repository.load_reply_templates() == [ReplyTemplate("Old reply")]
+    finally:
+        await repository.close()
+
+
+@pytest.mark.asyncio
+async def test_rejected_rows_are_dropped_and_the_rest_written(repository, caplog):
+    repository.save_post(post(1, None))
+    repository.save_post(post(2))
+    repository.save_setting("config", {"reply_probability": 0.5})
+    await repository.flush()
+
+    assert repository._pending == {}
+    assert [row.id for row in await repository.load_posts()] == [2]
+    assert await repository.load_settings() == {"config": {"reply_probability": 0.5}}
+    assert "Dropping posts row (1,)" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_failed_batch_is_kept_for_a_retry(repository, monkeypatch):
+    async def unavailable(conn, batch):
+        raise ConnectionError("database is down")
+
+    repository.save_post(post(1))
+    with monkeypatch.context() as patch:
+        patch.setattr(repository, "_write", unavailable)
+        with pytest.raises(ConnectionError):
+            await repository.flush()
+    assert len(repository._pending) == 1
+
+    # A newer write of the same row replaces the one put back
+    repository.save_post(post(1, "newer"))
+    await repository.flush()
+    assert [row.content for row in await repository.load_posts()] == ["newer"]
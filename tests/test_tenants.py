@@ -0,0 +1,114 @@
+import json
+
+import pytest
+
+from src import tenants
+from src.config import Config
+from src.tenants import TenantRunner, load_tenants, tenant_id
+from src.utils.http_client import SharedRequest, build_request
+
+
+def test_load_tenants(tmp_path):
+    path = tmp_path / "tenants.json"
+    path.write_text(json.dumps([{"BOT_TOKEN": "1:a", "USER_ID": 5}]), encoding="utf-8")
+    assert load_tenants(str(path)) == [{"BOT_TOKEN": "1:a", "USER_ID": 5}]
+
+    path.write_text(json.dumps({"BOT_TOKEN": "1:a"}), encoding="utf-8")
+    with pytest.raises(ValueError):
+        load_tenants(str(path))
+
+
+def test_tenant_id_comes_from_the_token():
+    assert tenant_id({"BOT_TOKEN": "123456:secret"}) == 123456
+    with pytest.raises(ValueError):
+        tenant_id({"USER_ID": 5})
+
+
+def test_tenant_settings_override_the_environment(monkeypatch):
+    monkeypatch.setenv("BOT_TOKEN", "1:env")
+    monkeypatch.setenv("REPLY_PROBABILITY", "0.3")
+    config = Config({"BOT_TOKEN": "2:tenant", "USER_ID": 7, "AUTO_POST_ENABLED": True, "ADMIN_IDS": [8, 9]})
+    assert (config.BOT_TOKEN, config.USER_ID) == ("2:tenant", 7)
+    assert config.AUTO_POST_ENABLED is True
+    assert config.ADMIN_IDS == [8, 9]
+    # Anything a tenant leaves out comes from the environment
+    assert config.REPLY_PROBABILITY == 0.3
+
+
+@pytest.mark.asyncio
+async def test_shared_pool_closes_with_its_last_user(monkeypatch):
+    monkeypatch.setenv("HTTP_POOL_SIZE", "4")
+    request = build_request(Config(), pool_size=10, request_class=SharedRequest)
+    assert request._client_kwargs["limits"].max_connections == 10
+
+    await request.initialize()
+    await request.initialize()
+    await request.shutdown()
+    assert not request._client.is_closed
+    await request.shutdown()
+    assert request._client.is_closed
+
+
+class FakeTenant:
+    """Stands in for TelegramAutoBot; tokens starting with "9:" fail to start"""
+
+    def __init__(self, token, user_id, config, shared):
+        self.config = config
+        self.shared = shared
+        self.running = False
+
+    async def start_tenant(self):
+        if self.config.BOT_TOKEN.startswith("9:"):
+            raise RuntimeError("Unauthorized")
+        self.running = True
+
+    async def stop_tenant(self):
+        self.running = False
+
+
+@pytest.fixture
+def runner(tmp_path, monkeypatch):
+    monkeypatch.setattr(tenants, "TelegramAutoBot", FakeTenant)
+    path = tmp_path / "tenants.json"
+    runner = TenantRunner(Config({"TENANTS_FILE": str(path), "WEBHOOK_URL": "https://bots.example/hook"}))
+    runner.write = lambda settings: path.write_text(json.dumps(settings), encoding="utf-8")
+    return runner
+
+
+@pytest.mark.asyncio
+async def test_reload_applies_only_the_difference(runner):
+    runner.write([{"BOT_TOKEN": "1:a", "USER_ID": 5}, {"BOT_TOKEN": "2:b", "USER_ID": 6}])
+    await runner.reload()
+    first, second = runner.tenants[1], runner.tenants[2]
+    assert first.running and second.running
+
+    runner.write([{"BOT_TOKEN": "1:a", "USER_ID": 5}, {"BOT_TOKEN": "3:c", "USER_ID": 7}])
+    await runner.reload()
+    assert sorted(runner.tenants) == [1, 3]
+    # Unchanged tenants keep running untouched
+    assert runner.tenants[1] is first and first.running
+    assert not second.running
+
+
+@pytest.mark.asyncio
+async def test_tenants_are_kept_apart(runner, caplog):
+    runner.write([{"BOT_TOKEN": "1:a", "USER_ID": 5}, {"BOT_TOKEN": "9:bad", "USER_ID": 6},
+                  {"BOT_TOKEN": "2:b", "USER_ID": 7, "REPLY_PROBABILITY": 0.9}])
+    await runner.reload()
+    # One tenant failing to start does not keep the others from running
+    assert sorted(runner.tenants) == [1, 2]
+    assert "Tenant 9 failed to start: Unauthorized" in caplog.text
+
+    first, second = runner.tenants[1].config, runner.tenants[2].config
+    assert (first.USER_ID, second.USER_ID) == (5, 7)
+    assert second.REPLY_PROBABILITY == 0.9 != first.REPLY_PROBABILITY
+    assert first.WEBHOOK_URL == "https://bots.example/hook/1"
+    assert second.WEBHOOK_URL == "https://bots.example/hook/2"
+
+
+def test_multi_tenant_config_needs_no_bot_of_its_own(monkeypatch):
+    monkeypatch.delenv("BOT_TOKEN", raising=False)
+    monkeypatch.delenv("USER_ID", raising=False)
+    config = Config({"TENANTS_FILE": "tenants.json"})
+    assert not config.validate()[0]
+    assert config.validate(multi_tenant=True) == (True, [])
@@ -0,0 +1,162 @@
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+from telegram import Chat, Message, Update, User
+
+from src.updates import Importance, InboundLimiter, PerChatUpdateProcessor
+
+
+def message_update(update_id: int, chat_id: int, user_id: int = 10, text: str = "hi") -> Update:
+    chat = Chat(chat_id, Chat.PRIVATE if chat_id > 0 else Chat.GROUP)
+    user = User(user_id, "user", False)
+    return Update(update_id, message=Message(update_id, datetime.now(timezone.utc), chat, from_user=user, text=text))
+
+
+def classify(update: Update) -> Importance:
+    if update.effective_user.id == 1:
+        return Importance.ESSENTIAL
+    return Importance.OPTIONAL if update.message.text == "chatter" else Importance.NORMAL
+
+
+async def noop():
+    pass
+
+
+@pytest.mark.asyncio
+async def test_one_chat_runs_in_order():
+    processor = PerChatUpdateProcessor(8)
+    order = []
+
+    async def handle(update_id, delay):
+        await asyncio.sleep(delay)
+        order.append(update_id)
+
+    await asyncio.gather(*(
+        processor.process_update(message_update(i, 1), handle(i, delay))
+        for i, delay in enumerate([0.03, 0.01, 0.0])
+    ))
+    assert order == [0, 1, 2]
+    assert processor._locks == {}
+
+
+@pytest.mark.asyncio
+async def test_chats_run_concurrently():
+    processor = PerChatUpdateProcessor(8)
+    release = asyncio.Event()
+    done = []
+
+    async def blocked():
+        await release.wait()
+        done.append("blocked")
+
+    async def other():
+        done.append("other")
+        release.set()
+
+    await asyncio.wait_for(asyncio.gather(
+        processor.process_update(message_update(1, 1), blocked()),
+        processor.process_update(message_update(2, 2), other()),
+    ), timeout=2)
+    assert done == ["other", "blocked"]
+
+
+@pytest.mark.asyncio
+async def test_a_busy_chat_does_not_hold_the_slots_of_others():
+    processor = PerChatUpdateProcessor(4)
+    release = asyncio.Event()
+    done = []
+
+    async def handle(chat, update_id):
+        if chat == "a":
+            await release.wait()
+        done.append((chat, update_id))
+
+    # Chat A has more queued updates than there are slots, the first of them stuck
+    busy = [asyncio.create_task(processor.process_update(message_update(i, 1), handle("a", i))) for i in range(10)]
+    await asyncio.sleep(0)
+    await asyncio.wait_for(asyncio.gather(*(
+        processor.process_update(message_update(i, 2), handle("b", i)) for i in range(10, 20)
+    )), timeout=2)
+    assert done == [("b", i) for i in range(10, 20)]
+
+    release.set()
+    await asyncio.gather(*busy)
+    assert done[10:] == [("a", i) for i in range(10)]
+
+
+def test_limiter_allows_a_burst_per_key():
+    limiter = InboundLimiter(rate=0.001, burst=2)
+    assert [limiter.allow("a") for _ in range(3)] == [True, True, False]
+    assert limiter.allow("b")
+    assert all(InboundLimiter(rate=0, burst=0).allow("a") for _ in range(10))
+
+
+def test_limiter_table_is_bounded():
+    limiter = InboundLimiter(rate=1000, burst=1, max_keys=10)
+    for key in range(100):
+        limiter.allow(key)
+    assert len(limiter) <= 10
+
+
+@pytest.mark.asyncio
+async def test_rate_limited_updates_are_dropped():
+    shed = []
+    processor = PerChatUpdateProcessor(8, user_limiter=InboundLimiter(0.001, 2), classify=classify, on_shed=shed.append)
+    handled = []
+
+    async def handle(update_id):
+        handled.append(update_id)
+
+    for update_id in range(4):
+        await processor.process_update(message_update(update_id, -5), handle(update_id))
+    # Admins are never limited
+    for update_id in range(4, 7):
+        await processor.process_update(message_update(update_id, -5, user_id=1), handle(update_id))
+    assert handled == [0, 1, 4, 5, 6]
+    assert shed == ["user_rate", "user_rate"]
+    assert (processor.dropped, processor.shed) == (2, {"user_rate": 2})
+
+
+@pytest.mark.asyncio
+async def test_backlog_sheds_optional_work_then_recovers():
+    processor = PerChatUpdateProcessor(8, max_pending=4, high_watermark=2, low_watermark=0, classify=classify)
+    release = asyncio.Event()
+    handled = []
+
+    async def handle(update_id):
+        await release.wait()
+        handled.append(update_id)
+
+    tasks = [asyncio.create_task(processor.process_update(message_update(i, i + 100), handle(i))) for i in range(2)]
+    await asyncio.sleep(0)
+    assert processor.shedding
+
+    # Optional work is shed first, everything else up to max_pending
+    await processor.process_update(message_update(2, 102, text="chatter"), handle(2))
+    tasks += [asyncio.create_task(processor.process_update(message_update(i, i + 100), handle(i))) for i in (3, 4)]
+    await asyncio.sleep(0)
+    await processor.process_update(message_update(5, 105), handle(5))
+    assert processor.shed == {"reply_guy": 1, "overload": 1}
+
+    # An admin command goes through at once, past the backlog
+    await asyncio.wait_for(processor.process_update(message_update(6, 106, user_id=1), noop()), timeout=1)
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert sorted(handled) == [0, 1, 3, 4]
+    assert (processor.pending, processor.shedding) == (0, False)
+
+
+@pytest.mark.asyncio
+async def test_start_and_finish_are_reported_for_dropped_updates_too():
+    events = []
+    processor = PerChatUpdateProcessor(
+        8, user_limiter=InboundLimiter(0.001, 1),
+        on_start=lambda update: events.append(("start", update.update_id)),
+        on_finish=lambda update: events.append(("finish", update.update_id)),
+    )
+    for update_id in (1, 2):
+        await processor.process_update(message_update(update_id, 5), noop())
+    assert events == [("start", 1), ("finish", 1), ("start", 2), ("finish", 2)]
+    assert processor.dropped == 1
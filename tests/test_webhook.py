@@ -0,0 +1,107 @@
+import asyncio
+import json
+
+import pytest
+import pytest_asyncio
+from aiohttp.test_utils import TestClient, TestServer
+from telegram import Bot
+
+from src.webhook import SECRET_HEADER, WebhookServer, webhook_path
+
+SECRET = "s3cret"
+
+
+class FakeApplication:
+    def __init__(self):
+        self.bot = Bot("123:abc")
+        self.update_queue = asyncio.Queue()
+
+
+def update(update_id: int) -> dict:
+    return {
+        "update_id": update_id,
+        "message": {
+            "message_id": 1, "date": 0, "text": "hi",
+            "chat": {"id": 5, "type": "private"}, "from": {"id": 5, "is_bot": False, "first_name": "A"},
+        },
+    }
+
+
+@pytest_asyncio.fixture
+async def webhook():
+    server = WebhookServer()
+    application = FakeApplication()
+    server.add_route("/hook/", SECRET, application)
+    client = TestClient(TestServer(server.app))
+    await client.start_server()
+    try:
+        yield client, application
+    finally:
+        await client.close()
+
+
+def post(client, body, secret=SECRET, path="/hook"):
+    if not isinstance(body, (str, bytes)):
+        body = json.dumps(body)
+    return client.post(path, data=body, headers={SECRET_HEADER: secret})
+
+
+@pytest.mark.asyncio
+async def test_updates_are_queued(webhook):
+    client, application = webhook
+    response = await post(client, update(1))
+    assert response.status == 200
+    assert (await application.update_queue.get()).update_id == 1
+
+
+@pytest.mark.asyncio
+async def test_batches_are_accepted(webhook):
+    client, application = webhook
+    response = await post(client, [update(1), update(2)])
+    assert response.status == 200
+    assert application.update_queue.qsize() == 2
+
+
+@pytest.mark.asyncio
+async def test_malformed_updates_are_dropped(webhook):
+    client, application = webhook
+    broken = {"update_id": 2, "message": {"message_id": "x"}}
+    response = await post(client, [update(1), broken, update(3)])
+    assert response.status == 200
+    assert [(await application.update_queue.get()).update_id for _ in range(2)] == [1, 3]
+    assert application.update_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_wrong_secret_is_rejected(webhook):
+    client, application = webhook
+    assert (await post(client, update(1), secret="nope")).status == 403
+    assert (await client.post("/hook", data=json.dumps(update(1)))).status == 403
+    assert application.update_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_unknown_path(webhook):
+    client, _ = webhook
+    assert (await post(client, update(1), path="/other")).status == 404
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("body", ["{not json", "42", '"text"'])
+async def test_malformed_bodies(webhook, body):
+    client, application = webhook
+    assert (await post(client, body)).status == 400
+    assert application.update_queue.empty()
+
+
+@pytest.mark.asyncio
+async def test_healthcheck(webhook):
+    client, _ = webhook
+    response = await client.get("/healthz")
+    assert response.status == 200
+    assert await response.text() == "ok"
+
+
+def test_webhook_path():
+    assert webhook_path("https://example.com/telegram/abc") == "/telegram/abc"
+    assert webhook_path("https://example.com") == "/"